@@ -3,15 +3,41 @@
 
 from __future__ import annotations
 
+import argparse
 import csv
 import json
 import re
+import sys
+import time
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import ROUND_HALF_EVEN, Decimal
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 BASE_DIR = Path(__file__).resolve().parent
 OUTPUT_DIR = BASE_DIR / "cleaned"
+ANALYSIS_DIR = BASE_DIR.parents[1] / "src" / "analysis"
+
+sys.path.insert(0, str(ANALYSIS_DIR))
+from branch_identity import (  # noqa: E402
+    ALIAS_FILENAME,
+    NON_BRANCH_ROW_TYPES,
+    BranchResolver,
+    save_resolver,
+    source_signatures,
+)
+from lineage import SourceRow, iter_csv_positions, lineage_path, write_lineage  # noqa: E402
+from report_io import (  # noqa: E402
+    MEMBER_SEPARATOR,
+    detect_compression,
+    input_exists,
+    partition_slug,
+    split_member,
+    write_partitioned,
+    write_records,
+    zip_csv_members,
+)
 
 RAW_FILES = {
     "rep_00014": BASE_DIR / "rep_s_00014_SMRY.csv",
@@ -20,6 +46,13 @@ RAW_FILES = {
     "rep_00673": BASE_DIR / "rep_s_00673_SMRY.csv",
 }
 
+# Batch mode recognises exports by report id, e.g. "REP_S_00134_SMRY (3).csv" or "rep_s_00014.csv.gz".
+REPORT_ID_RE = re.compile(r"^rep_s_(\d{5})(?!\d).*\.csv(?:\.(?:gz|xz|bz2|zip))?$", re.IGNORECASE)
+# Private record key holding the raw rows a cleaned record came from; never written as a column.
+LINEAGE_FIELD = "_source_rows"
+
+REPORT_IDS = {"00014": "rep_00014", "00134": "rep_00134", "00191": "rep_00191", "00673": "rep_00673"}
+
 DATE_RE = re.compile(r"^\d{1,2}-[A-Za-z]{3}-\d{2,4}$")
 SPACE_RE = re.compile(r"\s+")
 
@@ -126,17 +159,25 @@ def parse_profit_metrics(row: List[str]) -> Dict[str, Optional[float]]:
     }
 
 
-def read_rows(path: Path) -> List[List[str]]:
-    with path.open("r", encoding="utf-8-sig", newline="") as handle:
-        reader = csv.reader(handle)
-        return [[clean_cell(cell) for cell in row] for row in reader]
+def read_rows(path: Path) -> List[SourceRow]:
+    rows: List[SourceRow] = []
+    for row in iter_csv_positions(path):
+        row[:] = [clean_cell(cell) for cell in row]
+        rows.append(row)
+    return rows
+
+
+def track_source_rows(rows: List[SourceRow], records: List[Dict[str, object]]) -> Iterator[SourceRow]:
+    """Iterate raw rows, stamping the records appended while handling each one with that row."""
+    for raw_row in rows:
+        start = len(records)
+        yield raw_row
+        for record in records[start:]:
+            record[LINEAGE_FIELD] = (raw_row,)
 
 
 def write_csv(path: Path, rows: List[Dict[str, object]], fieldnames: List[str]) -> None:
-    with path.open("w", encoding="utf-8", newline="") as handle:
-        writer = csv.DictWriter(handle, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
+    write_records(path, rows, fieldnames)
 
 
 def parse_rep_00014(rows: List[List[str]]) -> List[Dict[str, object]]:
@@ -146,7 +187,7 @@ def parse_rep_00014(rows: List[List[str]]) -> List[Dict[str, object]]:
     category: Optional[str] = None
     division: Optional[str] = None
 
-    for raw_row in rows:
+    for raw_row in track_source_rows(rows, records):
         row = pad_row(raw_row, 10)
         c0 = row[0]
         c0_lower = c0.lower()
@@ -272,7 +313,7 @@ def parse_rep_00191(rows: List[List[str]]) -> List[Dict[str, object]]:
     division: Optional[str] = None
     group: Optional[str] = None
 
-    for raw_row in rows:
+    for raw_row in track_source_rows(rows, records):
         row = pad_row(raw_row, 5)
         c0 = row[0]
         c0_lower = c0.lower()
@@ -384,7 +425,7 @@ def parse_rep_00673(rows: List[List[str]]) -> List[Dict[str, object]]:
     records: List[Dict[str, object]] = []
     branch: Optional[str] = None
 
-    for raw_row in rows:
+    for raw_row in track_source_rows(rows, records):
         row = pad_row(raw_row, 10)
         c0 = row[0]
         c0_lower = c0.lower()
@@ -443,7 +484,7 @@ def parse_rep_00134(
     current_year: Optional[int] = None
     active_metric_cols: Dict[int, str] = {}
 
-    for raw_row in rows:
+    for raw_row in track_source_rows(rows, partial_rows):
         row = [compact_spaces(cell) for cell in raw_row]
         if not has_any_text(row):
             continue
@@ -504,6 +545,8 @@ def parse_rep_00134(
         )
 
     merged_rows: Dict[Tuple[int, str, str], Dict[str, object]] = {}
+    # Raw row that supplied each merged value, for the long table's lineage.
+    value_sources: Dict[Tuple[int, str, str], Dict[str, Tuple[SourceRow, ...]]] = defaultdict(dict)
     for row in partial_rows:
         key = (row["year"], row["branch"], row["row_type"])
         if key not in merged_rows:
@@ -513,7 +556,9 @@ def parse_rep_00134(
                 "year": row["year"],
                 "branch": row["branch"],
                 **{col: None for col in SALES_KEY_ORDER},
+                LINEAGE_FIELD: (),
             }
+        merged_rows[key][LINEAGE_FIELD] += row[LINEAGE_FIELD]
 
         for col in SALES_KEY_ORDER:
             current_value = merged_rows[key][col]
@@ -522,6 +567,7 @@ def parse_rep_00134(
                 continue
             if current_value is None:
                 merged_rows[key][col] = new_value
+                value_sources[key][col] = row[LINEAGE_FIELD]
                 continue
             if abs(float(current_value) - float(new_value)) > 0.01:
                 merge_conflicts.append(
@@ -554,14 +600,30 @@ def parse_rep_00134(
                     "period_type": "year_total" if metric == "total_by_year" else "month",
                     "month_number": month_number,
                     "sales_amount": value,
+                    LINEAGE_FIELD: value_sources[(row["year"], row["branch"], row["row_type"])][metric],
                 }
             )
 
     return wide_rows, long_rows, merge_conflicts
 
 
+def to_cents(value: object) -> int:
+    """Exact integer cents of a cleaned amount, from its decimal text (no binary float product)."""
+    return int((Decimal(str(value)) * 100).to_integral_value(ROUND_HALF_EVEN))
+
+
+def exceeds_rounding(difference_cents: int, n_terms: int, total_resolution: int = 1) -> bool:
+    """True when a total is further from its parts than display rounding can explain.
+
+    Each of the n_terms parts is printed to the cent and the total to `total_resolution`
+    cents, each off by at most half its resolution, so the exact integer difference may
+    be up to (total_resolution + n_terms) / 2 cents.
+    """
+    return 2 * abs(difference_cents) > total_resolution + n_terms
+
+
 def quality_check_rep_00673(records: List[Dict[str, object]]) -> List[Dict[str, object]]:
-    detail_sums: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    detail_sums: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
     detail_counts: Dict[str, int] = defaultdict(int)
     branch_totals: Dict[str, Dict[str, object]] = {}
     fields = ["qty", "total_price", "total_cost", "total_profit"]
@@ -575,7 +637,7 @@ def quality_check_rep_00673(records: List[Dict[str, object]]) -> List[Dict[str,
             for field in fields:
                 value = row.get(field)
                 if value is not None:
-                    detail_sums[branch][field] += float(value)
+                    detail_sums[branch][field] += to_cents(value)
         elif row["row_type"] == "branch_total":
             branch_totals[branch] = row
 
@@ -588,15 +650,17 @@ def quality_check_rep_00673(records: List[Dict[str, object]]) -> List[Dict[str,
             summed_value = detail_sums[branch].get(field)
             if total_value is None:
                 continue
-            difference = float(total_value) - float(summed_value)
-            if abs(difference) > 1.0:
+            difference = to_cents(total_value) - summed_value
+            # Branch qty totals are printed to one decimal.
+            resolution = 10 if field == "qty" else 1
+            if exceeds_rounding(difference, detail_counts[branch], resolution):
                 mismatches.append(
                     {
                         "branch": branch,
                         "metric": field,
                         "branch_total": total_value,
-                        "category_sum": round(summed_value, 2),
-                        "difference": round(difference, 2),
+                        "category_sum": summed_value / 100,
+                        "difference": difference / 100,
                     }
                 )
 
@@ -613,31 +677,41 @@ def quality_check_rep_00134(records: List[Dict[str, object]]) -> List[Dict[str,
         total_by_year = row.get("total_by_year")
         if total_by_year is None:
             continue
-        month_sum = 0.0
-        has_any_month = False
+        month_sum = 0
+        month_count = 0
         for month in month_keys:
             value = row.get(month)
             if value is None:
                 continue
-            has_any_month = True
-            month_sum += float(value)
-        if not has_any_month:
+            month_count += 1
+            month_sum += to_cents(value)
+        if not month_count:
             continue
-        difference = float(total_by_year) - month_sum
-        if abs(difference) > 1.0:
+        difference = to_cents(total_by_year) - month_sum
+        if exceeds_rounding(difference, month_count):
             mismatches.append(
                 {
                     "year": row["year"],
                     "branch": row["branch"],
                     "total_by_year": total_by_year,
-                    "sum_of_months": round(month_sum, 2),
-                    "difference": round(difference, 2),
+                    "sum_of_months": month_sum / 100,
+                    "difference": difference / 100,
                 }
             )
 
     return mismatches
 
 
+def build_branch_resolver(*record_sets: List[Dict[str, object]]) -> BranchResolver:
+    names: List[str] = []
+    for records in record_sets:
+        for row in records:
+            branch = row.get("branch")
+            if branch and row.get("row_type") not in NON_BRANCH_ROW_TYPES:
+                names.append(str(branch))
+    return BranchResolver.build(names)
+
+
 def count_by_row_type(rows: List[Dict[str, object]]) -> Dict[str, int]:
     counts: Dict[str, int] = defaultdict(int)
     for row in rows:
@@ -645,28 +719,68 @@ def count_by_row_type(rows: List[Dict[str, object]]) -> Dict[str, int]:
     return dict(sorted(counts.items()))
 
 
-def ensure_files_exist() -> None:
-    missing = [str(path) for path in RAW_FILES.values() if not path.exists()]
+def ensure_files_exist(raw_files: Dict[str, Path]) -> None:
+    missing = [str(path) for path in raw_files.values() if not input_exists(path)]
     if missing:
         raise FileNotFoundError(f"Missing input files: {', '.join(missing)}")
 
 
-def main() -> None:
-    ensure_files_exist()
-    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+def export_name(path: Path) -> str:
+    """File name of an export, or of the zip member it names."""
+    member = split_member(path)[1]
+    return Path(member).name if member else path.name
+
 
-    rows_00014 = read_rows(RAW_FILES["rep_00014"])
-    rows_00134 = read_rows(RAW_FILES["rep_00134"])
-    rows_00191 = read_rows(RAW_FILES["rep_00191"])
-    rows_00673 = read_rows(RAW_FILES["rep_00673"])
+def stamp_source_file(records: List[Dict[str, object]], filename: str) -> None:
+    for row in records:
+        row["source_file"] = filename
+
+
+def clean_export_set(
+    raw_files: Dict[str, Path],
+    output_dir: Path,
+    partition_dir: Optional[Path] = None,
+    partition_by: Sequence[str] = ("branch",),
+) -> Tuple[Dict[str, object], Dict[str, int]]:
+    """Clean one set of the four exports into `output_dir`; returns the cleaning report and partition counts."""
+    ensure_files_exist(raw_files)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    partitioned: Dict[str, int] = {}
+
+    def write_output(filename: str, source: Path, records: List[Dict[str, object]], fieldnames: List[str]) -> None:
+        write_csv(output_dir / filename, records, fieldnames)
+        write_lineage(
+            lineage_path(output_dir / filename),
+            [source],
+            [[(0, row.ordinal, row.line, row.offset) for row in record[LINEAGE_FIELD]] for record in records],
+        )
+        if partition_dir is None:
+            return
+        fields = [name for name in partition_by if name in fieldnames]
+        if fields and records:
+            dataset = filename.rsplit(".", 1)[0]
+            manifest = write_partitioned(partition_dir / dataset, records, fields, fieldnames)
+            partitioned[dataset] = len(manifest["partitions"])
+
+    rows_00014 = read_rows(raw_files["rep_00014"])
+    rows_00134 = read_rows(raw_files["rep_00134"])
+    rows_00191 = read_rows(raw_files["rep_00191"])
+    rows_00673 = read_rows(raw_files["rep_00673"])
 
     clean_00014 = parse_rep_00014(rows_00014)
     clean_00191 = parse_rep_00191(rows_00191)
     clean_00673 = parse_rep_00673(rows_00673)
     clean_00134_wide, clean_00134_long, merge_conflicts_00134 = parse_rep_00134(rows_00134)
-
-    write_csv(
-        OUTPUT_DIR / "rep_00014_theoretical_profit_by_item_clean.csv",
+    # The parsers stamp the canonical export names; batch exports may be named differently.
+    stamp_source_file(clean_00014, export_name(raw_files["rep_00014"]))
+    stamp_source_file(clean_00191, export_name(raw_files["rep_00191"]))
+    stamp_source_file(clean_00673, export_name(raw_files["rep_00673"]))
+    stamp_source_file(clean_00134_wide, export_name(raw_files["rep_00134"]))
+    stamp_source_file(clean_00134_long, export_name(raw_files["rep_00134"]))
+
+    write_output(
+        "rep_00014_theoretical_profit_by_item_clean.csv",
+        raw_files["rep_00014"],
         clean_00014,
         [
             "source_file",
@@ -685,8 +799,9 @@ def main() -> None:
         ],
     )
 
-    write_csv(
-        OUTPUT_DIR / "rep_00191_sales_by_items_by_group_clean.csv",
+    write_output(
+        "rep_00191_sales_by_items_by_group_clean.csv",
+        raw_files["rep_00191"],
         clean_00191,
         [
             "source_file",
@@ -701,8 +816,9 @@ def main() -> None:
         ],
     )
 
-    write_csv(
-        OUTPUT_DIR / "rep_00673_theoretical_profit_by_category_clean.csv",
+    write_output(
+        "rep_00673_theoretical_profit_by_category_clean.csv",
+        raw_files["rep_00673"],
         clean_00673,
         [
             "source_file",
@@ -718,14 +834,16 @@ def main() -> None:
         ],
     )
 
-    write_csv(
-        OUTPUT_DIR / "rep_00134_comparative_monthly_sales_clean_wide.csv",
+    write_output(
+        "rep_00134_comparative_monthly_sales_clean_wide.csv",
+        raw_files["rep_00134"],
         clean_00134_wide,
         ["source_file", "row_type", "year", "branch", *SALES_KEY_ORDER],
     )
 
-    write_csv(
-        OUTPUT_DIR / "rep_00134_comparative_monthly_sales_clean_long.csv",
+    write_output(
+        "rep_00134_comparative_monthly_sales_clean_long.csv",
+        raw_files["rep_00134"],
         clean_00134_long,
         [
             "source_file",
@@ -739,14 +857,21 @@ def main() -> None:
         ],
     )
 
+    # Same priority order as branch_identity.SOURCE_FILES so display names agree.
+    resolver = build_branch_resolver(clean_00134_wide, clean_00673, clean_00014, clean_00191)
+    alias_path = output_dir / ALIAS_FILENAME
+    save_resolver(resolver, alias_path, source_signatures(output_dir))
+    branch_aliases = {key: aliases for key, aliases in resolver.groups().items() if len(aliases) > 1}
+
     report = {
-        "input_files": {name: str(path) for name, path in RAW_FILES.items()},
+        "input_files": {name: str(path) for name, path in raw_files.items()},
         "output_files": {
-            "rep_00014": str(OUTPUT_DIR / "rep_00014_theoretical_profit_by_item_clean.csv"),
-            "rep_00191": str(OUTPUT_DIR / "rep_00191_sales_by_items_by_group_clean.csv"),
-            "rep_00673": str(OUTPUT_DIR / "rep_00673_theoretical_profit_by_category_clean.csv"),
-            "rep_00134_wide": str(OUTPUT_DIR / "rep_00134_comparative_monthly_sales_clean_wide.csv"),
-            "rep_00134_long": str(OUTPUT_DIR / "rep_00134_comparative_monthly_sales_clean_long.csv"),
+            "rep_00014": str(output_dir / "rep_00014_theoretical_profit_by_item_clean.csv"),
+            "rep_00191": str(output_dir / "rep_00191_sales_by_items_by_group_clean.csv"),
+            "rep_00673": str(output_dir / "rep_00673_theoretical_profit_by_category_clean.csv"),
+            "rep_00134_wide": str(output_dir / "rep_00134_comparative_monthly_sales_clean_wide.csv"),
+            "rep_00134_long": str(output_dir / "rep_00134_comparative_monthly_sales_clean_long.csv"),
+            "branch_aliases": str(alias_path),
         },
         "row_counts": {
             "rep_00014_raw_rows": len(rows_00014),
@@ -769,15 +894,190 @@ def main() -> None:
             "rep_00673_branch_total_mismatches": quality_check_rep_00673(clean_00673),
             "rep_00134_total_by_year_mismatches": quality_check_rep_00134(clean_00134_wide),
             "rep_00134_merge_conflicts": merge_conflicts_00134,
+            "branch_alias_merges": branch_aliases,
         },
     }
 
-    report_path = OUTPUT_DIR / "cleaning_report.json"
+    report_path = output_dir / "cleaning_report.json"
     report_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return report, partitioned
+
+
+def discover_export_sets(root: Path, exclude: Sequence[Path] = ()) -> Dict[Tuple[str, str], Dict[str, List[Path]]]:
+    """Group every export under `root` by (brand, period), taken from its directory.
+
+    Layout is `<root>/<brand>/<period...>/<export>.csv`; files directly under a brand
+    directory get period "all" and files directly under `root` brand "default".
+    Exports are recognised by report id (REP_S_00014...), whatever the rest of the name,
+    either as (optionally gzip/xz/bz2/zip-compressed) files or as CSV members of any zip.
+    """
+    excluded = [path.resolve() for path in exclude]
+    sets: Dict[Tuple[str, str], Dict[str, List[Path]]] = defaultdict(lambda: defaultdict(list))
+    for path in sorted(root.rglob("*")):
+        if not path.is_file() or any(path.resolve().is_relative_to(directory) for directory in excluded):
+            continue
+        match = REPORT_ID_RE.match(path.name)
+        if match:
+            exports = [(match.group(1), path)]
+        elif detect_compression(path) == "zip":
+            exports = [
+                (member_match.group(1), Path(f"{path}{MEMBER_SEPARATOR}{member}"))
+                for member in zip_csv_members(path)
+                for member_match in [REPORT_ID_RE.match(Path(member).name)]
+                if member_match
+            ]
+        else:
+            continue
+        parts = path.parent.relative_to(root).parts
+        brand = parts[0] if parts else "default"
+        period = "/".join(parts[1:]) or "all"
+        for report_id, export in exports:
+            if report_id in REPORT_IDS:
+                sets[(brand, period)][f"rep_{report_id}"].append(export)
+    return {key: dict(reports) for key, reports in sorted(sets.items())}
+
+
+def clean_batch(
+    key: Tuple[str, str],
+    raw_files: Dict[str, Path],
+    output_dir: Path,
+    partition_dir: Optional[Path],
+    partition_by: Sequence[str],
+) -> Dict[str, object]:
+    started = time.perf_counter()
+    report, partitioned = clean_export_set(raw_files, output_dir, partition_dir, partition_by)
+    checks = report["quality_checks"]
+    return {
+        "brand": key[0],
+        "period": key[1],
+        "status": "cleaned",
+        "output_dir": str(output_dir),
+        "seconds": round(time.perf_counter() - started, 3),
+        "row_counts": report["row_counts"],
+        "quality_issues": {name: len(value) for name, value in checks.items() if name != "branch_alias_merges"},
+        "partitions": partitioned,
+    }
+
+
+def run_batches(
+    root: Path,
+    output_root: Path,
+    workers: Optional[int],
+    partition_dir: Optional[Path],
+    partition_by: Sequence[str],
+) -> Dict[str, object]:
+    """Clean every complete export set under `root` in a bounded process pool."""
+    exclude = [output_root] + ([partition_dir] if partition_dir is not None else [])
+    results: List[Dict[str, object]] = []
+    futures = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for key, reports in discover_export_sets(root, exclude).items():
+            brand, period = key
+            missing = sorted(set(REPORT_IDS.values()) - set(reports))
+            duplicated = sorted(name for name, paths in reports.items() if len(paths) > 1)
+            if missing or duplicated:
+                results.append(
+                    {
+                        "brand": brand,
+                        "period": period,
+                        "status": "skipped",
+                        "missing_reports": missing,
+                        "duplicate_reports": {name: [str(path) for path in reports[name]] for name in duplicated},
+                    }
+                )
+                continue
+            slug = Path(partition_slug(brand), *(partition_slug(part) for part in period.split("/")))
+            raw_files = {name: paths[0] for name, paths in reports.items()}
+            future = pool.submit(
+                clean_batch,
+                key,
+                raw_files,
+                output_root / slug,
+                partition_dir / slug if partition_dir is not None else None,
+                partition_by,
+            )
+            futures[future] = key
+
+        for future in as_completed(futures):
+            brand, period = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as exc:  # one malformed export set must not sink the batch
+                results.append({"brand": brand, "period": period, "status": "failed", "error": f"{type(exc).__name__}: {exc}"})
+
+    results.sort(key=lambda item: (str(item["brand"]), str(item["period"])))
+    summary = {
+        "input_root": str(root),
+        "output_root": str(output_root),
+        "sets": results,
+        "status_counts": {
+            status: sum(1 for item in results if item["status"] == status) for status in ("cleaned", "skipped", "failed")
+        },
+    }
+    output_root.mkdir(parents=True, exist_ok=True)
+    (output_root / "batch_report.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    return summary
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Clean the raw Stories report exports.")
+    parser.add_argument(
+        "--partition-dir",
+        type=Path,
+        default=None,
+        help="Also write each cleaned dataset as one CSV per partition plus a manifest, under <dir>/<dataset>/.",
+    )
+    parser.add_argument(
+        "--partition-by",
+        default="branch",
+        help="Comma-separated partition columns (e.g. branch,year); columns a dataset lacks are skipped.",
+    )
+    parser.add_argument(
+        "--batch-dir",
+        type=Path,
+        default=None,
+        help="Clean every <brand>/<period>/ export set found under this directory instead of the bundled exports.",
+    )
+    parser.add_argument(
+        "--batch-output",
+        type=Path,
+        default=None,
+        help="Where batch results go, as <dir>/<brand>/<period>/ (default: <batch-dir>/cleaned).",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Maximum export sets cleaned at once in batch mode.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    partition_by = [name.strip() for name in args.partition_by.split(",") if name.strip()]
+
+    if args.batch_dir is not None:
+        output_root = args.batch_output or args.batch_dir / "cleaned"
+        started = time.perf_counter()
+        summary = run_batches(args.batch_dir, output_root, args.workers, args.partition_dir, partition_by)
+        counts = summary["status_counts"]
+        print(f"Batch cleaning completed in {time.perf_counter() - started:.2f}s.")
+        print(f"Export sets: {counts['cleaned']} cleaned, {counts['skipped']} skipped, {counts['failed']} failed")
+        print(f"Output folder: {output_root}")
+        print(f"Report: {output_root / 'batch_report.json'}")
+        for item in summary["sets"]:
+            if item["status"] != "cleaned":
+                reason = item.get("error") or ", ".join(
+                    [f"missing {name}" for name in item.get("missing_reports", [])]
+                    + [f"duplicate {name}" for name in item.get("duplicate_reports", {})]
+                )
+                print(f"  - {item['brand']} / {item['period']}: {item['status']} ({reason})")
+        return
+
+    _, partitioned = clean_export_set(RAW_FILES, OUTPUT_DIR, args.partition_dir, partition_by)
+    report_path = OUTPUT_DIR / "cleaning_report.json"
 
     print("Cleaning completed.")
     print(f"Output folder: {OUTPUT_DIR}")
     print(f"Report: {report_path}")
+    for dataset, count in partitioned.items():
+        print(f"Partitions: {args.partition_dir / dataset} ({count} files)")
 
 
 if __name__ == "__main__":
@@ -360,10 +360,10 @@ router.post('/simulate', (req, res) => {
     confidence,
     maxImpact:        Math.round(maxImpact),
     breakdown: [
-      { lever: 'Margin Gap Closure',    model: `Random Forest R²=${_meta.model_r2}`,       pool: Math.round(pools.margin_residual),       pct: marginGapClose,      conversion: 0.45, impact: Math.round(marginImpact)  },
-      { lever: 'Branch Mix Shift',      model: 'KMeans (4 clusters)',                       pool: Math.round(pools.branch_mix),            pct: branchMixShift,      conversion: 0.30, impact: Math.round(mixImpact)     },
-      { lever: 'Price Standardization', model: 'Cross-branch price anomaly (p75 target)',   pool: Math.round(pools.price_standardization), pct: priceStandardize,    conversion: 0.60, impact: Math.round(priceImpact)   },
-      { lever: 'Availability Rollout',  model: 'Branch-revenue weighted regression',        pool: Math.round(pools.availability_gap),      pct: availabilityRollout, conversion: 0.50, impact: Math.round(availImpact)   },
+      { lever: 'Margin Gap Closure',    model: `${_meta.model_name || 'Random Forest'} R²=${_meta.model_r2}`, pool: Math.round(pools.margin_residual),       pct: marginGapClose,      conversion: 0.45, impact: Math.round(marginImpact)  },
+      { lever: 'Branch Mix Shift',      model: `KMeans (${_meta.n_clusters} clusters, silhouette)`, pool: Math.round(pools.branch_mix),            pct: branchMixShift,      conversion: 0.30, impact: Math.round(mixImpact)     },
+      { lever: 'Price Standardization', model: 'Robust z-score vs peer median price',       pool: Math.round(pools.price_standardization), pct: priceStandardize,    conversion: 0.60, impact: Math.round(priceImpact)   },
+      { lever: 'Availability Rollout',  model: 'Peer median qty share x profit per unit',   pool: Math.round(pools.availability_gap),      pct: availabilityRollout, conversion: 0.50, impact: Math.round(availImpact)   },
     ],
     topActions: { marginItems: topMarginItems, priceItems: topPriceItems, availItems: topAvailItems },
     modelStats: { r2: _meta.model_r2, r2_std: _meta.model_r2_std, n_samples: _meta.n_samples, n_branches: _meta.n_branches, n_products: _meta.n_products },
@@ -162,7 +162,7 @@ export default function Actions({ branch }) {
 
       {/* Price Anomalies */}
       {tab === 'price' && (
-        <Panel title="Price Anomalies" subtitle="Branches pricing below the network average — raise to capture missed profit">
+        <Panel title="Price Anomalies" subtitle="Branches pricing well below the peer median — raise to capture missed profit">
           {l3 ? <Loader /> : e3 ? <ErrorMsg message={e3} /> : (
             <div className="ml-table-wrap">
               <table className="ml-table">
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""Cluster branches on category/division profit mix, margin and growth (vectorized k-means)."""
+
+from __future__ import annotations
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from branch_kpi import build_branch_kpis, rank_rows
+from menu_engineering import aggregate_items
+from report_io import round_or_none, write_records
+
+
+def default_workers() -> int:
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+def init_centers(features: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """k-means++ seeding."""
+    n = features.shape[0]
+    centers = np.empty((k, features.shape[1]))
+    centers[0] = features[rng.integers(n)]
+    closest = ((features - centers[0]) ** 2).sum(axis=1)
+    for c in range(1, k):
+        total = closest.sum()
+        probs = closest / total if total > 0 else np.full(n, 1.0 / n)
+        centers[c] = features[rng.choice(n, p=probs)]
+        closest = np.minimum(closest, ((features - centers[c]) ** 2).sum(axis=1))
+    return centers
+
+
+def lloyd(features: np.ndarray, centers: np.ndarray, iterations: int) -> Tuple[np.ndarray, np.ndarray, float]:
+    k = centers.shape[0]
+    labels = np.full(features.shape[0], -1)
+    for _ in range(iterations):
+        distances = ((features[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        new_labels = distances.argmin(axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, features)
+        nonempty = counts > 0
+        centers[nonempty] = sums[nonempty] / counts[nonempty, None]
+    inertia = float(((features - centers[labels]) ** 2).sum())
+    return labels, centers, inertia
+
+
+def run_restarts(features: np.ndarray, k: int, seeds: Sequence[int], iterations: int) -> Tuple[float, np.ndarray, np.ndarray]:
+    """Best (inertia, labels, centers) over a batch of seeded restarts; runs inside a worker."""
+    best: Tuple[float, np.ndarray, np.ndarray] = (np.inf, np.zeros(features.shape[0], dtype=np.int64), np.empty(0))
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        labels, centers, inertia = lloyd(features, init_centers(features, k, rng), iterations)
+        if inertia < best[0]:
+            best = (inertia, labels, centers)
+    return best
+
+
+def fit_kmeans(
+    features: np.ndarray,
+    k: int,
+    restarts: int = 16,
+    iterations: int = 100,
+    seed: int = 42,
+    workers: int = 1,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> Tuple[np.ndarray, float]:
+    """Labels and inertia of the best of `restarts` k-means runs.
+
+    Restarts are split into one batch per worker; with `workers <= 1` and no pool they
+    run in-process, which is faster than spawning processes for a few dozen branches.
+    """
+    k = max(1, min(k, features.shape[0]))
+    seeds = [seed + i for i in range(restarts)]
+    n_batches = max(1, min(workers, restarts))
+    batches = [seeds[i::n_batches] for i in range(n_batches)]
+    if pool is None and n_batches == 1:
+        results = [run_restarts(features, k, batches[0], iterations)]
+    elif pool is not None:
+        results = list(pool.map(run_restarts, [features] * n_batches, [k] * n_batches, batches, [iterations] * n_batches))
+    else:
+        with ProcessPoolExecutor(max_workers=n_batches) as own_pool:
+            results = list(
+                own_pool.map(run_restarts, [features] * n_batches, [k] * n_batches, batches, [iterations] * n_batches)
+            )
+    inertia, labels, _ = min(results, key=lambda item: item[0])
+    return relabel_by_first_appearance(labels), inertia
+
+
+def relabel_by_first_appearance(labels: np.ndarray) -> np.ndarray:
+    """Stable cluster ids: cluster 0 holds the first row, cluster 1 the next new one, ..."""
+    _, first_seen = np.unique(labels, return_index=True)
+    mapping = np.empty(labels.max() + 1, dtype=np.int64)
+    mapping[labels[np.sort(first_seen)]] = np.arange(len(first_seen))
+    return mapping[labels]
+
+
+def silhouette_samples(features: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    n = features.shape[0]
+    k = int(labels.max()) + 1
+    squared = (features ** 2).sum(axis=1)
+    distances = np.sqrt(np.maximum(squared[:, None] + squared[None, :] - 2 * features @ features.T, 0.0))
+    one_hot = np.zeros((n, k))
+    one_hot[np.arange(n), labels] = 1.0
+    counts = one_hot.sum(axis=0)
+    totals = distances @ one_hot
+
+    own_count = counts[labels]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a = totals[np.arange(n), labels] / (own_count - 1)
+        mean_other = totals / counts
+    mean_other[np.arange(n), labels] = np.inf
+    mean_other[:, counts == 0] = np.inf
+    b = mean_other.min(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = (b - a) / np.maximum(a, b)
+    # Singleton clusters score 0 by convention.
+    scores[own_count <= 1] = 0.0
+    return np.nan_to_num(scores)
+
+
+def cluster_silhouettes(samples: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """Mean silhouette per cluster id."""
+    return np.bincount(labels, weights=samples) / np.maximum(np.bincount(labels), 1)
+
+
+def choose_k(
+    features: np.ndarray,
+    k_values: Sequence[int],
+    restarts: int = 16,
+    seed: int = 42,
+    workers: int = 1,
+    min_cluster_size: int = 2,
+) -> Tuple[int, np.ndarray, Dict[int, float]]:
+    """Fit each k and keep the one with the highest mean silhouette.
+
+    A k whose fit leaves a cluster smaller than `min_cluster_size`, or a cluster whose
+    members sit closer to another cluster on average (negative mean silhouette), is scored
+    but not chosen: neither is a peer group. When an outlier branch is isolated at every k,
+    the size rule is dropped before the silhouette one, then both.
+    """
+    scores: Dict[int, float] = {}
+    fits: Dict[int, np.ndarray] = {}
+    eligible: List[int] = []
+    coherent: List[int] = []
+    valid_k = [k for k in k_values if 2 <= k < features.shape[0]]
+    if not valid_k:
+        return 1, np.zeros(features.shape[0], dtype=np.int64), scores
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for k in valid_k:
+            labels, _ = fit_kmeans(features, k, restarts=restarts, seed=seed, workers=workers, pool=pool)
+            fits[k] = labels
+            samples = silhouette_samples(features, labels)
+            scores[k] = float(samples.mean())
+            if cluster_silhouettes(samples, labels).min() >= 0:
+                coherent.append(k)
+                if np.bincount(labels).min() >= min_cluster_size:
+                    eligible.append(k)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    best_k = max(eligible or coherent or valid_k, key=lambda k: (scores[k], -k))
+    return best_k, fits[best_k], scores
+
+
+def standardize(features: np.ndarray) -> np.ndarray:
+    features = np.where(np.isnan(features), np.nanmean(features, axis=0), features)
+    features = np.nan_to_num(features)
+    std = features.std(axis=0)
+    return (features - features.mean(axis=0)) / np.where(std > 0, std, 1.0)
+
+
+def build_branch_features(
+    cleaned_dir: Path, min_division_share: float = 1.0
+) -> Tuple[List[Dict[str, object]], List[str], np.ndarray]:
+    """KPI rows, feature names and the raw (unscaled) feature matrix, one row per KPI row.
+
+    Divisions averaging under `min_division_share` percent of branch profit are folded
+    into one column so a rare item sold by a single branch cannot dominate the scaling.
+    """
+    kpi_rows = build_branch_kpis(cleaned_dir)
+    _, branch_aggregate = aggregate_items(cleaned_dir)
+
+    divisions = sorted({str(values["division"]) for values in branch_aggregate.values()})
+    division_ids = {name: i for i, name in enumerate(divisions)}
+    branch_ids = {str(row["branch"]): i for i, row in enumerate(kpi_rows)}
+    division_profit = np.zeros((len(kpi_rows), len(divisions)))
+    for values in branch_aggregate.values():
+        b = branch_ids.get(str(values["branch"]))
+        if b is not None:
+            division_profit[b, division_ids[str(values["division"])]] += float(values["total_profit"])
+    totals = division_profit.sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        division_share = np.nan_to_num(division_profit / totals) * 100
+    major = division_share.mean(axis=0) >= min_division_share
+    division_share = np.hstack([division_share[:, major], division_share[:, ~major].sum(axis=1, keepdims=True)])
+    divisions = [name for name, keep in zip(divisions, major.tolist()) if keep] + ["(minor divisions)"]
+
+    kpi_columns = ["beverages_profit_share_pct", "food_profit_share_pct", "other_profit_share_pct", "profit_margin_pct_2025", "growth_signal_pct"]
+    kpi_matrix = np.array(
+        [[np.nan if row.get(col) is None else float(row[col]) for col in kpi_columns] for row in kpi_rows],
+        dtype=float,
+    ).reshape(len(kpi_rows), len(kpi_columns))
+    names = kpi_columns + [f"division_share:{name}" for name in divisions]
+    return kpi_rows, names, np.hstack([kpi_matrix, division_share])
+
+
+def cluster_branches(
+    cleaned_dir: Path,
+    k: int = 0,
+    k_max: int = 8,
+    restarts: int = 16,
+    workers: int = 1,
+) -> Tuple[List[Dict[str, object]], List[Dict[str, object]], Dict[int, float]]:
+    kpi_rows, names, raw = build_branch_features(cleaned_dir)
+    # Every branch is fitted; standardize() imputes a missing growth signal (pop-ups,
+    # new openings) with the mean so those branches cluster on mix and margin alone.
+    features = standardize(raw)
+    if k > 0:
+        labels, _ = fit_kmeans(features, k, restarts=restarts, workers=workers)
+        scores = {int(labels.max()) + 1: float(silhouette_samples(features, labels).mean())} if labels.max() > 0 else {}
+    else:
+        _, labels, scores = choose_k(features, range(2, k_max + 1), restarts=restarts, workers=workers)
+    silhouettes = silhouette_samples(features, labels) if labels.max() > 0 else np.zeros(len(labels))
+
+    rows: List[Dict[str, object]] = []
+    for row, label, score in zip(kpi_rows, labels.tolist(), silhouettes.tolist()):
+        rows.append(
+            {
+                "branch": row["branch"],
+                "cluster": label,
+                "silhouette": round_or_none(score, 4),
+                "total_profit_2025": row.get("total_profit_2025"),
+                "profit_margin_pct_2025": row.get("profit_margin_pct_2025"),
+                "growth_signal_pct": row.get("growth_signal_pct"),
+                "beverages_profit_share_pct": row.get("beverages_profit_share_pct"),
+                "food_profit_share_pct": row.get("food_profit_share_pct"),
+            }
+        )
+    rank_rows(
+        rows,
+        [
+            ("total_profit_2025", "rank_profit_in_cluster", True),
+            ("profit_margin_pct_2025", "rank_margin_in_cluster", True),
+            ("growth_signal_pct", "rank_growth_in_cluster", True),
+        ],
+        group_by="cluster",
+    )
+    rows.sort(key=lambda row: (row["cluster"], row["rank_profit_in_cluster"] or 9999))
+
+    division_names = [name.split(":", 1)[1] for name in names if name.startswith("division_share:")]
+    division_raw = raw[:, len(names) - len(division_names):]
+    overall_mix = division_raw.mean(axis=0)
+    summary: List[Dict[str, object]] = []
+    for cluster in range(int(labels.max()) + 1):
+        members = labels == cluster
+        margins = [float(r["profit_margin_pct_2025"]) for r, m in zip(kpi_rows, members) if m and r.get("profit_margin_pct_2025") is not None]
+        profits = [float(r["total_profit_2025"]) for r, m in zip(kpi_rows, members) if m and r.get("total_profit_2025") is not None]
+        lift = division_raw[members].mean(axis=0) - overall_mix
+        drivers = [division_names[d] for d in np.argsort(-lift)[:3].tolist() if lift[d] > 0]
+        summary.append(
+            {
+                "cluster": cluster,
+                "n_branches": int(members.sum()),
+                "avg_margin_pct": round_or_none(sum(margins) / len(margins)) if margins else None,
+                "avg_profit": round_or_none(sum(profits) / len(profits)) if profits else None,
+                "avg_silhouette": round_or_none(float(silhouettes[members].mean()), 4),
+                "over_indexed_divisions": "|".join(drivers),
+            }
+        )
+    return rows, summary, scores
+
+
+def parse_args() -> argparse.Namespace:
+    repo_root = Path(__file__).resolve().parents[2]
+    default_cleaned = repo_root / "Archive" / "Stories_data" / "cleaned"
+    reports = repo_root / "reports"
+
+    parser = argparse.ArgumentParser(description="Cluster branches on profit mix, margin and growth.")
+    parser.add_argument("--cleaned-dir", type=Path, default=default_cleaned, help="Path to cleaned data directory.")
+    parser.add_argument("--output", type=Path, default=reports / "branch_clusters.csv", help="Branch cluster CSV path.")
+    parser.add_argument("--summary-output", type=Path, default=reports / "branch_cluster_summary.csv", help="Cluster summary CSV path.")
+    parser.add_argument("--k", type=int, default=0, help="Number of clusters (0 picks k by silhouette).")
+    parser.add_argument("--k-max", type=int, default=8, help="Largest k tried when picking by silhouette.")
+    parser.add_argument("--restarts", type=int, default=16, help="k-means restarts per k.")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="Process pool size for restarts.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    rows, summary, scores = cluster_branches(
+        args.cleaned_dir, k=args.k, k_max=args.k_max, restarts=args.restarts, workers=args.workers
+    )
+    write_records(args.output, rows)
+    write_records(args.summary_output, summary)
+
+    print(f"Branch clusters: {args.output} ({len(rows)} rows)")
+    print(f"Cluster summary: {args.summary_output} ({len(summary)} clusters)")
+    for k, score in sorted(scores.items()):
+        print(f"  - k={k}: mean silhouette {score:.4f}")
+    for row in summary:
+        if row["avg_silhouette"] is not None and float(row["avg_silhouette"]) < 0:
+            print(
+                f"Warning: cluster {row['cluster']} ({row['n_branches']} branches) has a negative mean "
+                f"silhouette ({row['avg_silhouette']}); its members fit another cluster as well as their own."
+            )
+
+
+if __name__ == "__main__":
+    main()
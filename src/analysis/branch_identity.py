@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Resolve branch-name spellings across Stories report exports to one identity."""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from report_io import atomic_output, memoized_file_digest, open_text_input
+
+ALIAS_FILENAME = "branch_aliases.json"
+ALIAS_VERSION = 1
+
+# Cleaned files whose `branch` column feeds the alias table, in display-name priority order.
+SOURCE_FILES = [
+    "rep_00134_comparative_monthly_sales_clean_wide.csv",
+    "rep_00673_theoretical_profit_by_category_clean.csv",
+    "rep_00014_theoretical_profit_by_item_clean.csv",
+    "rep_00191_sales_by_items_by_group_clean.csv",
+]
+
+NON_BRANCH_ROW_TYPES = {"grand_total"}
+STOPWORDS = {"stories", "branch"}
+SIMILARITY_THRESHOLD = 0.88
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def clean_text(value: str) -> str:
+    return " ".join((value or "").strip().split())
+
+
+def normalize_branch_tokens(value: str) -> Tuple[str, ...]:
+    text = unicodedata.normalize("NFKD", clean_text(value)).encode("ascii", "ignore").decode("ascii").lower()
+    return tuple(token for token in TOKEN_RE.findall(text) if token not in STOPWORDS)
+
+
+def branch_signature(value: str) -> str:
+    tokens = normalize_branch_tokens(value)
+    if not tokens:
+        # Names made only of stopwords/punctuation (e.g. "Stories.") are kept verbatim.
+        return clean_text(value).lower()
+    return " ".join(sorted(tokens))
+
+
+def signature_similarity(left: str, right: str) -> float:
+    left_numbers = [token for token in left.split() if token.isdigit()]
+    right_numbers = [token for token in right.split() if token.isdigit()]
+    if left_numbers != right_numbers:
+        # "Sour" and "Sour 2" are different shops, however close the spelling.
+        return 0.0
+    return SequenceMatcher(None, left, right).ratio()
+
+
+class BranchResolver:
+    """Alias table mapping every seen branch spelling to one canonical key and display name."""
+
+    def __init__(self, aliases: Dict[str, str], display: Dict[str, str], threshold: float = SIMILARITY_THRESHOLD) -> None:
+        self.threshold = threshold
+        self._aliases: Dict[str, str] = dict(aliases)
+        self._display: Dict[str, str] = dict(display)
+        self._signatures: Dict[str, str] = {}
+        for alias, key in self._aliases.items():
+            self._signatures.setdefault(branch_signature(alias), key)
+
+    @classmethod
+    def build(cls, names: Iterable[str], threshold: float = SIMILARITY_THRESHOLD) -> "BranchResolver":
+        resolver = cls({}, {}, threshold=threshold)
+        for name in names:
+            resolver.resolve(name)
+        return resolver
+
+    def _match_signature(self, signature: str) -> Optional[str]:
+        key = self._signatures.get(signature)
+        if key is not None:
+            return key
+        best_key = None
+        best_score = self.threshold
+        for known_signature, known_key in self._signatures.items():
+            score = signature_similarity(signature, known_signature)
+            if score >= best_score:
+                best_key, best_score = known_key, score
+        return best_key
+
+    def resolve(self, name: str) -> str:
+        """Return the canonical key for `name`; unseen spellings are matched once, then memoized."""
+        key = self._aliases.get(name)
+        if key is not None:
+            return key
+        text = clean_text(name)
+        if not text:
+            return ""
+        key = self._aliases.get(text)
+        if key is None:
+            signature = branch_signature(text)
+            key = self._match_signature(signature)
+            if key is None:
+                key = text.lower()
+                self._display[key] = text
+            self._signatures.setdefault(signature, key)
+            self._aliases[text] = key
+        self._aliases[name] = key
+        return key
+
+    def display_name(self, key: str) -> str:
+        return self._display.get(key, key)
+
+    def canonical_name(self, name: str) -> str:
+        return self.display_name(self.resolve(name))
+
+    def groups(self) -> Dict[str, List[str]]:
+        grouped: Dict[str, List[str]] = {key: [] for key in self._display}
+        for alias, key in self._aliases.items():
+            if alias == clean_text(alias) and alias not in grouped[key]:
+                grouped[key].append(alias)
+        return grouped
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "version": ALIAS_VERSION,
+            "threshold": self.threshold,
+            "branches": [
+                {"key": key, "display": self._display[key], "aliases": sorted(aliases)}
+                for key, aliases in sorted(self.groups().items())
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, object]) -> "BranchResolver":
+        aliases: Dict[str, str] = {}
+        display: Dict[str, str] = {}
+        for entry in payload.get("branches", []):
+            key = str(entry["key"])
+            display[key] = str(entry["display"])
+            for alias in entry.get("aliases", []):
+                aliases[str(alias)] = key
+        return cls(aliases, display, threshold=float(payload.get("threshold", SIMILARITY_THRESHOLD)))
+
+
+def source_signatures(cleaned_dir: Path) -> Dict[str, str]:
+    # Content hashes rather than mtimes so a fresh checkout still matches the committed table;
+    # each stage resolves branches several times, so the hashes are memoized on mtime and size.
+    return {
+        filename: memoized_file_digest(cleaned_dir / filename)
+        for filename in SOURCE_FILES
+        if (cleaned_dir / filename).exists()
+    }
+
+
+def iter_source_branch_names(cleaned_dir: Path) -> Iterable[str]:
+    for filename in SOURCE_FILES:
+        path = cleaned_dir / filename
+        if not path.exists():
+            continue
+        with open_text_input(path) as handle:
+            for row in csv.DictReader(handle):
+                if clean_text(row.get("row_type", "")) in NON_BRANCH_ROW_TYPES:
+                    continue
+                branch = clean_text(row.get("branch", ""))
+                if branch:
+                    yield branch
+
+
+def save_resolver(resolver: BranchResolver, path: Path, sources: Optional[Dict[str, str]] = None) -> None:
+    payload = resolver.to_dict()
+    payload["sources"] = sources or {}
+    with atomic_output(path) as tmp_path:
+        tmp_path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+
+
+def load_or_build_resolver(cleaned_dir: Path, alias_path: Optional[Path] = None) -> BranchResolver:
+    """Load the persisted alias table, rebuilding it when the cleaned sources changed."""
+    alias_path = alias_path or cleaned_dir / ALIAS_FILENAME
+    sources = source_signatures(cleaned_dir)
+    if alias_path.exists():
+        try:
+            payload = json.loads(alias_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            payload = {}
+        if payload.get("version") == ALIAS_VERSION and payload.get("sources") == sources:
+            return BranchResolver.from_dict(payload)
+
+    resolver = BranchResolver.build(iter_source_branch_names(cleaned_dir))
+    try:
+        save_resolver(resolver, alias_path, sources)
+    except OSError:
+        pass
+    return resolver
+
+
+def parse_args() -> argparse.Namespace:
+    repo_root = Path(__file__).resolve().parents[2]
+    default_cleaned = repo_root / "Archive" / "Stories_data" / "cleaned"
+
+    parser = argparse.ArgumentParser(description="Build the branch alias table from cleaned datasets.")
+    parser.add_argument("--cleaned-dir", type=Path, default=default_cleaned, help="Path to cleaned data directory.")
+    parser.add_argument("--output", type=Path, default=None, help="Alias table path (defaults to cleaned dir).")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    output = args.output or args.cleaned_dir / ALIAS_FILENAME
+    resolver = BranchResolver.build(iter_source_branch_names(args.cleaned_dir))
+    save_resolver(resolver, output, source_signatures(args.cleaned_dir))
+
+    groups = resolver.groups()
+    print(f"Branch alias table: {output} ({len(groups)} branches)")
+    for key, aliases in sorted(groups.items()):
+        if len(aliases) > 1:
+            print(f"  - {resolver.display_name(key)}: {', '.join(sorted(aliases))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,18 +4,28 @@
 from __future__ import annotations
 
 import argparse
-import csv
 from collections import defaultdict
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Set, Tuple
+from typing import Dict, List, Optional, Sequence, Set, Tuple
 
+import numpy as np
 
-def clean_text(value: str) -> str:
-    return " ".join((value or "").strip().split())
+from branch_identity import ALIAS_FILENAME, load_or_build_resolver
+from monthly_trends import SOURCE_FILENAME as TRENDS_FILENAME
+from monthly_trends import INSUFFICIENT_HISTORY, MonthlyTrends, build_monthly_trends
+from report_io import round_or_none, scan_rows, watch_directory, write_records
+from result_cache import ResultCache, cached, open_cache
+
+SOURCE_FILENAMES = (
+    "rep_00014_theoretical_profit_by_item_clean.csv",
+    "rep_00134_comparative_monthly_sales_clean_wide.csv",
+    "rep_00191_sales_by_items_by_group_clean.csv",
+    "rep_00673_theoretical_profit_by_category_clean.csv",
+)
 
 
-def canonical_branch(value: str) -> str:
-    return clean_text(value).lower()
+def clean_text(value: str) -> str:
+    return " ".join((value or "").strip().split())
 
 
 def to_float(value: str) -> Optional[float]:
@@ -28,12 +38,6 @@ def to_float(value: str) -> Optional[float]:
         return None
 
 
-def round_or_none(value: Optional[float], ndigits: int = 2) -> Optional[float]:
-    if value is None:
-        return None
-    return round(value, ndigits)
-
-
 def safe_div(numerator: Optional[float], denominator: Optional[float]) -> Optional[float]:
     if numerator is None or denominator in (None, 0):
         return None
@@ -52,22 +56,112 @@ def recommendation_tag(growth_pct: Optional[float], margin_pct: Optional[float])
     return "balanced_optimize"
 
 
-def read_rows(path: Path) -> Iterable[Dict[str, str]]:
-    with path.open("r", encoding="utf-8", newline="") as handle:
-        yield from csv.DictReader(handle)
+# (metric column, rank column, higher-is-better)
+RankSpec = Tuple[str, str, bool]
+
+RANK_SPECS: List[RankSpec] = [
+    ("total_profit_2025", "rank_total_profit_2025", True),
+    ("profit_margin_pct_2025", "rank_profit_margin_2025", True),
+    ("jan_yoy_growth_pct", "rank_jan_yoy_growth", True),
+]
+
+RANK_METHODS = ("min", "dense", "ordinal", "percentile")
+
+
+def rank_column(
+    values: np.ndarray,
+    groups: np.ndarray,
+    descending: bool = True,
+    method: str = "min",
+) -> np.ndarray:
+    """Rank one metric within each peer group using a single lexsort.
+
+    `values` holds NaN for missing metrics; those rows get NaN ranks. Ties share the
+    lowest rank ("min"), consecutive ranks ("dense"), or a 0-100 percentile where the
+    best value is 100. "ordinal" breaks ties by row order.
+    """
+    if method not in RANK_METHODS:
+        raise ValueError(f"Unknown rank method: {method}")
+    n = values.shape[0]
+    ranks = np.full(n, np.nan)
+    if n == 0:
+        return ranks
+
+    missing = np.isnan(values)
+    sort_values = np.where(missing, 0.0, -values if descending else values)
+    order = np.lexsort((np.arange(n), sort_values, missing, groups))
+    v = sort_values[order]
+    g = groups[order]
+    valid = ~missing[order]
+
+    position = np.arange(n)
+    new_group = np.ones(n, dtype=bool)
+    new_group[1:] = g[1:] != g[:-1]
+    new_value = new_group.copy()
+    new_value[1:] |= v[1:] != v[:-1]
+    group_start = np.maximum.accumulate(np.where(new_group, position, 0))
+
+    if method == "ordinal":
+        sorted_ranks = position - group_start + 1
+    elif method == "dense":
+        run_id = np.cumsum(new_value)
+        sorted_ranks = run_id - run_id[group_start] + 1
+    else:
+        tie_start = np.maximum.accumulate(np.where(new_value, position, 0))
+        sorted_ranks = tie_start - group_start + 1
+
+    sorted_ranks = sorted_ranks.astype(float)
+    if method == "percentile":
+        # Missing values sort last within their group, so valid counts come from a bincount.
+        _, group_codes = np.unique(g, return_inverse=True)
+        valid_count = np.bincount(group_codes, weights=valid)[group_codes]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sorted_ranks = np.where(valid_count > 1, (valid_count - sorted_ranks) / (valid_count - 1) * 100, 100.0)
+
+    sorted_ranks[~valid] = np.nan
+    ranks[order] = sorted_ranks
+    return ranks
+
+
+def rank_rows(
+    rows: List[Dict[str, object]],
+    specs: Sequence[RankSpec],
+    method: str = "min",
+    group_by: Optional[str] = None,
+) -> None:
+    """Add a rank column per spec to `rows`, optionally ranking within `group_by` peers."""
+    if group_by is None:
+        groups = np.zeros(len(rows), dtype=np.int64)
+    else:
+        _, groups = np.unique(np.array([str(row.get(group_by)) for row in rows], dtype=object), return_inverse=True)
+    for metric, rank_col, descending in specs:
+        values = np.array(
+            [np.nan if row.get(metric) is None else float(row[metric]) for row in rows],
+            dtype=float,
+        )
+        ranks = rank_column(values, groups, descending=descending, method=method)
+        for row, rank in zip(rows, ranks.tolist()):
+            if rank != rank:
+                row[rank_col] = None
+            elif method == "percentile":
+                row[rank_col] = round_or_none(rank)
+            else:
+                row[rank_col] = int(rank)
 
 
-def build_branch_kpis(cleaned_dir: Path) -> List[Dict[str, object]]:
-    file_00014 = cleaned_dir / "rep_00014_theoretical_profit_by_item_clean.csv"
-    file_00134 = cleaned_dir / "rep_00134_comparative_monthly_sales_clean_wide.csv"
-    file_00191 = cleaned_dir / "rep_00191_sales_by_items_by_group_clean.csv"
-    file_00673 = cleaned_dir / "rep_00673_theoretical_profit_by_category_clean.csv"
+def build_branch_kpis(cleaned_dir: Path, trends: Optional[MonthlyTrends] = None) -> List[Dict[str, object]]:
+    file_00014, file_00134, file_00191, file_00673 = (cleaned_dir / name for name in SOURCE_FILENAMES)
 
     required = [file_00014, file_00134, file_00191, file_00673]
     missing = [str(path) for path in required if not path.exists()]
     if missing:
         raise FileNotFoundError(f"Missing cleaned files: {', '.join(missing)}")
 
+    resolver = load_or_build_resolver(cleaned_dir)
+    if trends is None:
+        trends = build_monthly_trends(cleaned_dir)
+    trend_columns = trends.kpi_columns()
+
     branch_display: Dict[str, str] = {}
 
     monthly_2025_total: Dict[str, float] = {}
@@ -87,18 +181,18 @@ def build_branch_kpis(cleaned_dir: Path) -> List[Dict[str, object]]:
     group_totals: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
     group_branch_total_amount: Dict[str, float] = {}
 
-    for row in read_rows(file_00134):
-        if clean_text(row.get("row_type", "")) != "branch":
-            continue
-        branch = clean_text(row.get("branch", ""))
+    for branch, year_text, january, total_text in scan_rows(
+        file_00134, ("branch", "year", "january", "total_by_year"), where={"row_type": ("branch",)}
+    ):
+        branch = clean_text(branch)
         if not branch:
             continue
-        key = canonical_branch(branch)
-        branch_display.setdefault(key, branch)
+        key = resolver.resolve(branch)
+        branch_display.setdefault(key, resolver.display_name(key))
 
-        year = int(float(row.get("year", "0") or 0))
-        jan_value = to_float(row.get("january", ""))
-        total_by_year = to_float(row.get("total_by_year", ""))
+        year = int(float(year_text or 0))
+        jan_value = to_float(january)
+        total_by_year = to_float(total_text)
         if year == 2025:
             if jan_value is not None:
                 jan_2025[key] = jan_value
@@ -107,61 +201,66 @@ def build_branch_kpis(cleaned_dir: Path) -> List[Dict[str, object]]:
         elif year == 2026 and jan_value is not None:
             jan_2026[key] = jan_value
 
-    for row in read_rows(file_00673):
-        row_type = clean_text(row.get("row_type", ""))
-        branch = clean_text(row.get("branch", ""))
+    # Every row type registers its branch, so 00673 and 00191 are projected but not filtered.
+    for row_type, branch, category, cost_text, profit_text in scan_rows(
+        file_00673, ("row_type", "branch", "category", "total_cost", "total_profit")
+    ):
+        row_type = clean_text(row_type)
+        branch = clean_text(branch)
         if not branch:
             continue
-        key = canonical_branch(branch)
-        branch_display.setdefault(key, branch)
+        key = resolver.resolve(branch)
+        branch_display.setdefault(key, resolver.display_name(key))
 
-        cost = to_float(row.get("total_cost", ""))
-        profit = to_float(row.get("total_profit", ""))
+        cost = to_float(cost_text)
+        profit = to_float(profit_text)
         if row_type == "branch_total":
             if cost is not None:
                 branch_cost_2025[key] = cost
             if profit is not None:
                 branch_profit_2025[key] = profit
         elif row_type == "category":
-            category = clean_text(row.get("category", "UNKNOWN")).upper()
+            category = clean_text(category).upper()
             category_profit_2025[key][category] += profit or 0.0
 
-    for row in read_rows(file_00014):
-        if clean_text(row.get("row_type", "")) != "item":
-            continue
-        branch = clean_text(row.get("branch", ""))
+    for branch, qty_text, product, profit_text, margin_text in scan_rows(
+        file_00014,
+        ("branch", "qty", "product_desc", "total_profit", "total_profit_pct"),
+        where={"row_type": ("item",)},
+    ):
+        branch = clean_text(branch)
         if not branch:
             continue
-        key = canonical_branch(branch)
-        branch_display.setdefault(key, branch)
+        key = resolver.resolve(branch)
+        branch_display.setdefault(key, resolver.display_name(key))
 
         item_row_count[key] += 1
-        qty = to_float(row.get("qty", "")) or 0.0
+        qty = to_float(qty_text) or 0.0
         item_qty_2025[key] += qty
 
-        product = clean_text(row.get("product_desc", ""))
+        product = clean_text(product)
         if product:
             unique_items[key].add(product)
 
-        total_profit = to_float(row.get("total_profit", ""))
+        total_profit = to_float(profit_text)
         if total_profit is not None and total_profit < 0:
             loss_item_count[key] += 1
 
-        margin_pct = to_float(row.get("total_profit_pct", ""))
+        margin_pct = to_float(margin_text)
         if margin_pct is not None and margin_pct < 20:
             low_margin_item_count[key] += 1
 
-    for row in read_rows(file_00191):
-        row_type = clean_text(row.get("row_type", ""))
-        branch = clean_text(row.get("branch", ""))
+    for row_type, branch, group, amount_text in scan_rows(file_00191, ("row_type", "branch", "group", "total_amount")):
+        row_type = clean_text(row_type)
+        branch = clean_text(branch)
         if not branch:
             continue
-        key = canonical_branch(branch)
-        branch_display.setdefault(key, branch)
+        key = resolver.resolve(branch)
+        branch_display.setdefault(key, resolver.display_name(key))
 
-        amount = to_float(row.get("total_amount", ""))
+        amount = to_float(amount_text)
         if row_type == "group_total":
-            group_name = clean_text(row.get("group", "")).upper()
+            group_name = clean_text(group).upper()
             if group_name and amount is not None:
                 group_totals[key][group_name] += amount
         elif row_type == "branch_total" and amount is not None:
@@ -178,6 +277,7 @@ def build_branch_kpis(cleaned_dir: Path) -> List[Dict[str, object]]:
         jan_growth_pct = None
         if jan25 not in (None, 0) and jan26 is not None:
             jan_growth_pct = ((jan26 - jan25) / jan25) * 100
+        trend = trend_columns.get(key, {})
 
         cost = branch_cost_2025.get(key)
         profit = branch_profit_2025.get(key)
@@ -238,6 +338,16 @@ def build_branch_kpis(cleaned_dir: Path) -> List[Dict[str, object]]:
                 "revenue_jan_2025": round_or_none(jan25),
                 "revenue_jan_2026": round_or_none(jan26),
                 "jan_yoy_growth_pct": round_or_none(jan_growth_pct),
+                "latest_sales_month": trend.get("latest_sales_month"),
+                "latest_mom_growth_pct": trend.get("latest_mom_growth_pct"),
+                "latest_yoy_growth_pct": trend.get("latest_yoy_growth_pct"),
+                "rolling_3m_growth_pct": trend.get("rolling_3m_growth_pct"),
+                "median_mom_growth_pct_12m": trend.get("median_mom_growth_pct_12m"),
+                "growth_signal_pct": trend.get("growth_signal_pct"),
+                "growth_signal_basis": trend.get("growth_signal_basis", INSUFFICIENT_HISTORY),
+                "peak_sales_month": trend.get("peak_sales_month"),
+                "trough_sales_month": trend.get("trough_sales_month"),
+                "seasonality_amplitude": trend.get("seasonality_amplitude"),
                 "true_revenue_2025": round_or_none(true_revenue),
                 "total_cost_2025": round_or_none(cost),
                 "total_profit_2025": round_or_none(profit),
@@ -259,62 +369,102 @@ def build_branch_kpis(cleaned_dir: Path) -> List[Dict[str, object]]:
                 "top_group_by_sales": top_group,
                 "top_group_sales_amount": round_or_none(top_group_amount),
                 "top_group_sales_share_pct": round_or_none(top_group_share_pct),
-                "recommendation_tag": recommendation_tag(jan_growth_pct, margin_pct),
+                "recommendation_tag": recommendation_tag(trend.get("growth_signal_pct"), margin_pct),
             }
         )
 
     # Add ranks for easier branch comparison.
-    def add_rank(metric: str, rank_col: str, reverse: bool = True) -> None:
-        valid = [(i, rows[i][metric]) for i in range(len(rows)) if rows[i][metric] is not None]
-        sorted_rows = sorted(valid, key=lambda item: item[1], reverse=reverse)
-        for rank, (idx, _) in enumerate(sorted_rows, start=1):
-            rows[idx][rank_col] = rank
-        for idx in range(len(rows)):
-            rows[idx].setdefault(rank_col, None)
-
-    add_rank("total_profit_2025", "rank_total_profit_2025", reverse=True)
-    add_rank("profit_margin_pct_2025", "rank_profit_margin_2025", reverse=True)
-    add_rank("jan_yoy_growth_pct", "rank_jan_yoy_growth", reverse=True)
+    rank_rows(rows, RANK_SPECS)
 
     rows.sort(key=lambda row: (row["rank_total_profit_2025"] is None, row["rank_total_profit_2025"] or 9999))
     return rows
 
 
+def build_branch_reports(cleaned_dir: Path) -> Tuple[List[Dict[str, object]], List[Dict[str, object]]]:
+    """KPI rows and the branch x month growth rows."""
+    trends = build_monthly_trends(cleaned_dir)
+    return build_branch_kpis(cleaned_dir, trends), trends.to_rows()
+
+
+def cached_branch_reports(
+    cleaned_dir: Path, cache: Optional[ResultCache]
+) -> Tuple[List[Dict[str, object]], List[Dict[str, object]]]:
+    # Refresh the alias table first so the cache key sees the one the build will use.
+    load_or_build_resolver(cleaned_dir)
+    inputs = [cleaned_dir / name for name in (*SOURCE_FILENAMES, TRENDS_FILENAME, ALIAS_FILENAME)]
+    return cached(cache, "branch_kpi", Path(__file__), inputs, lambda: build_branch_reports(cleaned_dir))
+
+
 def write_csv(path: Path, rows: List[Dict[str, object]]) -> None:
     if not rows:
         raise ValueError("No KPI rows generated.")
-    fieldnames = list(rows[0].keys())
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8", newline="") as handle:
-        writer = csv.DictWriter(handle, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(rows)
+    write_records(path, rows)
 
 
 def parse_args() -> argparse.Namespace:
     repo_root = Path(__file__).resolve().parents[2]
     default_cleaned = repo_root / "Archive" / "Stories_data" / "cleaned"
     default_output = repo_root / "reports" / "branch_kpis.csv"
+    default_growth_output = repo_root / "reports" / "branch_monthly_growth.csv"
 
     parser = argparse.ArgumentParser(description="Build branch-level KPI table.")
     parser.add_argument("--cleaned-dir", type=Path, default=default_cleaned, help="Path to cleaned data directory.")
     parser.add_argument("--output", type=Path, default=default_output, help="Output CSV path.")
+    parser.add_argument(
+        "--growth-output", type=Path, default=default_growth_output, help="Branch x month growth matrix CSV path."
+    )
+    parser.add_argument("--watch", action="store_true", help="Keep running and rebuild when the cleaned data changes.")
+    parser.add_argument("--interval", type=float, default=0.25, help="Polling interval in seconds for --watch.")
+    parser.add_argument("--cache-dir", type=Path, default=None, help="Result cache directory (default .cache/results).")
+    parser.add_argument("--no-cache", action="store_true", help="Always rebuild instead of reusing cached results.")
     return parser.parse_args()
 
 
+def watch(args: argparse.Namespace) -> None:
+    """Keep the monthly trends in memory; only rebuild them when the long monthly file changes.
+
+    Every watched file feeds the KPI table, so it is rebuilt on each change; reports are
+    only rewritten when their rows differ from the last write.
+    """
+    state: Dict[str, object] = {}
+
+    def refresh(changed: Set[str]) -> None:
+        if "trends" not in state or TRENDS_FILENAME in changed:
+            state["trends"] = build_monthly_trends(args.cleaned_dir)
+            growth_rows = state["trends"].to_rows()
+            if state.get("growth_rows") != growth_rows:
+                write_csv(args.growth_output, growth_rows)
+                state["growth_rows"] = growth_rows
+        rows = build_branch_kpis(args.cleaned_dir, state["trends"])
+        if state.get("rows") != rows:
+            write_csv(args.output, rows)
+            state["rows"] = rows
+
+    names = (TRENDS_FILENAME, *SOURCE_FILENAMES)
+    watch_directory(args.cleaned_dir, refresh, names=names, interval=args.interval)
+
+
 def main() -> None:
     args = parse_args()
-    rows = build_branch_kpis(args.cleaned_dir)
+    if args.watch:
+        watch(args)
+        return
+    cache = open_cache(args.cache_dir, enabled=not args.no_cache)
+    rows, growth_rows = cached_branch_reports(args.cleaned_dir, cache)
     write_csv(args.output, rows)
+    write_csv(args.growth_output, growth_rows)
 
     print(f"KPI table generated: {args.output}")
+    print(f"Monthly growth table generated: {args.growth_output}")
     print(f"Branches: {len(rows)}")
     print("Top 5 branches by total profit (2025):")
     for row in rows[:5]:
         print(
             f"  - {row['branch']}: profit={row['total_profit_2025']}, "
-            f"margin={row['profit_margin_pct_2025']}%, jan_yoy={row['jan_yoy_growth_pct']}%"
+            f"margin={row['profit_margin_pct_2025']}%, growth_signal={row['growth_signal_pct']}%"
         )
+    if cache is not None:
+        print(f"Result cache: {cache.session}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""Search drink + food pair and triple bundles, ranked per branch by incremental profit."""
+
+from __future__ import annotations
+
+import argparse
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from math import comb
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from menu_engineering import aggregate_items, build_branch_rows, clean_text
+from report_io import round_or_none, scan_rows, write_records
+
+GROUP_FILENAME = "rep_00191_sales_by_items_by_group_clean.csv"
+DRINK_CATEGORY = "BEVERAGES"
+ANCHOR_QUADRANTS = ("star", "plowhorse")
+# Modifiers, packaging and ready-made offers are not bundle members.
+EXCLUDED_DIVISIONS = ("NOT USED", "CARTON", "OFFER")
+EXCLUDED_GROUPS = ("ADD SYRUP", "REPLACE", "TOPPINGS", "COMBO TOPPINGS", "LUXURY TOPPINGS", "ADD ONS", "PACKAGING")
+SCORE_CHUNK = 4096
+
+# (score, anchor, add-ons)
+Candidate = Tuple[float, int, Tuple[int, ...]]
+
+
+class BranchCatalog:
+    """One branch's sellable items as parallel arrays of unit economics."""
+
+    def __init__(
+        self,
+        branch: str,
+        products: List[str],
+        divisions: List[str],
+        quadrants: List[str],
+        is_drink: np.ndarray,
+        qty: np.ndarray,
+        price: np.ndarray,
+        cost: np.ndarray,
+    ) -> None:
+        self.branch = branch
+        self.products = products
+        self.divisions = divisions
+        self.quadrants = quadrants
+        self.is_drink = is_drink
+        self.qty = qty
+        self.price = price
+        self.cost = cost
+        _, self.division_ids = np.unique(np.array(divisions, dtype=object), return_inverse=True)
+
+
+class BundleParams:
+    def __init__(
+        self,
+        discount: float = 0.1,
+        attach_rate: float = 0.05,
+        min_margin_pct: float = 50.0,
+        max_items: int = 3,
+        pool_size: int = 10,
+        top_k: int = 10,
+        per_anchor: int = 2,
+    ) -> None:
+        self.discount = discount
+        self.attach_rate = attach_rate
+        self.min_margin_pct = min_margin_pct
+        self.max_items = max_items
+        self.pool_size = pool_size
+        self.top_k = top_k
+        self.per_anchor = per_anchor
+
+
+def item_groups(cleaned_dir: Path) -> Dict[str, Tuple[str, str]]:
+    """Most-sold (division, group) of every item in the sales-by-group report.
+
+    The 00014 division column is polluted by size labels (MEDIUM, SMALL, 250 ML ...),
+    so bundles are built on the 00191 divisions wherever an item appears there.
+    """
+    votes: Dict[str, Counter] = defaultdict(Counter)
+    for division, group, description, qty in scan_rows(
+        cleaned_dir / GROUP_FILENAME, ("division", "group", "description", "qty"), where={"row_type": ("item",)}
+    ):
+        try:
+            weight = float(qty)
+        except ValueError:
+            weight = 0.0
+        votes[clean_text(description)][(clean_text(division), clean_text(group))] += max(weight, 0.0) + 1e-9
+    return {name: counter.most_common(1)[0][0] for name, counter in votes.items()}
+
+
+def branch_catalogs(
+    branch_rows: Sequence[Dict[str, object]], groups: Dict[str, Tuple[str, str]], min_qty: float = 50.0
+) -> List[BranchCatalog]:
+    """Catalogs from menu-engineering branch rows; quadrants stay those of the full branch menu."""
+    grouped: Dict[str, List[Tuple[Dict[str, object], str]]] = defaultdict(list)
+    for row in branch_rows:
+        if float(row["qty"]) < min_qty or float(row["true_revenue"]) <= 0:
+            continue
+        division, group = groups.get(str(row["product_desc"]), (str(row["division"]), ""))
+        if division in EXCLUDED_DIVISIONS or group in EXCLUDED_GROUPS:
+            continue
+        grouped[str(row["branch"])].append((row, division))
+
+    catalogs: List[BranchCatalog] = []
+    for branch in sorted(grouped):
+        rows = [row for row, _ in grouped[branch]]
+        qty = np.array([float(row["qty"]) for row in rows])
+        catalogs.append(
+            BranchCatalog(
+                branch,
+                [str(row["product_desc"]) for row in rows],
+                [division for _, division in grouped[branch]],
+                [str(row["branch_quadrant"]) for row in rows],
+                np.array([row["category"] == DRINK_CATEGORY for row in rows]),
+                qty,
+                np.array([float(row["true_revenue"]) for row in rows]) / qty,
+                np.array([float(row["total_cost"]) for row in rows]) / qty,
+            )
+        )
+    return catalogs
+
+
+def addon_pool(catalog: BranchCatalog, params: BundleParams) -> np.ndarray:
+    """Items worth adding to a bundle: unit margin left after the discount is positive; best `pool_size` per division."""
+    gain = catalog.price - catalog.cost - params.discount * catalog.price
+    keep: List[int] = []
+    for division in np.unique(catalog.division_ids).tolist():
+        idx = np.nonzero((catalog.division_ids == division) & (gain > 0))[0]
+        keep.extend(idx[np.argsort(-gain[idx], kind="stable")[: params.pool_size]].tolist())
+    return np.array(sorted(keep), dtype=np.int64)
+
+
+def addon_combinations(catalog: BranchCatalog, pool: np.ndarray, size: int, discount: float) -> Dict[str, np.ndarray]:
+    """Every `size`-item combination of the pool from distinct divisions, sorted by summed discounted margin."""
+    if size == 1:
+        members = pool[:, None]
+    else:
+        first, second = np.triu_indices(pool.size, k=1)
+        members = np.stack([pool[first], pool[second]], axis=1)
+        members = members[catalog.division_ids[members[:, 0]] != catalog.division_ids[members[:, 1]]]
+    price = catalog.price[members].sum(axis=1)
+    cost = catalog.cost[members].sum(axis=1)
+    gain = price - cost - discount * price
+    order = np.argsort(-gain, kind="stable")
+    return {
+        "members": members[order],
+        "price": price[order],
+        "cost": cost[order],
+        "gain": gain[order],
+        "drinks": catalog.is_drink[members[order]].sum(axis=1),
+        "divisions": catalog.division_ids[members[order]],
+    }
+
+
+def select(best: Dict[FrozenSet[int], Candidate], top_k: int, per_anchor: int) -> List[Candidate]:
+    """Best `top_k` candidates with at most `per_anchor` of them on one anchor."""
+    chosen: List[Candidate] = []
+    taken: Counter = Counter()
+    for candidate in sorted(best.values(), key=lambda value: (-value[0], value[1], value[2])):
+        if taken[candidate[1]] >= per_anchor:
+            continue
+        chosen.append(candidate)
+        taken[candidate[1]] += 1
+        if len(chosen) == top_k:
+            break
+    return chosen
+
+
+def search_branch(catalog: BranchCatalog, params: BundleParams) -> Tuple[List[Dict[str, object]], int, int]:
+    """Top-K pairs and top-K triples of one branch, plus how many candidates were scored and how many exist.
+
+    A bundle is an anchor (a star or plowhorse whose buyers are offered the bundle) plus
+    add-ons, with exactly one drink, every member from its own division, sold at
+    `discount` off the summed prices. Per bundle sold, the branch gives up `discount` on
+    the anchor and on every add-on, and an add-on only earns new margin from buyers who
+    would not have bought it anyway; that share is taken as 1 - min(1, addon_qty / anchor_qty).
+    Bundles sold are attach_rate * min(qty of the members), so volume is capped by the
+    least-demanded item:
+        attach_rate * min(qty) * (sum over add-ons of margin * (1 - overlap) - discount * list price)
+    The score is bounded from above by
+        attach_rate * anchor_qty * (sum of add-on margins after discount - discount * anchor price)
+    which only grows along the add-on table, so each anchor
+    scans add-on combinations best-first and stops where the bound falls below the
+    branch's current K-th best. Triples always out-score their pairs, so each size is
+    ranked on its own, and one anchor fills at most `per_anchor` slots of a ranking.
+    """
+    d = params.discount
+    pool = addon_pool(catalog, params)
+    anchors = [
+        i for i in np.argsort(-catalog.qty, kind="stable").tolist() if catalog.quadrants[i] in ANCHOR_QUADRANTS
+    ]
+    margin = catalog.price - catalog.cost
+    keep = params.top_k + params.per_anchor
+    rows: List[Dict[str, object]] = []
+    scored = 0
+
+    for size in range(1, params.max_items):
+        if pool.size < size:
+            break
+        best: Dict[FrozenSet[int], Candidate] = {}
+        threshold = 0.0
+        table = addon_combinations(catalog, pool, size, d)
+        descending = -table["gain"]
+        for a in anchors:
+            qty_a = float(catalog.qty[a])
+            needed = threshold / (params.attach_rate * qty_a) + d * float(catalog.price[a])
+            # Combinations past `limit` cannot beat the current K-th best bundle for this anchor.
+            limit = int(np.searchsorted(descending, -needed, side="left"))
+            found: List[Candidate] = []
+            for start in range(0, limit, SCORE_CHUNK):
+                stop = min(start + SCORE_CHUNK, limit)
+                members = table["members"][start:stop]
+                price = table["price"][start:stop] + catalog.price[a]
+                cost = table["cost"][start:stop] + catalog.cost[a]
+                bundle_price = (1.0 - d) * price
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    margin_pct = (bundle_price - cost) / bundle_price * 100
+                ok = (
+                    (members != a).all(axis=1)
+                    & (table["divisions"][start:stop] != catalog.division_ids[a]).all(axis=1)
+                    & (table["drinks"][start:stop] + catalog.is_drink[a] == 1)
+                    & (margin_pct >= params.min_margin_pct)
+                )
+                scored += stop - start
+                addon_qty = catalog.qty[members]
+                overlap = np.minimum(addon_qty / qty_a, 1.0)
+                value = (margin[members] * (1.0 - overlap)).sum(axis=1) - d * price
+                score = params.attach_rate * np.minimum(addon_qty.min(axis=1), qty_a) * value
+                hits = np.nonzero(ok & (score > threshold))[0]
+                if hits.size > keep:
+                    hits = hits[np.argpartition(-score[hits], keep - 1)[:keep]]
+                found.extend((float(score[i]), a, tuple(members[i].tolist())) for i in hits.tolist())
+            found.sort(key=lambda value: -value[0])
+            for candidate in found[:keep]:
+                key = frozenset((a, *candidate[2]))
+                if key not in best or best[key][0] < candidate[0]:
+                    best[key] = candidate
+            chosen = select(best, params.top_k, params.per_anchor)
+            if len(chosen) == params.top_k:
+                threshold = max(threshold, chosen[-1][0])
+        chosen = select(best, params.top_k, params.per_anchor)
+        rows.extend(bundle_row(catalog, params, rank, *value) for rank, value in enumerate(chosen, start=1))
+
+    n = catalog.qty.size
+    space = sum(comb(n, size) for size in range(2, params.max_items + 1))
+    return rows, scored, space
+
+
+def bundle_row(
+    catalog: BranchCatalog, params: BundleParams, rank: int, score: float, anchor: int, addons: Tuple[int, ...]
+) -> Dict[str, object]:
+    items = [anchor, *addons]
+    list_price = float(catalog.price[items].sum())
+    cost = float(catalog.cost[items].sum())
+    bundle_price = (1.0 - params.discount) * list_price
+    bundles = params.attach_rate * float(catalog.qty[items].min())
+    return {
+        "branch": catalog.branch,
+        "rank": rank,
+        "bundle_size": len(items),
+        "anchor": catalog.products[anchor],
+        "items": " + ".join(catalog.products[i] for i in items),
+        "divisions": " + ".join(catalog.divisions[i] for i in items),
+        "quadrants": " + ".join(catalog.quadrants[i] for i in items),
+        "list_price": round_or_none(list_price),
+        "bundle_price": round_or_none(bundle_price),
+        "bundle_cost": round_or_none(cost),
+        "bundle_margin_pct": round_or_none((bundle_price - cost) / bundle_price * 100),
+        "profit_per_bundle": round_or_none(bundle_price - cost),
+        "incremental_profit_per_bundle": round_or_none(score / bundles),
+        "anchor_qty": round_or_none(float(catalog.qty[anchor])),
+        "min_member_qty": round_or_none(float(catalog.qty[items].min())),
+        "expected_bundles": round_or_none(bundles),
+        "expected_incremental_profit": round_or_none(score),
+    }
+
+
+def search_bundles(
+    catalogs: Sequence[BranchCatalog], params: BundleParams, workers: Optional[int] = None
+) -> Tuple[List[Dict[str, object]], int, int]:
+    """Search every branch in a process pool; returns all rows and the scored / total candidate counts."""
+    rows: List[Dict[str, object]] = []
+    scored = space = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for branch_rows, branch_scored, branch_space in pool.map(search_branch, catalogs, [params] * len(catalogs)):
+            rows.extend(branch_rows)
+            scored += branch_scored
+            space += branch_space
+    return rows, scored, space
+
+
+def parse_args() -> argparse.Namespace:
+    repo_root = Path(__file__).resolve().parents[2]
+    default_cleaned = repo_root / "Archive" / "Stories_data" / "cleaned"
+    default_output = repo_root / "reports" / "bundle_candidates.csv"
+
+    parser = argparse.ArgumentParser(description="Search drink + food bundles and rank them per branch.")
+    parser.add_argument("--cleaned-dir", type=Path, default=default_cleaned, help="Path to cleaned data directory.")
+    parser.add_argument("--output", type=Path, default=default_output, help="Output CSV path.")
+    parser.add_argument("--discount", type=float, default=0.1, help="Bundle discount off the summed item prices.")
+    parser.add_argument(
+        "--attach-rate", type=float, default=0.05, help="Share of the least-sold member's buyers assumed to take the bundle."
+    )
+    parser.add_argument("--min-margin-pct", type=float, default=50.0, help="Lowest bundle margin kept.")
+    parser.add_argument("--max-items", type=int, choices=(2, 3), default=3, help="Largest bundle size.")
+    parser.add_argument("--pool-size", type=int, default=10, help="Best add-on candidates kept per division.")
+    parser.add_argument("--min-qty", type=float, default=50.0, help="Minimum qty for an item to be bundled.")
+    parser.add_argument("--top-k", type=int, default=10, help="Bundles kept per branch and bundle size.")
+    parser.add_argument("--per-anchor", type=int, default=2, help="Most bundles one anchor may take in a ranking.")
+    parser.add_argument("--workers", type=int, default=None, help="Branches searched at once.")
+    args = parser.parse_args()
+    if not 0 <= args.discount < 1:
+        parser.error("--discount must be in [0, 1)")
+    if args.per_anchor < 1:
+        parser.error("--per-anchor must be at least 1")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    _, branch_aggregate = aggregate_items(args.cleaned_dir)
+    groups = item_groups(args.cleaned_dir)
+    catalogs = branch_catalogs(build_branch_rows(branch_aggregate), groups, min_qty=args.min_qty)
+    params = BundleParams(
+        discount=args.discount,
+        attach_rate=args.attach_rate,
+        min_margin_pct=args.min_margin_pct,
+        max_items=args.max_items,
+        pool_size=args.pool_size,
+        top_k=args.top_k,
+        per_anchor=args.per_anchor,
+    )
+    rows, scored, space = search_bundles(catalogs, params, args.workers)
+    if not rows:
+        raise SystemExit("No bundle passed the margin and complement rules.")
+    write_records(args.output, rows)
+
+    print(f"Bundle table: {args.output} ({len(rows)} rows, {len(catalogs)} branches)")
+    print(f"Scored {scored} of {space} possible bundles")
+    print("Best bundles (first 5):")
+    for row in [row for row in rows if row["rank"] == 1][:5]:
+        print(f"  - {row['branch']} ({row['bundle_size']} items): {row['items']} @ {row['bundle_price']} (+{row['expected_incremental_profit']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Spill files, hash partitioning and k-way merging for tables that do not fit in memory."""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import pickle
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+BATCH_SIZE = 1024
+
+
+def spill(path: Path, records: Iterable[Any], batch_size: int = BATCH_SIZE) -> int:
+    """Write records to a pickle stream in batches; returns how many were written."""
+    count = 0
+    records = iter(records)
+    with path.open("wb") as handle:
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if not batch:
+                break
+            pickle.dump(batch, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            count += len(batch)
+    return count
+
+
+def iter_spilled(path: Path) -> Iterator[Any]:
+    """Records of a spill file in the order they were written."""
+    with path.open("rb") as handle:
+        while True:
+            try:
+                batch = pickle.load(handle)
+            except EOFError:
+                return
+            yield from batch
+
+
+def stable_hash(value: object) -> int:
+    """Process-independent hash (str hashes are salted per interpreter)."""
+    return zlib.crc32(repr(value).encode("utf-8"))
+
+
+class HashPartitioner:
+    """Append records to one of `n_partitions` spill files chosen by a hash of `key(record)`.
+
+    Records sharing a key always land in the same file, in arrival order.
+    """
+
+    def __init__(self, directory: Path, n_partitions: int, key: Callable[[Any], object], batch_size: int = BATCH_SIZE) -> None:
+        self.directory = directory
+        self.key = key
+        self.batch_size = batch_size
+        self.paths = [directory / f"partition-{i:04d}.pkl" for i in range(n_partitions)]
+        self.buffers: List[List[Any]] = [[] for _ in range(n_partitions)]
+        self.counts = [0] * n_partitions
+        self.handles = [path.open("wb") for path in self.paths]
+
+    def add(self, record: Any) -> None:
+        i = stable_hash(self.key(record)) % len(self.paths)
+        buffer = self.buffers[i]
+        buffer.append(record)
+        self.counts[i] += 1
+        if len(buffer) >= self.batch_size:
+            pickle.dump(buffer, self.handles[i], protocol=pickle.HIGHEST_PROTOCOL)
+            self.buffers[i] = []
+
+    def close(self) -> List[Path]:
+        """Flush and close every file; returns the non-empty partition paths."""
+        for i, handle in enumerate(self.handles):
+            if self.buffers[i]:
+                pickle.dump(self.buffers[i], handle, protocol=pickle.HIGHEST_PROTOCOL)
+                self.buffers[i] = []
+            handle.close()
+        return [path for path, count in zip(self.paths, self.counts) if count]
+
+    def __enter__(self) -> "HashPartitioner":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        if not all(handle.closed for handle in self.handles):
+            self.close()
+
+
+def merge_runs(paths: Iterable[Path], key: Optional[Callable[[Any], Any]] = None) -> Iterator[Any]:
+    """k-way merge of already-sorted spill files; ties keep the order of `paths`."""
+    return heapq.merge(*(iter_spilled(path) for path in paths), key=key)
+
+
+def sorted_runs(
+    records: Iterable[Any], directory: Path, key: Optional[Callable[[Any], Any]] = None, run_size: int = 100_000
+) -> List[Path]:
+    """Cut records into sorted runs of at most `run_size` and spill each one."""
+    paths: List[Path] = []
+    records = iter(records)
+    while True:
+        run = list(itertools.islice(records, run_size))
+        if not run:
+            return paths
+        run.sort(key=key)
+        path = directory / f"run-{len(paths):06d}.pkl"
+        spill(path, run)
+        paths.append(path)
+
+
+def external_sort(
+    records: Iterable[Any], directory: Path, key: Optional[Callable[[Any], Any]] = None, run_size: int = 100_000
+) -> Iterator[Any]:
+    """Stable sort with at most `run_size` records in memory at a time (plus merge buffers)."""
+    return merge_runs(sorted_runs(records, directory, key, run_size), key)
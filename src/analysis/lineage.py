@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""Binary side indexes that map rows of a derived table back to the source lines they came from."""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Sequence, Tuple
+
+from report_io import atomic_output, detect_compression, open_binary_input, split_member
+
+MAGIC = b"LNG1"
+LINEAGE_SUFFIX = ".lineage"
+# magic, row count, span count, byte length of the JSON source list
+HEADER = struct.Struct("<4sIII")
+# first span, span count
+ROW = struct.Struct("<II")
+# source id, record ordinal in the source, 1-based line, byte offset
+SPAN = struct.Struct("<HIIQ")
+
+# (source id, ordinal, line, offset)
+Span = Tuple[int, int, int, int]
+
+
+class SourceRow(list):
+    """CSV cells that remember which record of their file they are and where it starts."""
+
+    __slots__ = ("ordinal", "line", "offset")
+
+
+def lineage_path(path: Path) -> Path:
+    return path.with_name(path.name + LINEAGE_SUFFIX)
+
+
+def iter_csv_positions(path: Path) -> Iterator[SourceRow]:
+    """Every CSV record of `path` (BOM stripped) with its ordinal, first line and byte offset."""
+    with open_binary_input(path) as handle:
+        offsets = [0]
+
+        def lines() -> Iterator[str]:
+            for raw_line in handle:
+                offsets.append(offsets[-1] + len(raw_line))
+                yield raw_line.decode("utf-8-sig" if len(offsets) == 2 else "utf-8")
+
+        reader = csv.reader(lines())
+        consumed = 0
+        for ordinal, cells in enumerate(reader):
+            row = SourceRow(cells)
+            row.ordinal = ordinal
+            row.line = consumed + 1
+            row.offset = offsets[consumed]
+            consumed = reader.line_num
+            yield row
+
+
+def write_lineage(path: Path, sources: Sequence[Path], rows: Sequence[Sequence[Span]]) -> None:
+    """Write the index for a table whose i-th data row came from the spans in rows[i].
+
+    Source paths are stored relative to the index so cleaned folders can be moved together.
+    """
+    names = json.dumps([os.path.relpath(source, path.parent) for source in sources]).encode("utf-8")
+    row_table = bytearray()
+    span_table = bytearray()
+    n_spans = 0
+    for spans in rows:
+        row_table += ROW.pack(n_spans, len(spans))
+        for span in spans:
+            span_table += SPAN.pack(*span)
+        n_spans += len(spans)
+    with atomic_output(path) as tmp_path:
+        with tmp_path.open("wb") as handle:
+            handle.write(HEADER.pack(MAGIC, len(rows), n_spans, len(names)))
+            handle.write(names)
+            handle.write(row_table)
+            handle.write(span_table)
+
+
+class LineageIndex:
+    """Memory-mapped lineage index: each lookup is two fixed-size reads and one seek per source line.
+
+    Compressed sources are the exception: reaching a line means decompressing up to it.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.handle = path.open("rb")
+        self.data = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n_rows, self.n_spans, names_length = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a lineage index")
+        names_end = HEADER.size + names_length
+        names = json.loads(self.data[HEADER.size:names_end].decode("utf-8"))
+        self.sources = [(path.parent / name).resolve() for name in names]
+        self.rows_base = names_end
+        self.spans_base = names_end + self.n_rows * ROW.size
+        self.source_handles: Dict[int, BinaryIO] = {}
+
+    def spans(self, row: int) -> List[Span]:
+        if not 0 <= row < self.n_rows:
+            raise IndexError(f"Row {row} outside {self.path} ({self.n_rows} rows)")
+        first, count = ROW.unpack_from(self.data, self.rows_base + row * ROW.size)
+        return [SPAN.unpack_from(self.data, self.spans_base + (first + i) * SPAN.size) for i in range(count)]
+
+    def locate(self, row: int) -> List[Tuple[Path, int, int, int]]:
+        """(source path, ordinal, line, byte offset) for every source record behind `row`."""
+        return [(self.sources[source], ordinal, line, offset) for source, ordinal, line, offset in self.spans(row)]
+
+    def read_record(self, source: int, offset: int) -> List[str]:
+        if detect_compression(split_member(self.sources[source])[0]) is not None:
+            # Compressed sources cannot seek: decompress again and skip to the offset.
+            with open_binary_input(self.sources[source]) as compressed:
+                remaining = offset
+                while remaining:
+                    chunk = compressed.read(min(remaining, 1 << 20))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                return self.parse_record(compressed, offset)
+        handle = self.source_handles.get(source)
+        if handle is None:
+            handle = self.source_handles[source] = self.sources[source].open("rb")
+        handle.seek(offset)
+        return self.parse_record(handle, offset)
+
+    @staticmethod
+    def parse_record(handle: BinaryIO, offset: int) -> List[str]:
+        def lines() -> Iterator[str]:
+            for raw_line in handle:
+                yield raw_line.decode("utf-8-sig" if offset == 0 else "utf-8")
+
+        return next(csv.reader(lines()), [])
+
+    def records(self, row: int) -> List[Tuple[Path, int, List[str]]]:
+        """(source path, line, cells) of the source records behind `row`, read by seeking."""
+        return [(self.sources[source], line, self.read_record(source, offset)) for source, _, line, offset in self.spans(row)]
+
+    def close(self) -> None:
+        for handle in self.source_handles.values():
+            handle.close()
+        self.data.close()
+        self.handle.close()
+
+    def __enter__(self) -> "LineageIndex":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def drill_down(path: Path, row: int) -> List[Tuple[Path, int, List[str]]]:
+    """Follow lineage indexes from a data row of `path` to the lines of files that have no index.
+
+    A report row resolves to cleaned rows, and each cleaned row to its raw export lines.
+    """
+    with LineageIndex(lineage_path(path)) as index:
+        results: List[Tuple[Path, int, List[str]]] = []
+        for source, ordinal, line, offset in index.spans(row):
+            source_path = index.sources[source]
+            if lineage_path(source_path).exists():
+                results.extend(drill_down(source_path, ordinal))
+            else:
+                results.append((source_path, line, index.read_record(source, offset)))
+        return results
+
+
+def find_rows(path: Path, filters: Dict[str, str]) -> List[int]:
+    """Data-row numbers of `path` whose columns equal every filter value."""
+    matches: List[int] = []
+    with path.open("r", encoding="utf-8", newline="") as handle:
+        for i, row in enumerate(csv.DictReader(handle)):
+            if all(row.get(name) == value for name, value in filters.items()):
+                matches.append(i)
+    return matches
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Show the raw export lines behind rows of a cleaned table or report.")
+    parser.add_argument("table", type=Path, help="Cleaned CSV or report that has a .lineage index next to it.")
+    parser.add_argument("rows", type=int, nargs="*", help="0-based data-row numbers (header excluded).")
+    parser.add_argument(
+        "--where", action="append", default=[], help="column=value filter selecting rows instead of numbers (repeatable)."
+    )
+    parser.add_argument("--limit", type=int, default=20, help="Most rows to drill into when --where matches many.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    rows: List[int] = list(args.rows)
+    if args.where:
+        filters = dict(item.split("=", 1) for item in args.where)
+        rows.extend(find_rows(args.table, filters)[: args.limit])
+    if not rows:
+        raise SystemExit("No rows selected.")
+
+    for row in rows:
+        lines = drill_down(args.table, row)
+        print(f"{args.table.name} row {row}: {len(lines)} source line(s)")
+        for source, line, cells in lines:
+            print(f"  {source.name}:{line}: {','.join(cells)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,27 @@
 from __future__ import annotations
 
 import argparse
-import csv
+import tempfile
 from collections import defaultdict
+from contextlib import contextmanager
+from decimal import ROUND_HALF_EVEN, Decimal, InvalidOperation
 from pathlib import Path
 from statistics import median
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from branch_identity import ALIAS_FILENAME, BranchResolver, load_or_build_resolver
+from external_sort import HashPartitioner, iter_spilled, merge_runs, spill
+from lineage import Span, iter_csv_positions, lineage_path, write_lineage
+from report_io import round_or_none, scan_rows, watch_directory, write_partitioned, write_record_stream, write_records
+from result_cache import ResultCache, cached, open_cache
+
+SOURCE_FILENAME = "rep_00014_theoretical_profit_by_item_clean.csv"
+# "fixed" sums money as integer minor units (cents) and converts to float only for output.
+MONEY_MODES = ("float", "fixed")
+MINOR_UNITS = 100
+MONEY_FIELDS = ("true_revenue", "total_cost", "total_profit")
+# Columns of the cleaned 00014 file that iter_item_records reads, in ItemRecord order.
+ITEM_COLUMNS = ("branch", "product_desc", "category", "division", "department", "qty", "total_cost", "total_profit")
 
 
 def clean_text(value: str) -> str:
@@ -25,10 +41,22 @@ def to_float(value: str) -> Optional[float]:
         return None
 
 
-def round_or_none(value: Optional[float], ndigits: int = 2) -> Optional[float]:
-    if value is None:
+def to_minor_units(value: str) -> Optional[int]:
+    """Parse an amount straight into integer cents, without a float round trip."""
+    text = clean_text(value).replace(",", "")
+    if not text:
+        return None
+    sign = -1 if text.startswith("-") else 1
+    whole, _, fraction = text.lstrip("+-").partition(".")
+    if (whole.isdigit() or (not whole and fraction)) and (fraction.isdigit() or not fraction) and len(fraction) <= 2:
+        return sign * (int(whole or "0") * MINOR_UNITS + int(fraction.ljust(2, "0")))
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
         return None
-    return round(value, ndigits)
+    if not amount.is_finite():
+        return None
+    return int((amount * MINOR_UNITS).to_integral_value(ROUND_HALF_EVEN))
 
 
 def safe_div(numerator: Optional[float], denominator: Optional[float]) -> Optional[float]:
@@ -37,11 +65,6 @@ def safe_div(numerator: Optional[float], denominator: Optional[float]) -> Option
     return numerator / denominator
 
 
-def read_rows(path: Path) -> Iterable[Dict[str, str]]:
-    with path.open("r", encoding="utf-8", newline="") as handle:
-        yield from csv.DictReader(handle)
-
-
 def recommendation_for_quadrant(quadrant: str) -> str:
     mapping = {
         "star": "Keep quality high, feature prominently, and bundle for upsell.",
@@ -232,103 +255,290 @@ def build_branch_summary(rows: List[Dict[str, object]]) -> List[Dict[str, object
     return summary_rows
 
 
-def build_menu_engineering_tables(cleaned_dir: Path) -> Tuple[List[Dict[str, object]], List[Dict[str, object]], List[Dict[str, object]]]:
-    source_path = cleaned_dir / "rep_00014_theoretical_profit_by_item_clean.csv"
-    if not source_path.exists():
-        raise FileNotFoundError(f"Missing cleaned file: {source_path}")
-
-    overall_aggregate: Dict[Tuple[str, str, str], Dict[str, object]] = defaultdict(lambda: {
+def new_overall_entry(money_zero: float = 0.0) -> Dict[str, object]:
+    return {
         "product_desc": "",
         "category": "",
         "division": "",
         "department": "",
         "qty": 0.0,
-        "true_revenue": 0.0,
-        "total_cost": 0.0,
-        "total_profit": 0.0,
+        "true_revenue": money_zero,
+        "total_cost": money_zero,
+        "total_profit": money_zero,
         "record_count": 0,
-    })
+    }
+
 
-    branch_aggregate: Dict[Tuple[str, str, str, str], Dict[str, object]] = defaultdict(lambda: {
+def new_branch_entry(money_zero: float = 0.0) -> Dict[str, object]:
+    return {
         "branch": "",
         "product_desc": "",
         "category": "",
         "division": "",
         "department": "",
         "qty": 0.0,
-        "true_revenue": 0.0,
-        "total_cost": 0.0,
-        "total_profit": 0.0,
+        "true_revenue": money_zero,
+        "total_cost": money_zero,
+        "total_profit": money_zero,
         "record_count": 0,
-    })
+    }
 
-    for row in read_rows(source_path):
-        if clean_text(row.get("row_type", "")) != "item":
-            continue
 
-        product = clean_text(row.get("product_desc", ""))
-        category = clean_text(row.get("category", "UNKNOWN"))
-        division = clean_text(row.get("division", "UNKNOWN"))
-        department = clean_text(row.get("department", "UNKNOWN"))
-        branch = clean_text(row.get("branch", ""))
-        if not product or not branch:
-            continue
+def money_zero(money: str) -> float:
+    if money not in MONEY_MODES:
+        raise ValueError(f"Unknown money mode: {money}")
+    return 0 if money == "fixed" else 0.0
 
-        qty = to_float(row.get("qty", "")) or 0.0
-        cost = to_float(row.get("total_cost", "")) or 0.0
-        profit = to_float(row.get("total_profit", "")) or 0.0
-        true_revenue = cost + profit
-
-        o_key = (product, category, division)
-        o = overall_aggregate[o_key]
-        o["product_desc"] = product
-        o["category"] = category
-        o["division"] = division
-        o["department"] = department
-        o["qty"] += qty
-        o["true_revenue"] += true_revenue
-        o["total_cost"] += cost
-        o["total_profit"] += profit
-        o["record_count"] += 1
-
-        b_key = (branch, product, category, division)
-        b = branch_aggregate[b_key]
-        b["branch"] = branch
-        b["product_desc"] = product
-        b["category"] = category
-        b["division"] = division
-        b["department"] = department
-        b["qty"] += qty
-        b["true_revenue"] += true_revenue
-        b["total_cost"] += cost
-        b["total_profit"] += profit
-        b["record_count"] += 1
 
+def minor_units_to_float(aggregate: Dict[Tuple[str, ...], Dict[str, object]]) -> None:
+    """Turn integer-cent money fields back into floats, in place."""
+    for entry in aggregate.values():
+        for field in MONEY_FIELDS:
+            entry[field] = entry[field] / MINOR_UNITS
+
+
+# (branch, product, category, division, department, qty, true_revenue, cost, profit, record_count);
+# money is float, or int cents in fixed mode.
+ItemRecord = Tuple[str, str, str, str, str, float, float, float, float, int]
+
+
+def item_identity(fields: Sequence[str], resolver: BranchResolver) -> Optional[Tuple[str, str, str, str, str]]:
+    """(branch, product, category, division, department) from an item row's first five ITEM_COLUMNS, or None if unnamed."""
+    product = clean_text(fields[1])
+    branch = resolver.canonical_name(fields[0])
+    if not product or not branch:
+        return None
+    return branch, product, clean_text(fields[2]), clean_text(fields[3]), clean_text(fields[4])
+
+
+def iter_item_records(cleaned_dir: Path, money: str = "float") -> Iterator[ItemRecord]:
+    """Item rows of the cleaned 00014 file as records, one per source row."""
+    parse_money = to_minor_units if money == "fixed" else to_float
+    source_path = cleaned_dir / SOURCE_FILENAME
+    if not source_path.exists():
+        raise FileNotFoundError(f"Missing cleaned file: {source_path}")
+
+    resolver = load_or_build_resolver(cleaned_dir)
+    for fields in scan_rows(source_path, ITEM_COLUMNS, where={"row_type": ("item",)}):
+        identity = item_identity(fields, resolver)
+        if identity is None:
+            continue
+
+        branch, product, category, division, department = identity
+        qty = to_float(fields[5]) or 0.0
+        cost = parse_money(fields[6]) or 0
+        profit = parse_money(fields[7]) or 0
+        yield (branch, product, category, division, department, qty, cost + profit, cost, profit, 1)
+
+
+def add_record(entry: Dict[str, object], record: ItemRecord, with_branch: bool) -> None:
+    """Fold a record (a source row or an already-summed partial) into an aggregate entry."""
+    branch, product, category, division, department, qty, true_revenue, cost, profit, count = record
+    if with_branch:
+        entry["branch"] = branch
+    entry["product_desc"] = product
+    entry["category"] = category
+    entry["division"] = division
+    entry["department"] = department
+    entry["qty"] += qty
+    entry["true_revenue"] += true_revenue
+    entry["total_cost"] += cost
+    entry["total_profit"] += profit
+    entry["record_count"] += count
+
+
+def entry_record(entry: Dict[str, object]) -> ItemRecord:
+    return (
+        str(entry["branch"]),
+        str(entry["product_desc"]),
+        str(entry["category"]),
+        str(entry["division"]),
+        str(entry["department"]),
+        entry["qty"],
+        entry["true_revenue"],
+        entry["total_cost"],
+        entry["total_profit"],
+        entry["record_count"],
+    )
+
+
+def aggregate_items(
+    cleaned_dir: Path,
+    money: str = "float",
+) -> Tuple[Dict[Tuple[str, str, str], Dict[str, object]], Dict[Tuple[str, str, str, str], Dict[str, object]]]:
+    """Sum item rows into (product, category, division) and (branch, product, category, division) aggregates."""
+    zero = money_zero(money)
+    overall_aggregate: Dict[Tuple[str, str, str], Dict[str, object]] = defaultdict(lambda: new_overall_entry(zero))
+    branch_aggregate: Dict[Tuple[str, str, str, str], Dict[str, object]] = defaultdict(lambda: new_branch_entry(zero))
+
+    for record in iter_item_records(cleaned_dir, money):
+        add_record(overall_aggregate[record[1:4]], record, with_branch=False)
+        add_record(branch_aggregate[record[:4]], record, with_branch=True)
+
+    if money == "fixed":
+        minor_units_to_float(overall_aggregate)
+        minor_units_to_float(branch_aggregate)
+    return overall_aggregate, branch_aggregate
+
+
+def build_overall_rows(overall_aggregate: Dict[Tuple[str, str, str], Dict[str, object]]) -> List[Dict[str, object]]:
     overall_rows = build_base_rows(overall_aggregate)
     add_global_quadrants(overall_rows)
     overall_rows.sort(key=lambda row: float(row["total_profit"]), reverse=True)
+    return overall_rows
+
 
+def build_branch_rows(branch_aggregate: Dict[Tuple[str, str, str, str], Dict[str, object]]) -> List[Dict[str, object]]:
     branch_rows = build_base_rows(branch_aggregate)
     add_branch_quadrants(branch_rows)
-    branch_rows.sort(key=lambda row: (str(row["branch"]), -float(row["total_profit"])))
+    branch_rows.sort(key=branch_row_order)
+    return branch_rows
+
+
+def branch_row_order(row: Dict[str, object]) -> Tuple[str, float]:
+    return (str(row["branch"]), -float(row["total_profit"]))
+
 
+def build_menu_engineering_tables(
+    cleaned_dir: Path, money: str = "float"
+) -> Tuple[List[Dict[str, object]], List[Dict[str, object]], List[Dict[str, object]]]:
+    overall_aggregate, branch_aggregate = aggregate_items(cleaned_dir, money)
+    overall_rows = build_overall_rows(overall_aggregate)
+    branch_rows = build_branch_rows(branch_aggregate)
     branch_summary = build_branch_summary(branch_rows)
     return overall_rows, branch_rows, branch_summary
 
 
+@contextmanager
+def external_menu_engineering_tables(
+    cleaned_dir: Path,
+    max_groups: int = 200_000,
+    n_partitions: int = 16,
+    spill_dir: Optional[Path] = None,
+    money: str = "float",
+) -> Iterator[Tuple[List[Dict[str, object]], Iterator[Dict[str, object]], List[Dict[str, object]]]]:
+    """Spill-to-disk build: (overall rows, branch rows as a sorted stream, branch summary).
+
+    Branch x product groups are summed in memory until there are more than `max_groups`;
+    the partial sums and every later row are then hash-partitioned by branch into spill
+    files. Each partition holds whole branches, so it can be summed, classified against
+    its own branch medians and sorted on its own; the sorted runs are merged while the
+    caller writes them. Partials are spilled once, before the rows that follow them, so
+    every sum is added in input order and the output matches build_menu_engineering_tables
+    exactly. The overall table (one row per product) stays in memory: its quadrants
+    need medians across all products.
+    """
+    zero = money_zero(money)
+    overall_aggregate: Dict[Tuple[str, str, str], Dict[str, object]] = defaultdict(lambda: new_overall_entry(zero))
+    branch_aggregate: Dict[Tuple[str, str, str, str], Dict[str, object]] = defaultdict(lambda: new_branch_entry(zero))
+
+    with tempfile.TemporaryDirectory(prefix="menu-spill-", dir=spill_dir) as tmp:
+        tmp_dir = Path(tmp)
+        partitioner: Optional[HashPartitioner] = None
+        try:
+            for record in iter_item_records(cleaned_dir, money):
+                add_record(overall_aggregate[record[1:4]], record, with_branch=False)
+                if partitioner is not None:
+                    partitioner.add(record)
+                    continue
+                add_record(branch_aggregate[record[:4]], record, with_branch=True)
+                if len(branch_aggregate) > max_groups:
+                    partitioner = HashPartitioner(tmp_dir, n_partitions, key=lambda item: item[0])
+                    for entry in branch_aggregate.values():
+                        partitioner.add(entry_record(entry))
+                    branch_aggregate.clear()
+        finally:
+            partition_paths = partitioner.close() if partitioner is not None else []
+
+        def partitions() -> Iterator[Dict[Tuple[str, str, str, str], Dict[str, object]]]:
+            if partitioner is None:
+                yield branch_aggregate
+                return
+            for path in partition_paths:
+                aggregate: Dict[Tuple[str, str, str, str], Dict[str, object]] = defaultdict(lambda: new_branch_entry(zero))
+                for record in iter_spilled(path):
+                    add_record(aggregate[record[:4]], record, with_branch=True)
+                path.unlink()
+                yield aggregate
+
+        run_paths: List[Path] = []
+        summary_rows: List[Dict[str, object]] = []
+        for aggregate in partitions():
+            if money == "fixed":
+                minor_units_to_float(aggregate)
+            rows = build_branch_rows(aggregate)
+            summary_rows.extend(build_branch_summary(rows))
+            run_path = tmp_dir / f"run-{len(run_paths):04d}.pkl"
+            spill(run_path, rows)
+            run_paths.append(run_path)
+        branch_aggregate.clear()
+
+        # Same order build_branch_summary produces from branch-sorted rows.
+        summary_rows.sort(key=lambda row: str(row["branch"]))
+        summary_rows.sort(key=lambda row: row["total_profit"] if row["total_profit"] is not None else -10**18, reverse=True)
+        if money == "fixed":
+            minor_units_to_float(overall_aggregate)
+        yield build_overall_rows(overall_aggregate), merge_runs(run_paths, key=branch_row_order), summary_rows
+
+
+def cached_menu_engineering_tables(
+    cleaned_dir: Path, cache: Optional[ResultCache], money: str = "float"
+) -> Tuple[List[Dict[str, object]], List[Dict[str, object]], List[Dict[str, object]]]:
+    # Refresh the alias table first so the cache key sees the one the build will use.
+    load_or_build_resolver(cleaned_dir)
+    inputs = [cleaned_dir / SOURCE_FILENAME, cleaned_dir / ALIAS_FILENAME]
+    return cached(
+        cache,
+        "menu_engineering",
+        Path(__file__),
+        inputs,
+        lambda: build_menu_engineering_tables(cleaned_dir, money),
+        params={"money": money},
+    )
+
+
+def write_menu_lineage(
+    cleaned_dir: Path,
+    overall_rows: List[Dict[str, object]],
+    branch_rows: List[Dict[str, object]],
+    overall_path: Path,
+    branch_path: Path,
+) -> None:
+    """Index every overall/branch report row to the cleaned item rows summed into it.
+
+    With the cleaner's own index next to the cleaned file, lineage.drill_down goes on to the raw export.
+    """
+    source_path = cleaned_dir / SOURCE_FILENAME
+    resolver = load_or_build_resolver(cleaned_dir)
+    overall_spans: Dict[Tuple[str, ...], List[Span]] = defaultdict(list)
+    branch_spans: Dict[Tuple[str, ...], List[Span]] = defaultdict(list)
+    positions = iter_csv_positions(source_path)
+    header = next(positions, [])
+    row_type_at = header.index("row_type")
+    item_at = [header.index(name) for name in ITEM_COLUMNS]
+    for record in positions:
+        if record[row_type_at] != "item":
+            continue
+        identity = item_identity([record[i] for i in item_at], resolver)
+        if identity is None:
+            continue
+        # Cleaned tables are indexed by data row, so the header is not counted.
+        span = (0, record.ordinal - 1, record.line, record.offset)
+        overall_spans[identity[1:4]].append(span)
+        branch_spans[identity[:4]].append(span)
+
+    overall_keys = [(str(row["product_desc"]), str(row["category"]), str(row["division"])) for row in overall_rows]
+    branch_keys = [
+        (str(row["branch"]), str(row["product_desc"]), str(row["category"]), str(row["division"])) for row in branch_rows
+    ]
+    write_lineage(lineage_path(overall_path), [source_path], [overall_spans[key] for key in overall_keys])
+    write_lineage(lineage_path(branch_path), [source_path], [branch_spans[key] for key in branch_keys])
+
+
 def write_csv(path: Path, rows: List[Dict[str, object]]) -> None:
     if not rows:
         raise ValueError(f"No rows to write for {path}")
-    path.parent.mkdir(parents=True, exist_ok=True)
-    fieldnames = list(rows[0].keys())
-    with path.open("w", encoding="utf-8", newline="") as handle:
-        writer = csv.DictWriter(handle, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in rows:
-            writer.writerow({
-                k: round_or_none(v) if isinstance(v, float) else v
-                for k, v in row.items()
-            })
+    write_records(path, rows, float_digits=2)
 
 
 def parse_args() -> argparse.Namespace:
@@ -343,19 +553,91 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--overall-output", type=Path, default=default_overall, help="Overall menu engineering CSV path.")
     parser.add_argument("--branch-output", type=Path, default=default_branch, help="Branch-level menu engineering CSV path.")
     parser.add_argument("--summary-output", type=Path, default=default_summary, help="Branch summary CSV path.")
-    return parser.parse_args()
+    parser.add_argument(
+        "--partition-dir", type=Path, default=None, help="Also write the branch table as one CSV per branch plus a manifest."
+    )
+    parser.add_argument("--gzip-partitions", action="store_true", help="Gzip the per-branch partition files.")
+    parser.add_argument("--watch", action="store_true", help="Keep running and rebuild when the cleaned data changes.")
+    parser.add_argument("--interval", type=float, default=0.25, help="Polling interval in seconds for --watch.")
+    parser.add_argument("--cache-dir", type=Path, default=None, help="Result cache directory (default .cache/results).")
+    parser.add_argument("--no-cache", action="store_true", help="Always rebuild instead of reusing cached results.")
+    parser.add_argument(
+        "--engine",
+        choices=("memory", "external"),
+        default="memory",
+        help="external spills branch aggregates to disk past --max-groups and merge-sorts the branch table.",
+    )
+    parser.add_argument("--max-groups", type=int, default=200_000, help="Branch x product groups kept in memory (external engine).")
+    parser.add_argument("--spill-partitions", type=int, default=16, help="Hash partitions used when spilling.")
+    parser.add_argument("--spill-dir", type=Path, default=None, help="Directory for spill files (default: system temp).")
+    parser.add_argument(
+        "--money",
+        choices=MONEY_MODES,
+        default="float",
+        help="fixed sums amounts as integer cents (exact totals); float keeps the historical float sums.",
+    )
+    parser.add_argument(
+        "--lineage",
+        action="store_true",
+        help="Write a .lineage index next to the overall and branch tables mapping each row to its cleaned item rows.",
+    )
+    args = parser.parse_args()
+    if args.engine == "external" and (args.partition_dir is not None or args.watch or args.lineage):
+        parser.error("--partition-dir, --watch and --lineage need the in-memory engine")
+    return args
+
+
+def watch(args: argparse.Namespace) -> None:
+    outputs = (args.overall_output, args.branch_output, args.summary_output)
+    # Last written tables; a rebuild that produces identical rows leaves the report untouched.
+    previous: Dict[Path, List[Dict[str, object]]] = {}
+
+    def refresh(changed: Set[str]) -> None:
+        if SOURCE_FILENAME not in changed:
+            return
+        tables = build_menu_engineering_tables(args.cleaned_dir, args.money)
+        for path, rows in zip(outputs, tables):
+            if previous.get(path) != rows:
+                write_csv(path, rows)
+                previous[path] = rows
+
+    watch_directory(args.cleaned_dir, refresh, names=(SOURCE_FILENAME,), interval=args.interval)
 
 
 def main() -> None:
     args = parse_args()
-    overall_rows, branch_rows, branch_summary = build_menu_engineering_tables(args.cleaned_dir)
-    write_csv(args.overall_output, overall_rows)
-    write_csv(args.branch_output, branch_rows)
-    write_csv(args.summary_output, branch_summary)
+    if args.watch:
+        watch(args)
+        return
+    cache = None
+    if args.engine == "external":
+        with external_menu_engineering_tables(
+            args.cleaned_dir, args.max_groups, args.spill_partitions, args.spill_dir, args.money
+        ) as (overall_rows, branch_stream, branch_summary):
+            write_csv(args.overall_output, overall_rows)
+            branch_count = write_record_stream(args.branch_output, branch_stream, float_digits=2)
+            write_csv(args.summary_output, branch_summary)
+    else:
+        cache = open_cache(args.cache_dir, enabled=not args.no_cache)
+        overall_rows, branch_rows, branch_summary = cached_menu_engineering_tables(args.cleaned_dir, cache, args.money)
+        write_csv(args.overall_output, overall_rows)
+        write_csv(args.branch_output, branch_rows)
+        write_csv(args.summary_output, branch_summary)
+        branch_count = len(branch_rows)
+        if args.partition_dir is not None:
+            manifest = write_partitioned(
+                args.partition_dir, branch_rows, ["branch"], float_digits=2, compress=args.gzip_partitions
+            )
+            print(f"Branch partitions: {args.partition_dir} ({len(manifest['partitions'])} files)")
+        if args.lineage:
+            write_menu_lineage(args.cleaned_dir, overall_rows, branch_rows, args.overall_output, args.branch_output)
+            print(f"Lineage indexes: {lineage_path(args.overall_output)}, {lineage_path(args.branch_output)}")
 
     print(f"Overall menu table: {args.overall_output} ({len(overall_rows)} rows)")
-    print(f"Branch menu table: {args.branch_output} ({len(branch_rows)} rows)")
+    print(f"Branch menu table: {args.branch_output} ({branch_count} rows)")
     print(f"Branch summary table: {args.summary_output} ({len(branch_summary)} rows)")
+    if cache is not None:
+        print(f"Result cache: {cache.session}")
     print("Top 5 overall stars by total profit:")
     stars = [row for row in overall_rows if row.get("quadrant") == "star"][:5]
     for row in stars:
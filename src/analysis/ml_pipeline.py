@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""Regenerate the backend ML artifacts (backend/data/ml/*.json) from cleaned rep_00014 data.
+
+Every stage reads the same sparse product x branch matrix (product_matrix.ProductBranchMatrix)
+that the report scripts use, and the clustering, price-anomaly and availability stages call
+the shared report functions, so the dashboard and the CSV reports agree. The matrix is kept in the
+shared result cache.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from branch_clustering import cluster_branches
+from branch_identity import ALIAS_FILENAME, load_or_build_resolver
+from menu_engineering import SOURCE_FILENAME, aggregate_items
+from price_anomalies import detect_anomalies
+from product_matrix import ProductBranchMatrix, ProductKey
+from result_cache import ResultCache, cached, open_cache
+
+MODEL_NAME = "Ridge regression"
+
+
+class ProductAttributes:
+    """Interned category and division ids for the matrix's product rows."""
+
+    def __init__(self, matrix: ProductBranchMatrix) -> None:
+        categories, category_of = np.unique([key[1] for key in matrix.products], return_inverse=True)
+        divisions, division_of = np.unique([key[2] for key in matrix.products], return_inverse=True)
+        self.categories: List[str] = categories.tolist()
+        self.divisions: List[str] = divisions.tolist()
+        self.category_of = category_of.reshape(-1)
+        self.division_of = division_of.reshape(-1)
+
+
+def unit_price(matrix: ProductBranchMatrix) -> np.ndarray:
+    qty = matrix.layers["qty"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(qty > 0, matrix.layers["revenue"] / qty, np.nan)
+
+
+def load_product_matrix(cleaned_dir: Path, cache: Optional[ResultCache]) -> ProductBranchMatrix:
+    # Refresh the alias table first so the cache key sees the one the build will use.
+    load_or_build_resolver(cleaned_dir)
+    inputs = [cleaned_dir / SOURCE_FILENAME, cleaned_dir / ALIAS_FILENAME]
+    return cached(
+        cache,
+        "ml_product_matrix",
+        Path(__file__),
+        inputs,
+        lambda: ProductBranchMatrix.from_branch_aggregate(aggregate_items(cleaned_dir)[1]),
+    )
+
+
+# --- Residual margin model -------------------------------------------------------------
+
+
+def design_matrix(
+    matrix: ProductBranchMatrix, attrs: ProductAttributes, cells: np.ndarray, price: np.ndarray
+) -> Tuple[np.ndarray, Dict[str, slice]]:
+    """One-hot branch/product/division/category blocks plus standardized price and log qty."""
+    p_idx = matrix.rows[cells]
+    n = p_idx.shape[0]
+    blocks = [
+        ("branch", matrix.indices[cells], len(matrix.branches)),
+        ("product", p_idx, len(matrix.products)),
+        ("division", attrs.division_of[p_idx], len(attrs.divisions)),
+        ("category", attrs.category_of[p_idx], len(attrs.categories)),
+    ]
+    width = sum(size for _, _, size in blocks) + 3
+    X = np.zeros((n, width))
+    groups: Dict[str, slice] = {}
+    offset = 0
+    rows = np.arange(n)
+    for name, codes, size in blocks:
+        X[rows, offset + codes] = 1.0
+        groups[name] = slice(offset, offset + size)
+        offset += size
+
+    log_qty = np.log1p(matrix.layers["qty"][cells])
+    for name, values in (("unit_price", np.log(price[cells])), ("qty", log_qty)):
+        std = values.std()
+        X[:, offset] = (values - values.mean()) / (std if std > 0 else 1.0)
+        groups[name] = slice(offset, offset + 1)
+        offset += 1
+    X[:, offset] = 1.0  # intercept, left unpenalized
+    return X, groups
+
+
+def fit_ridge(X: np.ndarray, y: np.ndarray, alpha: float) -> np.ndarray:
+    penalty = np.full(X.shape[1], alpha)
+    penalty[-1] = 0.0
+    return np.linalg.solve(X.T @ X + np.diag(penalty), X.T @ y)
+
+
+def r2_score(y: np.ndarray, pred: np.ndarray) -> float:
+    ss_res = float(np.sum((y - pred) ** 2))
+    ss_tot = float(np.sum((y - y.mean()) ** 2))
+    return 1.0 - ss_res / ss_tot if ss_tot > 0 else 0.0
+
+
+def run_residual_model(
+    matrix: ProductBranchMatrix,
+    attrs: ProductAttributes,
+    alpha: float = 1.0,
+    folds: int = 5,
+    workers: int = 4,
+    top_n: int = 50,
+    min_qty: float = 100.0,
+    seed: int = 42,
+) -> Tuple[List[Dict[str, object]], Dict[str, object]]:
+    margin = matrix.layers["margin_pct"]
+    price = unit_price(matrix)
+    with np.errstate(invalid="ignore"):
+        keep = np.isfinite(margin) & (price > 0) & (margin >= -100) & (margin <= 100)
+    cells = np.nonzero(keep)[0]
+    y = margin[cells]
+    X, groups = design_matrix(matrix, attrs, cells, price)
+
+    rng = np.random.default_rng(seed)
+    fold_of = rng.permutation(len(y)) % folds
+
+    def score_fold(fold: int) -> float:
+        train = fold_of != fold
+        coef = fit_ridge(X[train], y[train], alpha)
+        return r2_score(y[~train], X[~train] @ coef)
+
+    coef = fit_ridge(X, y, alpha)
+    pred = X @ coef
+    base_r2 = r2_score(y, pred)
+
+    def permutation_drop(group: str) -> float:
+        cols = groups[group]
+        permuted = X.copy()
+        permuted[:, cols] = X[np.random.default_rng(seed).permutation(len(y))][:, cols]
+        return max(base_r2 - r2_score(y, permuted @ coef), 0.0)
+
+    # BLAS releases the GIL, so threads parallelize the folds without copying X per process.
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        fold_scores = list(pool.map(score_fold, range(folds)))
+        drops = dict(zip(groups, pool.map(permutation_drop, list(groups))))
+    total_drop = sum(drops.values()) or 1.0
+
+    revenue = matrix.layers["revenue"][cells]
+    qty = matrix.layers["qty"][cells]
+    profit = matrix.layers["profit"][cells]
+    gap = pred - y
+    uplift = np.where((gap > 0) & (qty >= min_qty), gap / 100 * revenue, 0.0)
+    order = np.argsort(-uplift, kind="stable")
+    residuals: List[Dict[str, object]] = []
+    for i in order[:top_n].tolist():
+        if uplift[i] <= 0:
+            break
+        product, category, division = matrix.products[int(matrix.rows[cells[i]])]
+        residuals.append(
+            {
+                "branch": matrix.branches[int(matrix.indices[cells[i]])],
+                "product_desc": product,
+                "division": division,
+                "category": category,
+                "actual_margin": round(float(y[i]), 2),
+                "pred_margin": round(float(pred[i]), 2),
+                "uplift_potential": round(float(uplift[i])),
+                "total_revenue": round(float(revenue[i])),
+                "total_profit": round(float(profit[i]), 2),
+                "qty": round(float(qty[i]), 1),
+                "gap_pct": round(float(gap[i]), 2),
+            }
+        )
+
+    stats = {
+        "model_r2": round(float(np.mean(fold_scores)), 4),
+        "model_r2_std": round(float(np.std(fold_scores)), 4),
+        "n_samples": int(len(y)),
+        "feature_importances": {name: round(drop / total_drop, 4) for name, drop in drops.items()},
+        "avg_margin_baseline": round(float(np.mean(y)), 3),
+        "pool": round(float(uplift.sum())),
+    }
+    return residuals, stats
+
+
+# --- Branch clustering -------------------------------------------------------------------
+
+
+def run_branch_clustering(
+    matrix: ProductBranchMatrix, cleaned_dir: Path, k: int = 0
+) -> Tuple[List[Dict[str, object]], List[Dict[str, object]], Dict[str, object]]:
+    """Dashboard view of branch_clustering.cluster_branches, so it and the CSV report share one fit.
+
+    Cluster labels, silhouettes and over-indexed divisions come from the report; revenue,
+    profit and the margin gap to the best peer cluster come from the product matrix.
+    """
+    cluster_rows, cluster_report, scores = cluster_branches(cleaned_dir, k=k)
+    label_of = {str(row["branch"]): int(row["cluster"]) for row in cluster_rows}
+    labels = np.array([label_of[branch] for branch in matrix.branches], dtype=np.int64)
+    revenue = matrix.column_sum("revenue")
+    profit = matrix.column_sum("profit")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margin = np.nan_to_num(profit / revenue * 100)
+
+    n_clusters = len(cluster_report)
+    counts = np.bincount(labels, minlength=n_clusters)
+    cluster_revenue = np.bincount(labels, weights=revenue, minlength=n_clusters)
+    cluster_profit = np.bincount(labels, weights=profit, minlength=n_clusters)
+    cluster_margin = np.bincount(labels, weights=margin, minlength=n_clusters) / counts
+    # Single-branch clusters are outliers, not a peer benchmark, unless nothing else exists.
+    candidates = np.where(counts >= 2, cluster_margin, -np.inf) if (counts >= 2).any() else cluster_margin
+    best_cluster = int(np.argmax(candidates))
+    best_margin = float(cluster_margin[best_cluster])
+
+    margin_gap = np.maximum(best_margin - margin, 0.0)
+    gap_lbp = margin_gap / 100 * revenue
+    branch_rows = [
+        {
+            "branch": matrix.branches[b],
+            "cluster": int(labels[b]),
+            "actual_margin": round(float(margin[b]), 3),
+            "margin_gap": round(float(margin_gap[b]), 3),
+            "gap_lbp": round(float(gap_lbp[b])),
+            "total_revenue": round(float(revenue[b])),
+            "total_profit": round(float(profit[b])),
+        }
+        for b in sorted(range(len(matrix.branches)), key=lambda b: matrix.branches[b])
+    ]
+    summary_rows = [
+        {
+            "cluster": c,
+            "n_branches": int(counts[c]),
+            "avg_margin": round(float(cluster_margin[c]), 3),
+            "avg_revenue": round(float(cluster_revenue[c] / counts[c])),
+            "avg_profit": round(float(cluster_profit[c] / counts[c])),
+            "avg_silhouette": cluster_report[c]["avg_silhouette"],
+        }
+        for c in range(n_clusters)
+    ]
+    drivers = str(cluster_report[best_cluster]["over_indexed_divisions"])
+    stats = {
+        "n_clusters": n_clusters,
+        "silhouette": round(scores[n_clusters], 4) if n_clusters in scores else None,
+        "best_cluster": best_cluster,
+        "best_cluster_margin": round(best_margin, 3),
+        "best_cluster_drivers": drivers.split("|") if drivers else [],
+        "pool": round(float(gap_lbp.sum())),
+    }
+    return branch_rows, summary_rows, stats
+
+
+# --- Price anomalies and availability gaps ----------------------------------------------------
+
+
+def run_price_anomalies(matrix: ProductBranchMatrix, top_n: int = 50) -> Tuple[List[Dict[str, object]], float]:
+    """Under-priced cells from price_anomalies.detect_anomalies; the target is the peer median price."""
+    under_priced = [
+        row
+        for row in detect_anomalies(matrix)
+        if "price" in str(row["flags"]).split("|") and float(row["price_leakage"] or 0.0) > 0
+    ]
+    under_priced.sort(key=lambda row: -float(row["price_leakage"]))
+    rows: List[Dict[str, object]] = []
+    for row in under_priced[:top_n]:
+        price, target = float(row["unit_price"]), float(row["peer_median_price"])
+        rows.append(
+            {
+                "product": row["product_desc"],
+                "branch": row["branch"],
+                "division": row["division"],
+                "category": row["category"],
+                "actual_price": round(price, 2),
+                "target_price": round(target, 2),
+                "gap_per_unit": round(target - price, 2),
+                "gap_pct": round((target - price) / target * 100, 1),
+                "qty": int(round(float(row["qty"]))),
+                "profit_gain": round(float(row["price_leakage"])),
+                "actual_margin": row["margin_pct"],
+            }
+        )
+    return rows, round(sum(float(row["price_leakage"]) for row in under_priced))
+
+
+def run_availability_gaps(
+    matrix: ProductBranchMatrix, min_coverage: float = 0.5, top_n: int = 50
+) -> Tuple[List[Dict[str, object]], float]:
+    """ProductBranchMatrix.availability_gaps rolled up per product (branches missing it, summed expected profit)."""
+    missing: Dict[ProductKey, List[float]] = defaultdict(lambda: [0, 0.0])
+    for gap in matrix.availability_gaps(min_coverage=min_coverage):
+        entry = missing[(str(gap["product_desc"]), str(gap["category"]), str(gap["division"]))]
+        entry[0] += 1
+        entry[1] += float(gap["expected_profit"] or 0.0)
+
+    n_present = matrix.row_counts()
+    profit = matrix.row_sum("profit")
+    revenue = matrix.row_sum("revenue")
+    rows: List[Dict[str, object]] = []
+    for key, (n_missing, expected) in sorted(missing.items(), key=lambda item: -item[1][1])[:top_n]:
+        r = matrix.product_ids[key]
+        rows.append(
+            {
+                "product": key[0],
+                "division": key[2],
+                "category": key[1],
+                "n_present": int(n_present[r]),
+                "n_missing": int(n_missing),
+                "avg_margin": round(float(profit[r] / revenue[r] * 100), 2) if revenue[r] > 0 else None,
+                "avg_profit_per_branch": round(float(profit[r] / n_present[r])),
+                "expected_profit": round(expected),
+                "total_current_profit": round(float(profit[r])),
+            }
+        )
+    return rows, round(sum(expected for _, expected in missing.values()))
+
+
+def build_product_catalog(matrix: ProductBranchMatrix, top_n: int = 150) -> List[Dict[str, object]]:
+    qty = matrix.row_sum("qty")
+    revenue = matrix.row_sum("revenue")
+    profit = matrix.row_sum("profit")
+    catalog: List[Dict[str, object]] = []
+    for p in np.argsort(-qty, kind="stable").tolist():
+        if qty[p] <= 0 or revenue[p] <= 0:
+            continue
+        product, category, division = matrix.products[p]
+        margin = round(float(profit[p] / revenue[p] * 100), 1)
+        catalog.append(
+            {
+                "product_desc": product,
+                "unit_price": int(round(float(revenue[p] / qty[p]))),
+                "avg_margin": margin,
+                "cost_pct": round(100 - margin, 1),
+                "total_qty": round(float(qty[p]), 1),
+                "category": category,
+                "division": division,
+            }
+        )
+        if len(catalog) >= top_n:
+            break
+    return catalog
+
+
+# --- Pipeline --------------------------------------------------------------------------------
+
+
+def run_pipeline(
+    cleaned_dir: Path,
+    output_dir: Path,
+    cache: Optional[ResultCache],
+    n_clusters: int = 0,
+    folds: int = 5,
+    workers: int = 4,
+) -> Dict[str, object]:
+    matrix = load_product_matrix(cleaned_dir, cache)
+    attrs = ProductAttributes(matrix)
+
+    residuals, model_stats = run_residual_model(matrix, attrs, folds=folds, workers=workers)
+    clusters, cluster_summary, cluster_stats = run_branch_clustering(matrix, cleaned_dir, k=n_clusters)
+    anomalies, price_pool = run_price_anomalies(matrix)
+    gaps, availability_pool = run_availability_gaps(matrix)
+    catalog = build_product_catalog(matrix)
+
+    metadata = {
+        "model_name": MODEL_NAME,
+        "model_r2": model_stats["model_r2"],
+        "model_r2_std": model_stats["model_r2_std"],
+        "n_samples": model_stats["n_samples"],
+        "n_branches": len(matrix.branches),
+        "n_products": len({key[0] for key in matrix.products}),
+        "feature_importances": model_stats["feature_importances"],
+        "total_profit_baseline": round(float(matrix.layers["profit"].sum())),
+        "total_revenue_baseline": round(float(matrix.layers["revenue"].sum())),
+        "avg_margin_baseline": model_stats["avg_margin_baseline"],
+        "pools": {
+            "margin_residual": model_stats["pool"],
+            "branch_mix": cluster_stats["pool"],
+            "price_standardization": price_pool,
+            "availability_gap": availability_pool,
+        },
+        "n_clusters": cluster_stats["n_clusters"],
+        "cluster_silhouette": cluster_stats["silhouette"],
+        "best_cluster": cluster_stats["best_cluster"],
+        "best_cluster_margin": cluster_stats["best_cluster_margin"],
+        "best_cluster_drivers": cluster_stats["best_cluster_drivers"],
+    }
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    indented = {
+        "metadata.json": metadata,
+        "margin_residuals.json": residuals,
+        "branch_clusters.json": clusters,
+        "cluster_summary.json": cluster_summary,
+        "price_anomalies.json": anomalies,
+        "availability_gaps.json": gaps,
+    }
+    for name, payload in indented.items():
+        (output_dir / name).write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    (output_dir / "product_catalog.json").write_text(json.dumps(catalog), encoding="utf-8")
+    (output_dir / "branches.json").write_text(json.dumps(sorted(matrix.branches)), encoding="utf-8")
+
+    return {"metadata": metadata, "shape": matrix.shape}
+
+
+def parse_args() -> argparse.Namespace:
+    repo_root = Path(__file__).resolve().parents[2]
+    default_cleaned = repo_root / "Archive" / "Stories_data" / "cleaned"
+    default_output = repo_root / "backend" / "data" / "ml"
+
+    parser = argparse.ArgumentParser(description="Regenerate backend ML artifacts.")
+    parser.add_argument("--cleaned-dir", type=Path, default=default_cleaned, help="Path to cleaned data directory.")
+    parser.add_argument("--output-dir", type=Path, default=default_output, help="Directory for the JSON artifacts.")
+    parser.add_argument("--cache-dir", type=Path, default=None, help="Result cache directory (default .cache/results).")
+    parser.add_argument("--no-cache", action="store_true", help="Always rebuild instead of reusing cached results.")
+    parser.add_argument("--clusters", type=int, default=0, help="Number of branch clusters (0 picks k by silhouette).")
+    parser.add_argument("--folds", type=int, default=5, help="Cross-validation folds for the residual model.")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel workers for cross-validation.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    cache = open_cache(args.cache_dir, enabled=not args.no_cache)
+    result = run_pipeline(
+        args.cleaned_dir,
+        args.output_dir,
+        cache,
+        n_clusters=args.clusters,
+        folds=args.folds,
+        workers=args.workers,
+    )
+    metadata = result["metadata"]
+    n_products, n_branches = result["shape"]
+    print(f"ML artifacts written to: {args.output_dir}")
+    print(f"Product matrix: {n_products} products x {n_branches} branches")
+    print(f"Residual model R2: {metadata['model_r2']} +/- {metadata['model_r2_std']}")
+    print(f"Branch clusters: {metadata['n_clusters']} (mean silhouette {metadata['cluster_silhouette']})")
+    print(f"Best cluster: {metadata['best_cluster']} (margin {metadata['best_cluster_margin']}%)")
+    for name, value in metadata["pools"].items():
+        print(f"  - {name} pool: {value}")
+    if cache is not None:
+        print(f"Result cache: {cache.session}")
+
+
+if __name__ == "__main__":
+    main()
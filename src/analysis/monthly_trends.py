@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""Build the branch x month growth matrix (YoY, MoM, rolling 3-month, seasonality) from rep_00134."""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import warnings
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from branch_identity import load_or_build_resolver
+from report_io import nan_to_none, open_text_input, round_or_none, write_records
+
+SOURCE_FILENAME = "rep_00134_comparative_monthly_sales_clean_long.csv"
+
+# growth_signal_basis values when no signal is reported.
+INSUFFICIENT_HISTORY = "insufficient_history"
+STALE_HISTORY = "stale_latest_month"
+
+MONTH_NAMES = [
+    "january",
+    "february",
+    "march",
+    "april",
+    "may",
+    "june",
+    "july",
+    "august",
+    "september",
+    "october",
+    "november",
+    "december",
+]
+
+
+def clean_text(value: str) -> str:
+    return " ".join((value or "").strip().split())
+
+
+def to_float(value: str) -> Optional[float]:
+    text = clean_text(value).replace(",", "")
+    if not text:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def read_rows(path: Path) -> Iterable[Dict[str, str]]:
+    with open_text_input(path) as handle:
+        yield from csv.DictReader(handle)
+
+
+@contextmanager
+def warnings_suppressed() -> Iterator[None]:
+    # Branches without any history produce all-NaN slices; that is expected here.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        yield
+
+
+def growth_pct(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result = (current / previous - 1.0) * 100.0
+    result[~np.isfinite(result)] = np.nan
+    return result
+
+
+def shift(matrix: np.ndarray, periods: int) -> np.ndarray:
+    """Shift along the time axis, padding the first `periods` columns with NaN."""
+    shifted = np.full_like(matrix, np.nan)
+    if periods < matrix.shape[1]:
+        shifted[:, periods:] = matrix[:, :-periods]
+    return shifted
+
+
+def rolling_sum(matrix: np.ndarray, window: int) -> np.ndarray:
+    """Trailing window sum; NaN unless every month in the window has sales."""
+    filled = np.nan_to_num(matrix, nan=0.0)
+    counts = np.cumsum(~np.isnan(matrix), axis=1)
+    sums = np.cumsum(filled, axis=1)
+    sums[:, window:] = sums[:, window:] - sums[:, :-window]
+    counts[:, window:] = counts[:, window:] - counts[:, :-window]
+    sums[counts < window] = np.nan
+    return sums
+
+
+class MonthlyTrends:
+    """Growth matrices for every branch over a contiguous monthly axis.
+
+    `sales` has shape (branches, years * 12); months with zero or missing sales are
+    NaN so that unopened branches and not-yet-reported months never count as growth.
+    """
+
+    def __init__(
+        self,
+        branches: List[str],
+        first_year: int,
+        sales: np.ndarray,
+        display_names: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.branches = branches
+        self.display_names = display_names or {}
+        self.first_year = first_year
+        self.sales = sales
+        self.mom = growth_pct(sales, shift(sales, 1))
+        self.yoy = growth_pct(sales, shift(sales, 12))
+        self.rolling_3m = rolling_sum(sales, 3)
+        self.rolling_3m_growth = growth_pct(self.rolling_3m, shift(self.rolling_3m, 3))
+        self.rolling_3m_yoy = growth_pct(self.rolling_3m, shift(self.rolling_3m, 12))
+
+        # Seasonality: calendar-month mean over years relative to the branch's mean month.
+        by_year = sales.reshape(len(branches), -1, 12)
+        with warnings_suppressed():
+            month_means = np.nanmean(by_year, axis=1)
+            self.seasonality = month_means / np.nanmean(month_means, axis=1, keepdims=True)
+
+        observed = ~np.isnan(sales)
+        has_any = observed.any(axis=1)
+        self.latest_index = np.where(has_any, sales.shape[1] - 1 - np.argmax(observed[:, ::-1], axis=1), -1)
+
+    @property
+    def n_periods(self) -> int:
+        return self.sales.shape[1]
+
+    def period_label(self, index: int) -> str:
+        year, month = divmod(index, 12)
+        return f"{self.first_year + year}-{month + 1:02d}"
+
+    def growth_signal(self, window: int = 3, min_yoy_months: int = 2) -> Tuple[np.ndarray, List[str]]:
+        """Growth per branch over the trailing `window` months, plus the basis it was measured on.
+
+        The window ends at the latest month any branch reported, so every branch is
+        measured over the same calendar months. When at least `min_yoy_months` of them
+        have sales in both years the signal is their summed YoY growth ("yoy_<n>m_matched",
+        n = months matched); otherwise it is the window's sales against the `window`
+        months before ("rolling_<window>m_sequential"), which is not seasonally adjusted.
+        A branch whose own latest month is older is "stale" (closed or not reporting),
+        one with neither measure is "insufficient_history"; both get NaN.
+        """
+        signal = np.full(len(self.branches), np.nan)
+        basis = [INSUFFICIENT_HISTORY] * len(self.branches)
+        if not (self.latest_index >= 0).any():
+            return signal, basis
+        last = int(self.latest_index.max())
+        months = np.arange(max(last - window + 1, 12), last + 1)
+        current = self.sales[:, months]
+        previous = self.sales[:, months - 12]
+        matched = ~np.isnan(current) & ~np.isnan(previous)
+        n_matched = matched.sum(axis=1)
+        current_sum = np.where(matched, current, 0.0).sum(axis=1)
+        previous_sum = np.where(matched, previous, 0.0).sum(axis=1)
+        yoy = growth_pct(current_sum, np.where(n_matched >= min_yoy_months, previous_sum, np.nan))
+        rolled = rolling_sum(self.sales, window)
+        sequential = growth_pct(rolled, shift(rolled, window))[:, last]
+
+        stale = (self.latest_index >= 0) & (self.latest_index < last)
+        for i in range(len(self.branches)):
+            if stale[i]:
+                basis[i] = STALE_HISTORY
+            elif not np.isnan(yoy[i]):
+                signal[i] = yoy[i]
+                basis[i] = f"yoy_{int(n_matched[i])}m_matched"
+            elif not np.isnan(sequential[i]):
+                signal[i] = sequential[i]
+                basis[i] = f"rolling_{window}m_sequential"
+        return signal, basis
+
+    def kpi_columns(self) -> Dict[str, Dict[str, object]]:
+        """Per-branch KPI columns keyed by branch key."""
+        rows = np.arange(len(self.branches))
+        latest = np.maximum(self.latest_index, 0)
+        signal, basis = self.growth_signal()
+        with warnings_suppressed():
+            recent_mom = self.mom[rows[:, None], np.maximum(latest[:, None] - np.arange(12)[None, :], 0)]
+            recent_mom[(latest[:, None] - np.arange(12)[None, :]) < 0] = np.nan
+            median_mom = np.nanmedian(recent_mom, axis=1)
+            peak = np.nanargmax(np.nan_to_num(self.seasonality, nan=-np.inf), axis=1)
+            trough = np.nanargmin(np.nan_to_num(self.seasonality, nan=np.inf), axis=1)
+            amplitude = np.nanmax(self.seasonality, axis=1) - np.nanmin(self.seasonality, axis=1)
+
+        columns: Dict[str, Dict[str, object]] = {}
+        for i, key in enumerate(self.branches):
+            has_history = self.latest_index[i] >= 0
+            columns[key] = {
+                "latest_sales_month": self.period_label(int(latest[i])) if has_history else None,
+                "latest_mom_growth_pct": round_or_none(nan_to_none(self.mom[i, latest[i]])) if has_history else None,
+                "latest_yoy_growth_pct": round_or_none(nan_to_none(self.yoy[i, latest[i]])) if has_history else None,
+                "rolling_3m_growth_pct": round_or_none(nan_to_none(self.rolling_3m_growth[i, latest[i]])) if has_history else None,
+                "median_mom_growth_pct_12m": round_or_none(nan_to_none(median_mom[i])),
+                "growth_signal_pct": round_or_none(nan_to_none(signal[i])),
+                "growth_signal_basis": basis[i],
+                "peak_sales_month": MONTH_NAMES[int(peak[i])] if has_history else None,
+                "trough_sales_month": MONTH_NAMES[int(trough[i])] if has_history else None,
+                "seasonality_amplitude": round_or_none(nan_to_none(amplitude[i]), 3),
+            }
+        return columns
+
+    def to_rows(self) -> List[Dict[str, object]]:
+        """Compact long table: one row per branch and month with observed sales."""
+        branch_idx, period_idx = np.nonzero(~np.isnan(self.sales))
+        rows: List[Dict[str, object]] = []
+        for i, t in zip(branch_idx.tolist(), period_idx.tolist()):
+            year, month = divmod(t, 12)
+            rows.append(
+                {
+                    "branch": self.display_names.get(self.branches[i], self.branches[i]),
+                    "year": self.first_year + year,
+                    "month_number": month + 1,
+                    "sales_amount": round_or_none(float(self.sales[i, t])),
+                    "mom_growth_pct": round_or_none(nan_to_none(self.mom[i, t])),
+                    "yoy_growth_pct": round_or_none(nan_to_none(self.yoy[i, t])),
+                    "rolling_3m_sales": round_or_none(nan_to_none(self.rolling_3m[i, t])),
+                    "rolling_3m_growth_pct": round_or_none(nan_to_none(self.rolling_3m_growth[i, t])),
+                    "rolling_3m_yoy_growth_pct": round_or_none(nan_to_none(self.rolling_3m_yoy[i, t])),
+                    "seasonality_index": round_or_none(nan_to_none(self.seasonality[i, month]), 4),
+                }
+            )
+        return rows
+
+
+def build_monthly_trends(cleaned_dir: Path) -> MonthlyTrends:
+    source_path = cleaned_dir / SOURCE_FILENAME
+    if not source_path.exists():
+        raise FileNotFoundError(f"Missing cleaned file: {source_path}")
+
+    resolver = load_or_build_resolver(cleaned_dir)
+    branch_index: Dict[str, int] = {}
+    cells: List[tuple] = []
+    for row in read_rows(source_path):
+        if clean_text(row.get("row_type", "")) != "branch" or clean_text(row.get("period_type", "")) != "month":
+            continue
+        key = resolver.resolve(row.get("branch", ""))
+        year = to_float(row.get("year", ""))
+        month = to_float(row.get("month_number", ""))
+        amount = to_float(row.get("sales_amount", ""))
+        if not key or year is None or month is None or amount is None:
+            continue
+        branch_index.setdefault(key, len(branch_index))
+        cells.append((branch_index[key], int(year), int(month), amount))
+
+    branches = list(branch_index)
+    display_names = {key: resolver.display_name(key) for key in branches}
+    if not cells:
+        return MonthlyTrends(branches, 0, np.full((len(branches), 12), np.nan), display_names)
+
+    data = np.array(cells, dtype=float)
+    first_year = int(data[:, 1].min())
+    n_years = int(data[:, 1].max()) - first_year + 1
+    sales = np.full((len(branches), n_years * 12), np.nan)
+    columns = ((data[:, 1] - first_year) * 12 + data[:, 2] - 1).astype(int)
+    amounts = data[:, 3]
+    # Zero months are unopened branches or periods not reported yet, not real sales.
+    amounts = np.where(amounts > 0, amounts, np.nan)
+    sales[data[:, 0].astype(int), columns] = amounts
+    return MonthlyTrends(branches, first_year, sales, display_names)
+
+
+def parse_args() -> argparse.Namespace:
+    repo_root = Path(__file__).resolve().parents[2]
+    default_cleaned = repo_root / "Archive" / "Stories_data" / "cleaned"
+    default_output = repo_root / "reports" / "branch_monthly_growth.csv"
+
+    parser = argparse.ArgumentParser(description="Build branch monthly growth matrix.")
+    parser.add_argument("--cleaned-dir", type=Path, default=default_cleaned, help="Path to cleaned data directory.")
+    parser.add_argument("--output", type=Path, default=default_output, help="Output CSV path.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    trends = build_monthly_trends(args.cleaned_dir)
+    rows = trends.to_rows()
+    write_records(args.output, rows)
+
+    print(f"Monthly growth table: {args.output} ({len(rows)} rows)")
+    print(f"Branches: {len(trends.branches)}, months: {trends.n_periods}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""Run the cleaning and analysis scripts as a dependency graph, skipping stages whose inputs did not change."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from report_io import atomic_output, file_digest, local_modules
+
+STATE_VERSION = 1
+
+
+class Stage:
+    """One script run: the files it reads, the files it writes and the code it executes."""
+
+    def __init__(self, name: str, script: Path, inputs: Sequence[Path], outputs: Sequence[Path], args: Sequence[str] = ()) -> None:
+        self.name = name
+        self.script = script
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.args = list(args)
+
+    def command(self) -> List[str]:
+        return [sys.executable, str(self.script), *self.args]
+
+    def code(self, module_dirs: Sequence[Path]) -> List[Path]:
+        return local_modules(self.script, module_dirs)
+
+
+def default_stages(repo_root: Path) -> List[Stage]:
+    stories = repo_root / "Archive" / "Stories_data"
+    cleaned = stories / "cleaned"
+    analysis = repo_root / "src" / "analysis"
+    reports = repo_root / "reports"
+
+    item_file = cleaned / "rep_00014_theoretical_profit_by_item_clean.csv"
+    wide_file = cleaned / "rep_00134_comparative_monthly_sales_clean_wide.csv"
+    long_file = cleaned / "rep_00134_comparative_monthly_sales_clean_long.csv"
+    group_file = cleaned / "rep_00191_sales_by_items_by_group_clean.csv"
+    category_file = cleaned / "rep_00673_theoretical_profit_by_category_clean.csv"
+    aliases = cleaned / "branch_aliases.json"
+    kpi_inputs = [item_file, wide_file, group_file, category_file, long_file, aliases]
+
+    return [
+        Stage(
+            "clean",
+            stories / "clean_stories_reports.py",
+            [
+                stories / "rep_s_00014_SMRY.csv",
+                stories / "REP_S_00134_SMRY.csv",
+                stories / "rep_s_00191_SMRY-3.csv",
+                stories / "rep_s_00673_SMRY.csv",
+            ],
+            [item_file, wide_file, long_file, group_file, category_file, aliases, cleaned / "cleaning_report.json"],
+        ),
+        Stage(
+            "menu_engineering",
+            analysis / "menu_engineering.py",
+            [item_file, aliases],
+            [
+                reports / "menu_engineering_overall.csv",
+                reports / "menu_engineering_by_branch.csv",
+                reports / "menu_engineering_branch_summary.csv",
+            ],
+        ),
+        Stage(
+            "branch_kpi",
+            analysis / "branch_kpi.py",
+            kpi_inputs,
+            [reports / "branch_kpis.csv", reports / "branch_monthly_growth.csv"],
+        ),
+        Stage("sales_forecast", analysis / "sales_forecast.py", [long_file, aliases], [reports / "branch_sales_forecast.csv"]),
+        Stage(
+            "product_matrix",
+            analysis / "product_matrix.py",
+            [item_file, aliases],
+            [
+                reports / "product_availability_gaps.csv",
+                reports / "product_margin_dispersion.csv",
+                reports / "branch_similarity.csv",
+            ],
+        ),
+        Stage("price_anomalies", analysis / "price_anomalies.py", [item_file, aliases], [reports / "price_margin_anomalies.csv"]),
+        Stage(
+            "price_elasticity",
+            analysis / "price_elasticity.py",
+            [item_file, aliases],
+            [reports / "price_elasticity.csv", reports / "price_recommendations.csv"],
+        ),
+        Stage("bundle_search", analysis / "bundle_search.py", [item_file, aliases], [reports / "bundle_candidates.csv"]),
+        Stage(
+            "shared_tables",
+            analysis / "shared_tables.py",
+            [
+                reports / "menu_engineering_overall.csv",
+                reports / "menu_engineering_by_branch.csv",
+                reports / "menu_engineering_branch_summary.csv",
+                reports / "branch_kpis.csv",
+                reports / "branch_monthly_growth.csv",
+            ],
+            [repo_root / ".cache" / "analysis_tables.bin"],
+        ),
+        Stage(
+            "branch_clustering",
+            analysis / "branch_clustering.py",
+            kpi_inputs,
+            [reports / "branch_clusters.csv", reports / "branch_cluster_summary.csv"],
+        ),
+    ]
+
+
+def stage_dependencies(stages: Sequence[Stage]) -> Dict[str, Set[str]]:
+    """A stage depends on every stage that writes one of its inputs; raises on cycles."""
+    producers: Dict[Path, str] = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers:
+                raise ValueError(f"{output} is written by both {producers[output]} and {stage.name}")
+            producers[output] = stage.name
+    deps = {
+        stage.name: {producers[path] for path in stage.inputs if path in producers and producers[path] != stage.name}
+        for stage in stages
+    }
+
+    visiting: Set[str] = set()
+    done: Set[str] = set()
+
+    def visit(name: str) -> None:
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle through stage {name}")
+        visiting.add(name)
+        for dep in deps[name]:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+
+    for name in deps:
+        visit(name)
+    return deps
+
+
+def stage_fingerprint(stage: Stage, module_dirs: Sequence[Path]) -> Dict[str, Dict[str, str]]:
+    return {
+        "inputs": {str(path): file_digest(path) if path.exists() else "missing" for path in stage.inputs},
+        "code": {str(path): file_digest(path) for path in stage.code(module_dirs)},
+    }
+
+
+def load_state(path: Path) -> Dict[str, object]:
+    try:
+        state = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return state.get("stages", {}) if state.get("version") == STATE_VERSION else {}
+
+
+def save_state(path: Path, stages: Dict[str, object]) -> None:
+    with atomic_output(path) as tmp_path:
+        tmp_path.write_text(json.dumps({"version": STATE_VERSION, "stages": stages}, indent=2), encoding="utf-8")
+
+
+def critical_path(deps: Dict[str, Set[str]], durations: Dict[str, float]) -> Tuple[float, List[str]]:
+    """Longest chain of stage durations through the graph."""
+    finish: Dict[str, Tuple[float, List[str]]] = {}
+
+    def longest(name: str) -> Tuple[float, List[str]]:
+        if name not in finish:
+            best: Tuple[float, List[str]] = (0.0, [])
+            for dep in deps[name]:
+                candidate = longest(dep)
+                if candidate[0] > best[0]:
+                    best = candidate
+            finish[name] = (best[0] + durations.get(name, 0.0), best[1] + [name])
+        return finish[name]
+
+    return max((longest(name) for name in deps), key=lambda item: item[0], default=(0.0, []))
+
+
+def run_pipeline(
+    stages: Sequence[Stage],
+    state_path: Path,
+    module_dirs: Sequence[Path],
+    force: bool = False,
+    workers: Optional[int] = None,
+    dry_run: bool = False,
+) -> Dict[str, Dict[str, object]]:
+    """Run stages as soon as their dependencies finish; returns status/seconds/output per stage.
+
+    A stage is skipped when its input and code hashes match the last successful run and
+    its outputs exist. Hashes are taken when a stage becomes ready, so a stage whose
+    upstream rewrote identical files is still skipped. Dependents of a failed stage are
+    marked blocked.
+    """
+    deps = stage_dependencies(stages)
+    by_name = {stage.name: stage for stage in stages}
+    state = load_state(state_path)
+    results: Dict[str, Dict[str, object]] = {}
+    remaining = set(by_name)
+    running: Dict[Future, Tuple[str, float]] = {}
+    started = time.perf_counter()
+
+    def launch(pool: ThreadPoolExecutor) -> None:
+        # Skipping a stage can make its dependents ready, so sweep until nothing changes.
+        progress = True
+        while progress:
+            progress = False
+            busy = {name for name, _ in running.values()}
+            for name in sorted(remaining):
+                if any(dep in remaining or dep in busy for dep in deps[name]):
+                    continue
+                remaining.discard(name)
+                progress = True
+                if any(results[dep]["status"] in ("failed", "blocked") for dep in deps[name]):
+                    results[name] = {"status": "blocked", "seconds": 0.0}
+                    continue
+                stage = by_name[name]
+                unchanged = state.get(name) == stage_fingerprint(stage, module_dirs) and all(
+                    path.exists() for path in stage.outputs
+                )
+                if dry_run or (unchanged and not force):
+                    results[name] = {"status": "skipped" if unchanged and not force else "would run", "seconds": 0.0}
+                    continue
+                future = pool.submit(subprocess.run, stage.command(), capture_output=True, text=True)
+                running[future] = (name, time.perf_counter())
+                busy.add(name)
+
+    with ThreadPoolExecutor(max_workers=workers or len(by_name) or 1) as pool:
+        launch(pool)
+        while running:
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, stage_started = running.pop(future)
+                completed = future.result()
+                ok = completed.returncode == 0
+                results[name] = {
+                    "status": "ran" if ok else "failed",
+                    "seconds": time.perf_counter() - stage_started,
+                    "start": stage_started - started,
+                    "output": (completed.stdout if ok else completed.stdout + completed.stderr).strip(),
+                }
+                if ok:
+                    # Hash after the run: a stage may refresh a derived input (e.g. the alias table).
+                    state[name] = stage_fingerprint(by_name[name], module_dirs)
+                else:
+                    state.pop(name, None)
+            launch(pool)
+
+    if not dry_run:
+        save_state(state_path, state)
+    results["_wall"] = {"status": "total", "seconds": time.perf_counter() - started}
+    return results
+
+
+def parse_args() -> argparse.Namespace:
+    repo_root = Path(__file__).resolve().parents[2]
+    parser = argparse.ArgumentParser(description="Run the cleaning and analysis stages as a dependency graph.")
+    parser.add_argument("--stages", default=None, help="Comma-separated subset of stages to run (default: all).")
+    parser.add_argument("--force", action="store_true", help="Run every selected stage even if its inputs are unchanged.")
+    parser.add_argument("--dry-run", action="store_true", help="Only report which stages would run.")
+    parser.add_argument("--workers", type=int, default=None, help="Maximum stages running at once.")
+    parser.add_argument("--verbose", action="store_true", help="Print each stage's output.")
+    parser.add_argument(
+        "--state", type=Path, default=repo_root / ".cache" / "pipeline_state.json", help="Where stage fingerprints are kept."
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    repo_root = Path(__file__).resolve().parents[2]
+    stages = default_stages(repo_root)
+    if args.stages:
+        selected = {name.strip() for name in args.stages.split(",") if name.strip()}
+        unknown = selected - {stage.name for stage in stages}
+        if unknown:
+            raise SystemExit(f"Unknown stages: {', '.join(sorted(unknown))}")
+        stages = [stage for stage in stages if stage.name in selected]
+
+    module_dirs = [repo_root / "src" / "analysis"]
+    results = run_pipeline(stages, args.state, module_dirs, force=args.force, workers=args.workers, dry_run=args.dry_run)
+    wall = float(results.pop("_wall")["seconds"])
+    deps = stage_dependencies(stages)
+
+    for stage in stages:
+        result = results[stage.name]
+        after = f" after {', '.join(sorted(deps[stage.name]))}" if deps[stage.name] else ""
+        print(f"  - {stage.name}: {result['status']} ({float(result['seconds']):.2f}s){after}")
+        if result["status"] == "failed" or (args.verbose and result.get("output")):
+            for line in str(result.get("output", "")).splitlines():
+                print(f"      {line}")
+
+    durations = {name: float(result["seconds"]) for name, result in results.items()}
+    length, path = critical_path(deps, durations)
+    print(f"Critical path: {' -> '.join(path) or '-'} ({length:.2f}s)")
+    print(f"Wall time: {wall:.2f}s, serial stage time: {sum(durations.values()):.2f}s")
+    if any(result["status"] in ("failed", "blocked") for result in results.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
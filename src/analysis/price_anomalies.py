@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Cross-branch price, cost and margin anomalies using robust (median/MAD) z-scores."""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from menu_engineering import aggregate_items
+from product_matrix import ProductBranchMatrix
+from report_io import nan_to_none, round_or_none, write_records
+
+# Scales MAD (and mean absolute deviation) to a standard deviation under normality.
+MAD_SCALE = 1.4826
+MEAN_AD_SCALE = 1.2533
+# Floors on the robust scale: a share of the median (price/cost) and an absolute amount.
+# Without them float noise around an exact median reads as a huge z-score.
+REL_SCALE_FLOOR = 0.005
+MONEY_SCALE_FLOOR = 0.01
+MARGIN_SCALE_FLOOR = 0.1
+
+
+def robust_z(
+    matrix: ProductBranchMatrix, values: np.ndarray, rel_floor: float = 0.0, abs_floor: float = 0.0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-cell robust z-score against the cell's product row, plus the row medians.
+
+    Falls back to the mean absolute deviation when more than half the branches share
+    the median value (MAD == 0). The scale never drops below rel_floor * |median| or
+    abs_floor, so a product with (almost) no spread scores (almost) 0.
+    """
+    rows = matrix.rows
+    median = matrix.row_median(values)
+    deviation = np.abs(values - median[rows])
+    mad = matrix.row_median(deviation) * MAD_SCALE
+    valid = ~np.isnan(deviation)
+    counts = np.bincount(rows[valid], minlength=matrix.shape[0])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_ad = np.bincount(rows[valid], weights=deviation[valid], minlength=matrix.shape[0]) / counts
+    scale = np.where(mad > 0, mad, mean_ad * MEAN_AD_SCALE)
+    scale = np.fmax(scale, np.fmax(rel_floor * np.abs(median), abs_floor))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(scale[rows] > 0, (values - median[rows]) / scale[rows], 0.0)
+    z[np.isnan(values)] = np.nan
+    return z, median
+
+
+def detect_anomalies(
+    matrix: ProductBranchMatrix,
+    z_threshold: float = 3.5,
+    min_branches: int = 3,
+    min_qty: float = 1.0,
+    min_deviation_pct: float = 5.0,
+    min_margin_points: float = 2.0,
+) -> List[Dict[str, object]]:
+    """Flag cells whose unit price, unit cost or margin is far from the product's peers.
+
+    A flag needs both a robust z beyond `z_threshold` and a material gap: price or
+    cost at least `min_deviation_pct` off the peer median (and one cent), margin at
+    least `min_margin_points` percentage points off.
+    All products are scored in one grouped pass over the CSR cells. Leakage is the
+    profit lost versus the peer median: under-pricing (median price - price) and
+    over-costing (cost - median cost), each times the branch's qty.
+    """
+    qty = matrix.layers["qty"]
+    revenue = matrix.layers["revenue"]
+    profit = matrix.layers["profit"]
+    usable = qty >= min_qty
+    with np.errstate(divide="ignore", invalid="ignore"):
+        unit_price = np.where(usable, revenue / qty, np.nan)
+        unit_cost = np.where(usable, (revenue - profit) / qty, np.nan)
+    margin = np.where(usable, matrix.layers["margin_pct"], np.nan)
+
+    price_z, price_median = robust_z(matrix, unit_price, REL_SCALE_FLOOR, MONEY_SCALE_FLOOR)
+    cost_z, cost_median = robust_z(matrix, unit_cost, REL_SCALE_FLOOR, MONEY_SCALE_FLOOR)
+    margin_z, margin_median = robust_z(matrix, margin, abs_floor=MARGIN_SCALE_FLOOR)
+
+    rows = matrix.rows
+    peers = np.bincount(rows[usable], minlength=matrix.shape[0])
+    enough_peers = peers[rows] >= min_branches
+    price_leakage = np.nan_to_num(np.maximum(price_median[rows] - unit_price, 0.0) * qty)
+    cost_leakage = np.nan_to_num(np.maximum(unit_cost - cost_median[rows], 0.0) * qty)
+    at_stake = price_leakage + cost_leakage
+
+    def material(values: np.ndarray, median: np.ndarray) -> np.ndarray:
+        gap = np.abs(values - median[rows])
+        with np.errstate(invalid="ignore"):
+            return np.nan_to_num(gap) >= np.fmax(min_deviation_pct / 100 * np.abs(median[rows]), MONEY_SCALE_FLOOR)
+
+    with np.errstate(invalid="ignore"):
+        margin_material = np.nan_to_num(np.abs(margin - margin_median[rows])) >= min_margin_points
+    price_flag = (np.abs(np.nan_to_num(price_z)) >= z_threshold) & material(unit_price, price_median)
+    cost_flag = (np.abs(np.nan_to_num(cost_z)) >= z_threshold) & material(unit_cost, cost_median)
+    margin_flag = (np.abs(np.nan_to_num(margin_z)) >= z_threshold) & margin_material
+    flagged = enough_peers & usable & (price_flag | cost_flag | margin_flag)
+
+    cells = np.nonzero(flagged)[0]
+    cells = cells[np.argsort(-at_stake[cells], kind="stable")]
+    anomalies: List[Dict[str, object]] = []
+    for i in cells.tolist():
+        r = int(rows[i])
+        product, category, division = matrix.products[r]
+        flags = [name for name, hit in (("price", price_flag[i]), ("cost", cost_flag[i]), ("margin", margin_flag[i])) if hit]
+        anomalies.append(
+            {
+                "branch": matrix.branches[int(matrix.indices[i])],
+                "product_desc": product,
+                "category": category,
+                "division": division,
+                "qty": round_or_none(float(qty[i])),
+                "peer_branches": int(peers[r]),
+                "unit_price": round_or_none(nan_to_none(unit_price[i])),
+                "peer_median_price": round_or_none(nan_to_none(price_median[r])),
+                "price_z": round_or_none(nan_to_none(price_z[i])),
+                "unit_cost": round_or_none(nan_to_none(unit_cost[i])),
+                "peer_median_cost": round_or_none(nan_to_none(cost_median[r])),
+                "cost_z": round_or_none(nan_to_none(cost_z[i])),
+                "margin_pct": round_or_none(nan_to_none(margin[i])),
+                "peer_median_margin_pct": round_or_none(nan_to_none(margin_median[r])),
+                "margin_z": round_or_none(nan_to_none(margin_z[i])),
+                "price_leakage": round_or_none(float(price_leakage[i])),
+                "cost_leakage": round_or_none(float(cost_leakage[i])),
+                "profit_at_stake": round_or_none(float(at_stake[i])),
+                "flags": "|".join(flags),
+            }
+        )
+    return anomalies
+
+
+def parse_args() -> argparse.Namespace:
+    repo_root = Path(__file__).resolve().parents[2]
+    default_cleaned = repo_root / "Archive" / "Stories_data" / "cleaned"
+    default_output = repo_root / "reports" / "price_margin_anomalies.csv"
+
+    parser = argparse.ArgumentParser(description="Detect cross-branch price and margin anomalies.")
+    parser.add_argument("--cleaned-dir", type=Path, default=default_cleaned, help="Path to cleaned data directory.")
+    parser.add_argument("--output", type=Path, default=default_output, help="Output CSV path.")
+    parser.add_argument("--z-threshold", type=float, default=3.5, help="Robust z-score cut-off.")
+    parser.add_argument("--min-branches", type=int, default=3, help="Minimum branches selling a product.")
+    parser.add_argument(
+        "--min-deviation-pct", type=float, default=5.0, help="Smallest price/cost gap to the peer median that is flagged."
+    )
+    parser.add_argument(
+        "--min-margin-points", type=float, default=2.0, help="Smallest margin gap (percentage points) that is flagged."
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    _, branch_aggregate = aggregate_items(args.cleaned_dir)
+    matrix = ProductBranchMatrix.from_branch_aggregate(branch_aggregate)
+    anomalies = detect_anomalies(
+        matrix,
+        z_threshold=args.z_threshold,
+        min_branches=args.min_branches,
+        min_deviation_pct=args.min_deviation_pct,
+        min_margin_points=args.min_margin_points,
+    )
+    write_records(args.output, anomalies)
+
+    total_at_stake = sum(float(row["profit_at_stake"] or 0.0) for row in anomalies)
+    print(f"Anomaly table: {args.output} ({len(anomalies)} rows)")
+    print(f"Profit at stake: {round_or_none(total_at_stake)}")
+    print("Top 5 by profit at stake:")
+    for row in anomalies[:5]:
+        print(f"  - {row['product_desc']} @ {row['branch']} [{row['flags']}]: {row['profit_at_stake']}")
+
+
+if __name__ == "__main__":
+    main()
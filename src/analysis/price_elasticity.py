@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""Cross-branch log-log price elasticities with category shrinkage, and the profit-maximising price per branch."""
+
+from __future__ import annotations
+
+import argparse
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from menu_engineering import aggregate_items
+from product_matrix import ProductBranchMatrix
+from report_io import nan_to_none, round_or_none, write_records
+
+# Smallest within-product spread of log price (summed squares) that identifies a slope.
+MIN_PRICE_VARIATION = 1e-4
+# One-sided 95%: an own slope counts only when its upper bound is still below zero.
+IDENTIFIED_Z = 1.645
+# Recommendation status of a branch x product cell; only RECOMMENDED carries a price.
+RECOMMENDED = "recommended"
+UNIDENTIFIED = "unidentified"
+INELASTIC = "inelastic"
+BEYOND_RANGE = "beyond_search_range"
+
+
+class ElasticityFit:
+    """Per-product raw and shrunk elasticities plus the per-cell unit economics they were fit on."""
+
+    def __init__(
+        self,
+        matrix: ProductBranchMatrix,
+        valid: np.ndarray,
+        price: np.ndarray,
+        unit_cost: np.ndarray,
+        branches: np.ndarray,
+        raw: np.ndarray,
+        std_error: np.ndarray,
+        category_elasticity: np.ndarray,
+        weight: np.ndarray,
+        elasticity: np.ndarray,
+        identified: np.ndarray,
+    ) -> None:
+        self.matrix = matrix
+        self.valid = valid
+        self.price = price
+        self.unit_cost = unit_cost
+        self.branches = branches
+        self.raw = raw
+        self.std_error = std_error
+        self.category_elasticity = category_elasticity
+        self.weight = weight
+        self.elasticity = elasticity
+        self.identified = identified
+
+
+def fit_elasticities(matrix: ProductBranchMatrix, min_branches: int = 3, prior_sd: float = 0.5) -> ElasticityFit:
+    """Fit log(qty share) = a_p + b_p log(price) for every product at once, then shrink b_p.
+
+    Qty is taken as a share of the branch's total qty so branch size does not read as
+    demand. The per-product slopes come from grouped sums (bincount) over the CSR cells.
+    Each slope is pulled toward its category's pooled within-product slope with weight
+    prior_sd^2 / (prior_sd^2 + se^2). Cross-branch price gaps are only a few percent, so
+    most own fits are noisy and stay near the category; products without a usable fit
+    take the category value outright.
+
+    A product is identified only when its own slope is significantly negative
+    (slope + z * se < 0) and the shrunk value is negative too. Upward slopes are kept as
+    estimated but never identified: across branches they reflect branch mix (premium
+    branches charge and sell more), not a demand curve.
+    """
+    n_products = matrix.shape[0]
+    qty = matrix.layers["qty"]
+    revenue = matrix.layers["revenue"]
+    cost = revenue - matrix.layers["profit"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        price = np.where(qty > 0, revenue / qty, np.nan)
+        unit_cost = np.where(qty > 0, cost / qty, np.nan)
+    valid = (qty > 0) & (price > 0)
+    branch_qty = np.bincount(matrix.indices[valid], weights=qty[valid], minlength=matrix.shape[1])
+
+    rows = matrix.rows[valid]
+    x = np.log(price[valid])
+    y = np.log(qty[valid] / branch_qty[matrix.indices[valid]])
+    count = np.bincount(rows, minlength=n_products)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dx = x - (np.bincount(rows, weights=x, minlength=n_products) / count)[rows]
+        dy = y - (np.bincount(rows, weights=y, minlength=n_products) / count)[rows]
+    sxx = np.bincount(rows, weights=dx * dx, minlength=n_products)
+    sxy = np.bincount(rows, weights=dx * dy, minlength=n_products)
+    syy = np.bincount(rows, weights=dy * dy, minlength=n_products)
+
+    fitted = (count >= max(min_branches, 3)) & (sxx > MIN_PRICE_VARIATION)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        raw = np.where(fitted, sxy / sxx, np.nan)
+        sse = np.maximum(syy - raw * sxy, 0.0)
+        variance = np.where(fitted, sse / (count - 2) / sxx, np.nan)
+
+    categories = [category for _, category, _ in matrix.products]
+    names = sorted(set(categories))
+    category_ids = np.array([names.index(name) for name in categories], dtype=np.int64)
+    n_categories = len(names)
+    fit_ids = category_ids[fitted]
+
+    pooled_sxx = np.bincount(fit_ids, weights=sxx[fitted], minlength=n_categories)
+    pooled_sxy = np.bincount(fit_ids, weights=sxy[fitted], minlength=n_categories)
+    global_slope = sxy[fitted].sum() / sxx[fitted].sum() if fitted.any() else 0.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        category_slope = np.where(pooled_sxx > 0, pooled_sxy / pooled_sxx, global_slope)
+
+    prior = category_slope[category_ids]
+    tau2 = prior_sd * prior_sd
+    weight = np.where(fitted, tau2 / (tau2 + variance), 0.0)
+    elasticity = prior + weight * np.nan_to_num(raw - prior)
+    std_error = np.sqrt(variance)
+    with np.errstate(invalid="ignore"):
+        identified = fitted & (raw + IDENTIFIED_Z * std_error < 0) & (elasticity < 0)
+    return ElasticityFit(
+        matrix, valid, price, unit_cost, count, raw, std_error, prior, weight, elasticity, identified
+    )
+
+
+def optimal_prices(
+    fit: ElasticityFit, max_change: float = 0.2, steps: int = 41
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Profit-maximising price of every valid cell over a grid of +/- `max_change` around today's price.
+
+    Demand follows the fitted constant-elasticity curve q = q0 (p / p0)^e, so one
+    (cells x candidates) array evaluates every price for every product and branch.
+    That curve only has an interior optimum (p* = c e / (1 + e)) when e < -1; for
+    e >= -1 the argmax is always the top of the grid, which recommendation_rows
+    reports as a status instead of a price.
+    Returns the chosen price, expected qty, expected profit and the grid index per cell.
+    """
+    multipliers = np.linspace(1.0 - max_change, 1.0 + max_change, steps)
+    cells = np.nonzero(fit.valid)[0]
+    p0 = fit.price[cells]
+    q0 = fit.matrix.layers["qty"][cells]
+    cost = fit.unit_cost[cells]
+    e = fit.elasticity[fit.matrix.rows[cells]]
+
+    candidate_price = p0[:, None] * multipliers[None, :]
+    candidate_qty = q0[:, None] * multipliers[None, :] ** e[:, None]
+    candidate_profit = candidate_qty * (candidate_price - cost[:, None])
+    best = np.argmax(candidate_profit, axis=1)
+    pick = np.arange(cells.size)
+    return candidate_price[pick, best], candidate_qty[pick, best], candidate_profit[pick, best], best
+
+
+def elasticity_rows(fit: ElasticityFit) -> List[Dict[str, object]]:
+    rows: List[Dict[str, object]] = []
+    for r, (product, category, division) in enumerate(fit.matrix.products):
+        e = float(fit.elasticity[r])
+        identified = bool(fit.identified[r])
+        rows.append(
+            {
+                "product_desc": product,
+                "category": category,
+                "division": division,
+                "branches_priced": int(fit.branches[r]),
+                "raw_elasticity": round_or_none(nan_to_none(float(fit.raw[r])), 4),
+                "std_error": round_or_none(nan_to_none(float(fit.std_error[r])), 4),
+                "category_elasticity": round_or_none(float(fit.category_elasticity[r]), 4),
+                "shrinkage_weight": round_or_none(float(fit.weight[r]), 4),
+                "elasticity": round_or_none(e, 4),
+                "identified": identified,
+                # What a simulator's volume boost should be for a 10% discount on this curve.
+                "volume_change_pct_at_10pct_discount": round_or_none((0.9 ** e - 1.0) * 100) if identified else None,
+            }
+        )
+    rows.sort(key=lambda row: (str(row["category"]), str(row["division"]), str(row["product_desc"])))
+    return rows
+
+
+def recommendation_status(fit: ElasticityFit, cells: np.ndarray, best: np.ndarray, steps: int) -> List[str]:
+    product_rows = fit.matrix.rows[cells]
+    identified = fit.identified[product_rows]
+    elastic = fit.elasticity[product_rows] < -1.0
+    at_bound = (best == 0) | (best == steps - 1)
+    status = np.where(
+        ~identified, UNIDENTIFIED, np.where(~elastic, INELASTIC, np.where(at_bound, BEYOND_RANGE, RECOMMENDED))
+    )
+    return status.tolist()
+
+
+def recommendation_rows(fit: ElasticityFit, max_change: float = 0.2, steps: int = 41) -> List[Dict[str, object]]:
+    """One row per priced cell; the optimal price and its expected outcome are filled only when recommended."""
+    matrix = fit.matrix
+    price, qty, profit, best = optimal_prices(fit, max_change, steps)
+    cells = np.nonzero(fit.valid)[0]
+    current_profit = matrix.layers["profit"][cells]
+    statuses = recommendation_status(fit, cells, best, steps)
+
+    rows: List[Dict[str, object]] = []
+    for i, cell in enumerate(cells.tolist()):
+        product, category, division = matrix.products[matrix.rows[cell]]
+        p0 = float(fit.price[cell])
+        recommended = statuses[i] == RECOMMENDED
+        rows.append(
+            {
+                "branch": matrix.branches[matrix.indices[cell]],
+                "product_desc": product,
+                "category": category,
+                "division": division,
+                "elasticity": round_or_none(float(fit.elasticity[matrix.rows[cell]]), 4),
+                "current_price": round_or_none(p0),
+                "unit_cost": round_or_none(float(fit.unit_cost[cell])),
+                "status": statuses[i],
+                "optimal_price": round_or_none(float(price[i])) if recommended else None,
+                "price_change_pct": round_or_none((float(price[i]) / p0 - 1.0) * 100) if recommended else None,
+                "current_qty": round_or_none(float(matrix.layers["qty"][cell])),
+                "expected_qty": round_or_none(float(qty[i])) if recommended else None,
+                "current_profit": round_or_none(float(current_profit[i])),
+                "expected_profit": round_or_none(float(profit[i])) if recommended else None,
+                "profit_gain": round_or_none(float(profit[i] - current_profit[i])) if recommended else None,
+            }
+        )
+    rows.sort(
+        key=lambda row: (
+            row["status"] != RECOMMENDED,
+            -float(row["profit_gain"] or 0.0),
+            str(row["branch"]),
+            str(row["product_desc"]),
+        )
+    )
+    return rows
+
+
+def parse_args() -> argparse.Namespace:
+    repo_root = Path(__file__).resolve().parents[2]
+    default_cleaned = repo_root / "Archive" / "Stories_data" / "cleaned"
+    reports = repo_root / "reports"
+
+    parser = argparse.ArgumentParser(description="Estimate price elasticities across branches and search for profit-maximising prices.")
+    parser.add_argument("--cleaned-dir", type=Path, default=default_cleaned, help="Path to cleaned data directory.")
+    parser.add_argument(
+        "--output", type=Path, default=reports / "price_elasticity.csv", help="Per-product elasticity CSV path."
+    )
+    parser.add_argument(
+        "--recommendations-output",
+        type=Path,
+        default=reports / "price_recommendations.csv",
+        help="Per-branch optimal price CSV path.",
+    )
+    parser.add_argument("--min-branches", type=int, default=3, help="Minimum priced branches for a product's own fit.")
+    parser.add_argument(
+        "--prior-sd", type=float, default=0.5, help="Expected spread of product elasticities around their category's."
+    )
+    parser.add_argument("--max-change", type=float, default=0.2, help="Largest relative price move searched (0.2 = +/-20%%).")
+    parser.add_argument("--steps", type=int, default=41, help="Candidate prices in the search grid.")
+    args = parser.parse_args()
+    if not 0 < args.max_change < 1:
+        parser.error("--max-change must be between 0 and 1")
+    if args.steps < 2:
+        parser.error("--steps must be at least 2")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    _, branch_aggregate = aggregate_items(args.cleaned_dir)
+    matrix = ProductBranchMatrix.from_branch_aggregate(branch_aggregate)
+    fit = fit_elasticities(matrix, min_branches=args.min_branches, prior_sd=args.prior_sd)
+    elasticities = elasticity_rows(fit)
+    recommendations = recommendation_rows(fit, args.max_change, args.steps)
+    write_records(args.output, elasticities)
+    write_records(args.recommendations_output, recommendations)
+
+    own_fits = int(np.isfinite(fit.raw).sum())
+    recommended = [row for row in recommendations if row["status"] == RECOMMENDED]
+    statuses = Counter(str(row["status"]) for row in recommendations)
+    total_gain = sum(float(row["profit_gain"] or 0.0) for row in recommended)
+    print(
+        f"Elasticity table: {args.output} ({len(elasticities)} products, {own_fits} with their own fit, "
+        f"{int(fit.identified.sum())} identified)"
+    )
+    print(f"Price recommendations: {args.recommendations_output} ({len(recommendations)} rows)")
+    print("  " + ", ".join(f"{status}={count}" for status, count in sorted(statuses.items())))
+    print(f"Expected profit gain over recommended cells: {round_or_none(total_gain)}")
+    print("Top 5 by profit gain:")
+    for row in recommended[:5]:
+        print(
+            f"  - {row['product_desc']} @ {row['branch']}: {row['current_price']} -> {row['optimal_price']} "
+            f"(e={row['elasticity']}, +{row['profit_gain']})"
+        )
+
+
+if __name__ == "__main__":
+    main()
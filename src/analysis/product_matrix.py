@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""Sparse product x branch matrix (CSR layout) for availability and cross-branch benchmarking."""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Dict, List, Mapping, Tuple
+
+import numpy as np
+
+from menu_engineering import aggregate_items
+from report_io import nan_to_none, round_or_none, write_records
+
+ProductKey = Tuple[str, str, str]
+
+
+class ProductBranchMatrix:
+    """CSR arrays over interned product rows and branch columns.
+
+    Row `r` owns the stored cells `indptr[r]:indptr[r + 1]`; `indices` holds their
+    branch ids (sorted within each row) and each layer holds one value per cell.
+    Absent cells mean the branch does not carry the product.
+    """
+
+    LAYERS = ("qty", "revenue", "profit", "margin_pct")
+
+    def __init__(
+        self,
+        products: List[ProductKey],
+        branches: List[str],
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        layers: Dict[str, np.ndarray],
+    ) -> None:
+        self.products = products
+        self.branches = branches
+        self.product_ids = {key: i for i, key in enumerate(products)}
+        self.branch_ids = {name: i for i, name in enumerate(branches)}
+        self.indptr = indptr
+        self.indices = indices
+        self.layers = layers
+        # Row id of every stored cell, for segment reductions.
+        self.rows = np.repeat(np.arange(len(products), dtype=np.int32), np.diff(indptr))
+
+    @classmethod
+    def from_branch_aggregate(
+        cls, branch_aggregate: Mapping[Tuple[str, str, str, str], Mapping[str, object]]
+    ) -> "ProductBranchMatrix":
+        product_ids: Dict[ProductKey, int] = {}
+        branch_ids: Dict[str, int] = {}
+        n = len(branch_aggregate)
+        row = np.empty(n, dtype=np.int32)
+        col = np.empty(n, dtype=np.int32)
+        qty = np.empty(n)
+        revenue = np.empty(n)
+        profit = np.empty(n)
+        for i, ((branch, product, category, division), values) in enumerate(branch_aggregate.items()):
+            row[i] = product_ids.setdefault((product, category, division), len(product_ids))
+            col[i] = branch_ids.setdefault(branch, len(branch_ids))
+            qty[i] = float(values["qty"])
+            revenue[i] = float(values["true_revenue"])
+            profit[i] = float(values["total_profit"])
+
+        order = np.lexsort((col, row))
+        counts = np.bincount(row, minlength=len(product_ids))
+        indptr = np.zeros(len(product_ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        revenue = revenue[order]
+        profit = profit[order]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            margin = np.where(revenue > 0, profit / revenue * 100, np.nan)
+        layers = {"qty": qty[order], "revenue": revenue, "profit": profit, "margin_pct": margin}
+        return cls(list(product_ids), list(branch_ids), indptr, col[order], layers)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.products), len(self.branches)
+
+    @property
+    def nnz(self) -> int:
+        return int(self.indices.shape[0])
+
+    def row_counts(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def row_sum(self, layer: str) -> np.ndarray:
+        return np.bincount(self.rows, weights=self.layers[layer], minlength=self.shape[0])
+
+    def column_sum(self, layer: str) -> np.ndarray:
+        return np.bincount(self.indices, weights=self.layers[layer], minlength=self.shape[1])
+
+    def to_dense(self, layer: str, fill: float = 0.0) -> np.ndarray:
+        dense = np.full(self.shape, fill)
+        dense[self.rows, self.indices] = self.layers[layer]
+        return dense
+
+    def missing_cells(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(row, column) of every absent cell in `rows`, row-major, read from the gaps between stored indices."""
+        n_branches = self.shape[1]
+        counts = self.row_counts()[rows]
+        first = np.cumsum(counts) - counts
+        cell = np.repeat(self.indptr[rows], counts) + np.arange(int(counts.sum())) - np.repeat(first, counts)
+        # Each row's stored columns followed by a sentinel at n_branches; the run before an entry is absent.
+        ends = np.cumsum(counts + 1) - 1
+        upper = np.full(ends[-1] + 1 if rows.size else 0, n_branches, dtype=np.int64)
+        stored = np.ones(upper.shape[0], dtype=bool)
+        stored[ends] = False
+        upper[stored] = self.indices[cell]
+        lower = np.empty_like(upper)
+        lower[1:] = upper[:-1] + 1
+        lower[ends - counts] = 0
+        length = upper - lower
+        gap_rows = np.repeat(np.repeat(rows, counts + 1), length)
+        offsets = np.arange(int(length.sum())) - np.repeat(np.cumsum(length) - length, length)
+        return gap_rows, np.repeat(lower, length) + offsets
+
+    def row_median(self, values: np.ndarray) -> np.ndarray:
+        """Median of per-cell `values` within each row (NaN cells ignored)."""
+        valid = ~np.isnan(values)
+        rows = self.rows[valid]
+        sorted_values = values[valid][np.lexsort((values[valid], rows))]
+        counts = np.bincount(rows, minlength=self.shape[0])
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        lo = starts + (counts - 1) // 2
+        hi = starts + counts // 2
+        medians = np.full(self.shape[0], np.nan)
+        has = counts > 0
+        medians[has] = (sorted_values[lo[has]] + sorted_values[hi[has]]) / 2
+        return medians
+
+    def availability_gaps(self, min_coverage: float = 0.5, min_popularity_index: float = 1.0) -> List[Dict[str, object]]:
+        """Branches that do not carry a product their peers sell well.
+
+        A product qualifies when at least `min_coverage` of branches carry it and its
+        median qty share among carriers is at least `min_popularity_index` times the
+        typical product's share. Expected qty/profit for a missing branch scale the
+        carriers' median qty share and median profit per unit to that branch's volume.
+        """
+        n_products, n_branches = self.shape
+        qty = self.layers["qty"]
+        profit = self.layers["profit"]
+        branch_qty = self.column_sum("qty")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            qty_share = np.where(branch_qty[self.indices] > 0, qty / branch_qty[self.indices], np.nan)
+            ppu = np.where(qty > 0, profit / qty, np.nan)
+        median_share = self.row_median(qty_share)
+        median_ppu = self.row_median(ppu)
+        typical_share = np.nanmedian(median_share) if n_products else np.nan
+
+        coverage = self.row_counts() / max(n_branches, 1)
+        eligible = (
+            (coverage >= min_coverage)
+            & (coverage < 1.0)
+            & (median_share >= min_popularity_index * typical_share)
+            & (median_ppu > 0)
+        )
+        gap_rows, gap_cols = self.missing_cells(np.nonzero(eligible)[0])
+        expected_qty = median_share[gap_rows] * branch_qty[gap_cols]
+        expected_profit = expected_qty * median_ppu[gap_rows]
+
+        order = np.argsort(-expected_profit, kind="stable")
+        gaps: List[Dict[str, object]] = []
+        for r, c, q, p in zip(
+            gap_rows[order].tolist(), gap_cols[order].tolist(), expected_qty[order].tolist(), expected_profit[order].tolist()
+        ):
+            product, category, division = self.products[r]
+            gaps.append(
+                {
+                    "branch": self.branches[c],
+                    "product_desc": product,
+                    "category": category,
+                    "division": division,
+                    "branches_carrying": int(self.indptr[r + 1] - self.indptr[r]),
+                    "peer_median_qty_share_pct": round_or_none(float(median_share[r]) * 100, 4),
+                    "peer_median_profit_per_unit": round_or_none(float(median_ppu[r])),
+                    "expected_qty": round_or_none(q),
+                    "expected_profit": round_or_none(p),
+                }
+            )
+        return gaps
+
+    def margin_dispersion(self, min_branches: int = 2) -> List[Dict[str, object]]:
+        """Per-product spread of profit margin across the branches that sell it."""
+        margin = self.layers["margin_pct"]
+        revenue = self.layers["revenue"]
+        valid = ~np.isnan(margin)
+        rows = self.rows[valid]
+        m = margin[valid]
+        w = revenue[valid]
+        n_products = self.shape[0]
+
+        count = np.bincount(rows, minlength=n_products)
+        total = np.bincount(rows, weights=m, minlength=n_products)
+        total_sq = np.bincount(rows, weights=m * m, minlength=n_products)
+        weight = np.bincount(rows, weights=w, minlength=n_products)
+        weighted = np.bincount(rows, weights=m * w, minlength=n_products)
+        minimum = np.full(n_products, np.inf)
+        maximum = np.full(n_products, -np.inf)
+        np.minimum.at(minimum, rows, m)
+        np.maximum.at(maximum, rows, m)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = total / count
+            std = np.sqrt(np.maximum(total_sq / count - mean * mean, 0.0))
+            weighted_mean = weighted / weight
+        median = self.row_median(np.where(valid, margin, np.nan))
+
+        rows_out: List[Dict[str, object]] = []
+        for r in np.argsort(-np.where(count >= min_branches, std, -1.0), kind="stable").tolist():
+            if count[r] < min_branches:
+                break
+            product, category, division = self.products[r]
+            rows_out.append(
+                {
+                    "product_desc": product,
+                    "category": category,
+                    "division": division,
+                    "branches": int(count[r]),
+                    "margin_mean_pct": round_or_none(float(mean[r])),
+                    "margin_weighted_pct": round_or_none(nan_to_none(weighted_mean[r])),
+                    "margin_median_pct": round_or_none(nan_to_none(median[r])),
+                    "margin_std_pct": round_or_none(float(std[r])),
+                    "margin_min_pct": round_or_none(float(minimum[r])),
+                    "margin_max_pct": round_or_none(float(maximum[r])),
+                    "margin_range_pct": round_or_none(float(maximum[r] - minimum[r])),
+                }
+            )
+        return rows_out
+
+    def branch_similarity(self, layer: str = "qty") -> np.ndarray:
+        """Cosine similarity of branches' product-mix vectors, shape (n_branches, n_branches).
+
+        The Gram matrix is summed over the pairs of stored cells within each product row,
+        so the cost follows the stored cells rather than products x branches.
+        """
+        n_branches = self.shape[1]
+        values = np.nan_to_num(self.layers[layer])
+        totals = np.bincount(self.indices, weights=values, minlength=n_branches)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            shares = np.where(totals[self.indices] != 0, values / totals[self.indices], 0.0)
+        counts = self.row_counts()
+        pairs = counts * counts
+        local = np.arange(int(pairs.sum())) - np.repeat(np.cumsum(pairs) - pairs, pairs)
+        width = np.repeat(counts, pairs)
+        left = np.repeat(self.indptr[:-1], pairs) + local // width
+        right = np.repeat(self.indptr[:-1], pairs) + local % width
+        gram = np.bincount(
+            self.indices[left] * n_branches + self.indices[right],
+            weights=shares[left] * shares[right],
+            minlength=n_branches * n_branches,
+        ).reshape(n_branches, n_branches)
+        norms = np.sqrt(np.diag(gram))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarity = gram / np.outer(norms, norms)
+        return np.nan_to_num(similarity)
+
+    def similarity_rows(self, layer: str = "qty", top_k: int = 3) -> List[Dict[str, object]]:
+        similarity = self.branch_similarity(layer)
+        np.fill_diagonal(similarity, -np.inf)
+        nearest = np.argsort(-similarity, axis=1, kind="stable")[:, :top_k]
+        rows: List[Dict[str, object]] = []
+        for b, name in enumerate(self.branches):
+            for rank, other in enumerate(nearest[b].tolist(), start=1):
+                if not np.isfinite(similarity[b, other]):
+                    continue
+                rows.append(
+                    {
+                        "branch": name,
+                        "rank": rank,
+                        "similar_branch": self.branches[other],
+                        "cosine_similarity": round_or_none(float(similarity[b, other]), 4),
+                    }
+                )
+        return rows
+
+
+def parse_args() -> argparse.Namespace:
+    repo_root = Path(__file__).resolve().parents[2]
+    default_cleaned = repo_root / "Archive" / "Stories_data" / "cleaned"
+    reports = repo_root / "reports"
+
+    parser = argparse.ArgumentParser(description="Cross-branch availability and benchmarking reports.")
+    parser.add_argument("--cleaned-dir", type=Path, default=default_cleaned, help="Path to cleaned data directory.")
+    parser.add_argument("--gaps-output", type=Path, default=reports / "product_availability_gaps.csv")
+    parser.add_argument("--dispersion-output", type=Path, default=reports / "product_margin_dispersion.csv")
+    parser.add_argument("--similarity-output", type=Path, default=reports / "branch_similarity.csv")
+    parser.add_argument("--min-coverage", type=float, default=0.5, help="Share of branches that must carry a product.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    _, branch_aggregate = aggregate_items(args.cleaned_dir)
+    matrix = ProductBranchMatrix.from_branch_aggregate(branch_aggregate)
+
+    gaps = matrix.availability_gaps(min_coverage=args.min_coverage)
+    dispersion = matrix.margin_dispersion()
+    similarity = matrix.similarity_rows()
+    write_records(args.gaps_output, gaps)
+    write_records(args.dispersion_output, dispersion)
+    write_records(args.similarity_output, similarity)
+
+    n_products, n_branches = matrix.shape
+    density = matrix.nnz / max(n_products * n_branches, 1) * 100
+    print(f"Matrix: {n_products} products x {n_branches} branches, {matrix.nnz} cells ({density:.1f}% dense)")
+    print(f"Availability gaps: {args.gaps_output} ({len(gaps)} rows)")
+    print(f"Margin dispersion: {args.dispersion_output} ({len(dispersion)} rows)")
+    print(f"Branch similarity: {args.similarity_output} ({len(similarity)} rows)")
+
+
+if __name__ == "__main__":
+    main()
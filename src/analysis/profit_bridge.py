@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""Profit bridge: split profit differences into price, unit-cost, volume and mix effects."""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from branch_identity import load_or_build_resolver
+from menu_engineering import aggregate_items
+from product_matrix import ProductBranchMatrix, ProductKey
+from report_io import round_or_none, write_records
+
+EFFECTS = ("price_effect", "cost_effect", "volume_effect", "mix_effect", "other_effect")
+LEVELS = ("product", "division", "category", "branch")
+# One bridge: (label, base-side branch, current-side branch).
+BridgePair = Tuple[str, str, str]
+
+
+def aligned_layers(
+    matrix: ProductBranchMatrix, products: Dict[ProductKey, int], branches: Dict[str, int]
+) -> Dict[str, np.ndarray]:
+    """Dense (branch x product) qty/revenue/cost over a shared index; absent cells are 0."""
+    rows = np.array([branches[name] for name in matrix.branches], dtype=np.int64)[matrix.indices]
+    cols = np.array([products[key] for key in matrix.products], dtype=np.int64)[matrix.rows]
+    layers = {}
+    for name, values in (
+        ("qty", matrix.layers["qty"]),
+        ("revenue", matrix.layers["revenue"]),
+        ("cost", matrix.layers["revenue"] - matrix.layers["profit"]),
+    ):
+        dense = np.zeros((len(branches), len(products)))
+        dense[rows, cols] = values
+        layers[name] = dense
+    return layers
+
+
+def bridge_effects(
+    q0: np.ndarray, r0: np.ndarray, k0: np.ndarray, q1: np.ndarray, r1: np.ndarray, k1: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """Effects per cell of (bridge x product) arrays of qty, revenue and cost; each row is one bridge.
+
+    With unit price p, unit cost c, unit margin m = p - c, bridge total qty Q and share s = q / Q:
+        price  =  q1 (p1 - p0)
+        cost   = -q1 (c1 - c0)
+        volume = (Q1 - Q0) s0 m0
+        mix    =  Q1 (s1 - s0) m0
+    A product sold on one side only borrows that side's price and cost for the other,
+    so new items land entirely in mix and dropped items in volume + mix. Profit booked
+    without positive qty (returns, zero-qty modifiers) cannot be priced and goes to
+    `other`, which makes the effects add up to the profit change exactly.
+    """
+    sold0 = q0 > 0
+    sold1 = q1 > 0
+    q0 = np.where(sold0, q0, 0.0)
+    q1 = np.where(sold1, q1, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p0 = np.where(sold0, r0 / q0, np.nan)
+        c0 = np.where(sold0, k0 / q0, np.nan)
+        p1 = np.where(sold1, r1 / q1, np.nan)
+        c1 = np.where(sold1, k1 / q1, np.nan)
+    p0, c0 = np.where(sold0, p0, p1), np.where(sold0, c0, c1)
+    p1, c1 = np.where(sold1, p1, p0), np.where(sold1, c1, c0)
+    m0 = np.nan_to_num(p0 - c0)
+
+    total0 = q0.sum(axis=1, keepdims=True)
+    total1 = q1.sum(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s0 = np.where(total0 > 0, q0 / total0, 0.0)
+        s1 = np.where(total1 > 0, q1 / total1, 0.0)
+
+    effects = {
+        "price_effect": np.nan_to_num(q1 * (p1 - p0)),
+        "cost_effect": np.nan_to_num(-q1 * (c1 - c0)),
+        "volume_effect": (total1 - total0) * s0 * m0,
+        "mix_effect": total1 * (s1 - s0) * m0,
+    }
+    other = ((r1 - k1) - (r0 - k0)) - sum(effects.values())
+    # Float noise from the subtraction is not a real unexplained amount.
+    effects["other_effect"] = np.where(np.abs(other) < 1e-6, 0.0, other)
+    return effects
+
+
+def group_matrix(labels: Sequence[Tuple[str, ...]]) -> Tuple[List[Tuple[str, ...]], np.ndarray]:
+    """Distinct labels and a (product x group) one-hot matrix, so a roll-up is one matmul."""
+    groups = sorted(set(labels))
+    ids = {label: i for i, label in enumerate(groups)}
+    onehot = np.zeros((len(labels), len(groups)))
+    onehot[np.arange(len(labels)), [ids[label] for label in labels]] = 1.0
+    return groups, onehot
+
+
+def build_bridges(
+    base: ProductBranchMatrix,
+    current: ProductBranchMatrix,
+    pairs: Sequence[BridgePair],
+    lowest_level: str = "product",
+) -> List[Dict[str, object]]:
+    """Bridge rows for every pair, from `lowest_level` up to the branch total, in one array pass."""
+    products: Dict[ProductKey, int] = {}
+    for key in (*current.products, *base.products):
+        products.setdefault(key, len(products))
+    branch_names = sorted({*base.branches, *current.branches})
+    branches = {name: i for i, name in enumerate(branch_names)}
+    base_layers = aligned_layers(base, products, branches)
+    current_layers = aligned_layers(current, products, branches)
+
+    base_rows = np.array([branches[base_branch] for _, base_branch, _ in pairs], dtype=np.int64)
+    current_rows = np.array([branches[branch] for _, _, branch in pairs], dtype=np.int64)
+    q0, r0, k0 = (base_layers[name][base_rows] for name in ("qty", "revenue", "cost"))
+    q1, r1, k1 = (current_layers[name][current_rows] for name in ("qty", "revenue", "cost"))
+    values = bridge_effects(q0, r0, k0, q1, r1, k1)
+    values.update({"qty_before": q0, "qty_after": q1, "profit_before": r0 - k0, "profit_after": r1 - k1})
+
+    keys = list(products)
+    # Product keys are (product, category, division); roll up through division, category, branch.
+    level_labels = {
+        "product": [(category, division, product) for product, category, division in keys],
+        "division": [(category, division, "") for _, category, division in keys],
+        "category": [(category, "", "") for _, category, _ in keys],
+        "branch": [("", "", "") for _ in keys],
+    }
+    active = (q0 != 0) | (q1 != 0) | (r0 - k0 != 0) | (r1 - k1 != 0)
+
+    rows: List[Dict[str, object]] = []
+    for level in LEVELS[LEVELS.index(lowest_level):]:
+        groups, onehot = group_matrix(level_labels[level])
+        totals = {name: array @ onehot for name, array in values.items()}
+        present = active.astype(float) @ onehot > 0
+        for s, (label, base_branch, branch) in enumerate(pairs):
+            for g in np.nonzero(present[s])[0].tolist():
+                category, division, product = groups[g]
+                row: Dict[str, object] = {
+                    "bridge": label,
+                    "base_branch": base_branch,
+                    "branch": branch,
+                    "level": level,
+                    "category": category,
+                    "division": division,
+                    "product_desc": product,
+                    "qty_before": float(totals["qty_before"][s, g]),
+                    "qty_after": float(totals["qty_after"][s, g]),
+                    "profit_before": float(totals["profit_before"][s, g]),
+                    "profit_after": float(totals["profit_after"][s, g]),
+                    "profit_change": float(totals["profit_after"][s, g] - totals["profit_before"][s, g]),
+                }
+                row.update({name: float(totals[name][s, g]) for name in EFFECTS})
+                rows.append(row)
+    rows.sort(key=lambda row: (str(row["bridge"]), LEVELS.index(str(row["level"])), -abs(float(row["profit_change"]))))
+    return rows
+
+
+def parse_args() -> argparse.Namespace:
+    repo_root = Path(__file__).resolve().parents[2]
+    default_cleaned = repo_root / "Archive" / "Stories_data" / "cleaned"
+    default_output = repo_root / "reports" / "profit_bridge.csv"
+
+    parser = argparse.ArgumentParser(description="Split profit differences into price, cost, volume and mix effects.")
+    parser.add_argument("--cleaned-dir", type=Path, default=default_cleaned, help="Cleaned data of the current period.")
+    parser.add_argument(
+        "--base-dir", type=Path, default=None, help="Cleaned data of the base period (default: same as --cleaned-dir)."
+    )
+    parser.add_argument(
+        "--base-branch", default=None, help="Bridge every branch against this branch instead of against itself."
+    )
+    parser.add_argument("--branches", default=None, help="Comma-separated branches to bridge (default: all).")
+    parser.add_argument("--level", choices=LEVELS, default="product", help="Lowest level written to the output.")
+    parser.add_argument("--output", type=Path, default=default_output, help="Bridge CSV path.")
+    args = parser.parse_args()
+    if args.base_dir is None and args.base_branch is None:
+        parser.error("give --base-dir (period bridge), --base-branch (branch bridge) or both")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    base_dir = args.base_dir or args.cleaned_dir
+    current = ProductBranchMatrix.from_branch_aggregate(aggregate_items(args.cleaned_dir)[1])
+    base = current if base_dir == args.cleaned_dir else ProductBranchMatrix.from_branch_aggregate(aggregate_items(base_dir)[1])
+
+    resolver = load_or_build_resolver(args.cleaned_dir)
+    base_branch = resolver.canonical_name(args.base_branch) if args.base_branch else None
+    if base_branch is not None and base_branch not in base.branches:
+        raise SystemExit(f"Base branch not found: {args.base_branch}")
+    if args.branches:
+        selected = [resolver.canonical_name(name) for name in args.branches.split(",") if name.strip()]
+    else:
+        selected = sorted({*current.branches, *(base.branches if base_branch is None else [])})
+    known = {*base.branches, *current.branches}
+    unknown = [name for name in selected if name not in known]
+    if unknown:
+        raise SystemExit(f"Branches not found: {', '.join(unknown)}")
+    pairs = [
+        (f"{branch} vs {base_branch}" if base_branch else branch, base_branch or branch, branch)
+        for branch in selected
+        if branch != base_branch or base_dir != args.cleaned_dir
+    ]
+
+    rows = build_bridges(base, current, pairs, args.level)
+    write_records(args.output, rows, float_digits=2)
+    print(f"Profit bridge: {args.output} ({len(rows)} rows, {len(pairs)} bridges)")
+    for row in rows:
+        if row["level"] != "branch":
+            continue
+        effects = ", ".join(f"{name.replace('_effect', '')}={round_or_none(float(row[name]))}" for name in EFFECTS)
+        print(f"  - {row['bridge']}: change={round_or_none(float(row['profit_change']))} ({effects})")
+
+
+if __name__ == "__main__":
+    main()
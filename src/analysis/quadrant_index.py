@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Re-threshold menu-engineering quadrants without rebuilding: sorted per-scope index + binary search."""
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from menu_engineering import cached_menu_engineering_tables
+from report_io import round_or_none, write_records
+from result_cache import open_cache
+
+# Quadrant code = 2 * high_popularity + high_margin; -1 is unclassified (no qty).
+QUADRANTS = ("dog", "puzzle", "plowhorse", "star")
+UNCLASSIFIED = -1
+
+Threshold = Tuple[str, float]
+
+
+def parse_threshold(text: str) -> Threshold:
+    """'median', 'mean', 'p<percentile>' (e.g. p75) or an absolute number."""
+    text = text.strip().lower()
+    if text == "median":
+        return ("percentile", 50.0)
+    if text == "mean":
+        return ("mean", 0.0)
+    if text.startswith("p"):
+        return ("percentile", float(text[1:]))
+    return ("absolute", float(text))
+
+
+class SortedScopes:
+    """One metric's classifiable values sorted within each scope, plus each row's rank in its scope."""
+
+    def __init__(self, values: np.ndarray, scope: np.ndarray, valid: np.ndarray, n_scopes: int) -> None:
+        rows = np.nonzero(valid)[0]
+        order = rows[np.lexsort((values[rows], scope[rows]))]
+        self.sorted_values = values[order]
+        self.counts = np.bincount(scope[rows], minlength=n_scopes)
+        self.starts = np.concatenate([[0], np.cumsum(self.counts)[:-1]])
+        self.sums = np.bincount(scope[rows], weights=values[rows], minlength=n_scopes)
+        self.scope = scope
+        # Rows outside `valid` keep rank -1 and are never "high".
+        self.rank = np.full(len(values), -1, dtype=np.int64)
+        self.rank[order] = np.arange(len(order)) - np.repeat(self.starts, self.counts)
+
+    def thresholds(self, spec: Threshold) -> np.ndarray:
+        kind, value = spec
+        n_scopes = len(self.counts)
+        if kind == "absolute":
+            return np.full(n_scopes, value)
+        if kind == "mean":
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return np.where(self.counts > 0, self.sums / self.counts, 0.0)
+        if kind != "percentile":
+            raise ValueError(f"Unknown threshold kind: {kind}")
+        # Linear interpolation between order statistics; p50 equals statistics.median.
+        position = np.clip(value, 0.0, 100.0) / 100.0 * np.maximum(self.counts - 1, 0)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, np.maximum(self.counts - 1, 0))
+        empty = self.counts == 0
+        last = max(len(self.sorted_values) - 1, 0)
+        low_values = self.sorted_values[np.minimum(self.starts + lower, last)] if len(self.sorted_values) else np.zeros(n_scopes)
+        high_values = self.sorted_values[np.minimum(self.starts + upper, last)] if len(self.sorted_values) else np.zeros(n_scopes)
+        result = low_values + (high_values - low_values) * (position - lower)
+        return np.where(empty, 0.0, result)
+
+    def cut_ranks(self, thresholds: np.ndarray) -> np.ndarray:
+        """Per scope, the rank of the first value >= threshold (binary search in the scope's slice)."""
+        cuts = np.empty(len(self.counts), dtype=np.int64)
+        for s, (start, count) in enumerate(zip(self.starts.tolist(), self.counts.tolist())):
+            cuts[s] = np.searchsorted(self.sorted_values[start:start + count], thresholds[s], side="left")
+        return cuts
+
+    def high(self, spec: Threshold) -> Tuple[np.ndarray, np.ndarray]:
+        thresholds = self.thresholds(spec)
+        cuts = self.cut_ranks(thresholds)
+        return (self.rank >= 0) & (self.rank >= cuts[self.scope]), thresholds
+
+
+class QuadrantIndex:
+    """Quadrant what-ifs over menu-engineering rows for the global scope or each branch."""
+
+    def __init__(self, rows: Sequence[Dict[str, object]], scope_field: Optional[str] = None) -> None:
+        self.products = [str(row["product_desc"]) for row in rows]
+        scope_names = [str(row[scope_field]) if scope_field else "ALL" for row in rows]
+        self.scopes = sorted(set(scope_names))
+        scope_ids = {name: i for i, name in enumerate(self.scopes)}
+        self.scope = np.array([scope_ids[name] for name in scope_names], dtype=np.int64)
+        self.qty = np.array([float(row["qty"]) for row in rows])
+        self.profit = np.array([float(row["total_profit"]) for row in rows])
+        self.ppu = np.array([np.nan if row["profit_per_unit"] is None else float(row["profit_per_unit"]) for row in rows])
+
+        n_scopes = len(self.scopes)
+        # Same populations as add_global_quadrants/add_branch_quadrants use for their medians.
+        self.qty_index = SortedScopes(self.qty, self.scope, self.qty > 0, n_scopes)
+        self.ppu_index = SortedScopes(self.ppu, self.scope, ~np.isnan(self.ppu), n_scopes)
+        self.classifiable = (self.qty > 0) & ~np.isnan(self.ppu)
+
+    @classmethod
+    def from_tables(cls, cleaned_dir: Path, cache_dir: Optional[Path] = None, use_cache: bool = True) -> Tuple["QuadrantIndex", "QuadrantIndex"]:
+        """Global index over the overall table and per-branch index over the branch table."""
+        overall_rows, branch_rows, _ = cached_menu_engineering_tables(cleaned_dir, open_cache(cache_dir, enabled=use_cache))
+        return cls(overall_rows), cls(branch_rows, scope_field="branch")
+
+    def classify(self, qty_spec: Threshold, ppu_spec: Threshold) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Quadrant code per row, plus the qty and ppu thresholds per scope."""
+        high_pop, qty_thresholds = self.qty_index.high(qty_spec)
+        high_margin, ppu_thresholds = self.ppu_index.high(ppu_spec)
+        codes = np.where(self.classifiable, 2 * high_pop.astype(np.int64) + high_margin, UNCLASSIFIED)
+        return codes, qty_thresholds, ppu_thresholds
+
+    def what_if(self, qty_spec: Threshold, ppu_spec: Threshold, with_members: bool = False) -> List[Dict[str, object]]:
+        """Per scope and quadrant: thresholds, item count, profit, qty (and product list)."""
+        codes, qty_thresholds, ppu_thresholds = self.classify(qty_spec, ppu_spec)
+        n_scopes, n_quadrants = len(self.scopes), len(QUADRANTS)
+        cell = np.where(codes >= 0, self.scope * n_quadrants + codes, -1)
+        valid = cell >= 0
+        size = n_scopes * n_quadrants
+        counts = np.bincount(cell[valid], minlength=size).reshape(n_scopes, n_quadrants)
+        profit = np.bincount(cell[valid], weights=self.profit[valid], minlength=size).reshape(n_scopes, n_quadrants)
+        qty = np.bincount(cell[valid], weights=self.qty[valid], minlength=size).reshape(n_scopes, n_quadrants)
+
+        members: Dict[int, List[str]] = {}
+        if with_members:
+            order = np.argsort(-self.profit, kind="stable")
+            for i in order[valid[order]].tolist():
+                members.setdefault(int(cell[i]), []).append(self.products[i])
+
+        results: List[Dict[str, object]] = []
+        for s, scope in enumerate(self.scopes):
+            for q, quadrant in enumerate(QUADRANTS):
+                row: Dict[str, object] = {
+                    "scope": scope,
+                    "quadrant": quadrant,
+                    "qty_threshold": round_or_none(float(qty_thresholds[s])),
+                    "ppu_threshold": round_or_none(float(ppu_thresholds[s])),
+                    "items": int(counts[s, q]),
+                    "total_profit": round_or_none(float(profit[s, q])),
+                    "qty": round_or_none(float(qty[s, q])),
+                }
+                if with_members:
+                    row["products"] = "|".join(members.get(s * n_quadrants + q, []))
+                results.append(row)
+        return results
+
+
+def parse_args() -> argparse.Namespace:
+    repo_root = Path(__file__).resolve().parents[2]
+    default_cleaned = repo_root / "Archive" / "Stories_data" / "cleaned"
+
+    parser = argparse.ArgumentParser(description="Quadrant counts and profit for alternative thresholds.")
+    parser.add_argument("--cleaned-dir", type=Path, default=default_cleaned, help="Path to cleaned data directory.")
+    parser.add_argument("--qty", default="median", help="Popularity cut: median, mean, p<N> or an absolute qty.")
+    parser.add_argument("--ppu", default="median", help="Profit-per-unit cut: median, mean, p<N> or an absolute value.")
+    parser.add_argument("--scope", choices=("overall", "branch"), default="branch", help="Classify overall or within each branch.")
+    parser.add_argument("--members", action="store_true", help="Include the products in each quadrant.")
+    parser.add_argument("--output", type=Path, default=None, help="Optional CSV path for the what-if table.")
+    parser.add_argument("--no-cache", action="store_true", help="Rebuild the menu tables instead of using the result cache.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    overall_index, branch_index = QuadrantIndex.from_tables(args.cleaned_dir, use_cache=not args.no_cache)
+    index = overall_index if args.scope == "overall" else branch_index
+    rows = index.what_if(parse_threshold(args.qty), parse_threshold(args.ppu), with_members=args.members)
+    if args.output is not None:
+        write_records(args.output, rows)
+        print(f"What-if table: {args.output} ({len(rows)} rows)")
+
+    print(f"Thresholds qty={args.qty}, ppu={args.ppu} ({args.scope}, {len(index.scopes)} scopes)")
+    for quadrant in QUADRANTS:
+        selected = [row for row in rows if row["quadrant"] == quadrant]
+        items = sum(int(row["items"]) for row in selected)
+        profit = sum(float(row["total_profit"] or 0.0) for row in selected)
+        print(f"  - {quadrant}: items={items}, profit={round_or_none(profit)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,587 @@
+#!/usr/bin/env python3
+"""Shared report I/O: atomic output swaps, a bulk CSV writer, compressed inputs and a polling watcher."""
+
+from __future__ import annotations
+
+import ast
+import bz2
+import csv
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import lzma
+import math
+import operator
+import os
+import queue
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+Signature = Tuple[int, int]
+
+CHUNK_ROWS = 4096
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Leading bytes of each supported archive format; file extensions are not trusted.
+COMPRESSION_MAGIC = (
+    (b"\x1f\x8b", "gzip"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"BZh", "bz2"),
+    (b"PK\x03\x04", "zip"),
+)
+# "<archive.zip>::<member>" names one CSV inside a zip.
+MEMBER_SEPARATOR = "::"
+READ_CHUNK = 1 << 20
+
+
+@contextmanager
+def atomic_output(path: Path) -> Iterator[Path]:
+    """Yield a temp path next to `path`; it replaces `path` only if the block succeeds.
+
+    Readers never see a half-written report: os.replace is atomic within a directory.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+@contextmanager
+def open_text_output(path: Path, compress: Optional[bool] = None) -> Iterator[io.TextIOBase]:
+    """Atomically replaced text handle; gzip when `compress` is set or the path ends in .gz.
+
+    Gzip output carries no timestamp so identical tables produce identical files.
+    """
+    compress = path.suffix == ".gz" if compress is None else compress
+    with atomic_output(path) as tmp_path:
+        if compress:
+            with tmp_path.open("wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as zipped:
+                with io.TextIOWrapper(zipped, encoding="utf-8", newline="") as handle:
+                    yield handle
+        else:
+            with tmp_path.open("w", encoding="utf-8", newline="", buffering=1 << 20) as handle:
+                yield handle
+
+
+def round_or_none(value: Optional[float], ndigits: int = 2) -> Optional[float]:
+    if value is None:
+        return None
+    return round(value, ndigits)
+
+
+def nan_to_none(value: float) -> Optional[float]:
+    """Report cells hold None (an empty CSV cell, JSON null) where numpy has NaN or inf."""
+    return None if not math.isfinite(value) else float(value)
+
+
+def round_column(values: List[object], ndigits: int) -> List[object]:
+    return [round(v, ndigits) if isinstance(v, float) else v for v in values]
+
+
+def record_columns(records: Sequence[Dict[str, object]], fieldnames: Sequence[str]) -> List[List[object]]:
+    """Column lists from dict rows; a key missing from some rows is written as '' like DictWriter."""
+    columns = []
+    for name in fieldnames:
+        try:
+            columns.append([record[name] for record in records])
+        except KeyError:
+            columns.append([record.get(name, "") for record in records])
+    return columns
+
+
+def write_chunk(handle: io.TextIOBase, rows: Iterable[Sequence[object]]) -> None:
+    """Render rows with csv.writer into memory and hand them to `handle` in one write."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    handle.write(buffer.getvalue())
+
+
+def write_table(
+    path: Path,
+    fieldnames: Sequence[str],
+    columns: Sequence[Sequence[object]],
+    float_digits: Optional[int] = None,
+    compress: Optional[bool] = None,
+    chunk_rows: int = CHUNK_ROWS,
+) -> int:
+    """Write column arrays as CSV in large chunks; returns the row count.
+
+    Floats are rounded a column at a time when `float_digits` is set. Cells go through
+    csv.writer, so quoting and number formatting match DictWriter byte for byte.
+    """
+    if float_digits is not None:
+        columns = [round_column(list(column), float_digits) for column in columns]
+    rows = zip(*columns)
+    n_rows = 0
+    with open_text_output(path, compress) as handle:
+        csv.writer(handle).writerow(fieldnames)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_rows))
+            if not chunk:
+                break
+            write_chunk(handle, chunk)
+            n_rows += len(chunk)
+    return n_rows
+
+
+def write_records(
+    path: Path,
+    records: Sequence[Dict[str, object]],
+    fieldnames: Optional[Sequence[str]] = None,
+    float_digits: Optional[int] = None,
+    compress: Optional[bool] = None,
+) -> int:
+    """Bulk-write dict rows; columns default to the first row's keys."""
+    if not records and fieldnames is None:
+        raise ValueError(f"No rows to write for {path}")
+    fieldnames = list(records[0].keys()) if fieldnames is None else list(fieldnames)
+    return write_table(path, fieldnames, record_columns(records, fieldnames), float_digits, compress)
+
+
+def write_record_stream(
+    path: Path,
+    records: Iterable[Dict[str, object]],
+    fieldnames: Optional[Sequence[str]] = None,
+    float_digits: Optional[int] = None,
+    compress: Optional[bool] = None,
+    chunk_rows: int = CHUNK_ROWS,
+) -> int:
+    """Like write_records for an iterator: only one chunk of rows is held at a time.
+
+    An empty stream writes just the header when `fieldnames` is given.
+    """
+    records = iter(records)
+    chunk = list(itertools.islice(records, chunk_rows))
+    if not chunk and fieldnames is None:
+        raise ValueError(f"No rows to write for {path}")
+    fieldnames = list(chunk[0].keys()) if fieldnames is None else list(fieldnames)
+    n_rows = 0
+    with open_text_output(path, compress) as handle:
+        csv.writer(handle).writerow(fieldnames)
+        while chunk:
+            columns = record_columns(chunk, fieldnames)
+            if float_digits is not None:
+                columns = [round_column(column, float_digits) for column in columns]
+            write_chunk(handle, zip(*columns))
+            n_rows += len(chunk)
+            chunk = list(itertools.islice(records, chunk_rows))
+    return n_rows
+
+
+def partition_slug(value: object) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", str(value).lower()).strip("-") or "none"
+
+
+def column_stats(records: Sequence[Dict[str, object]], fieldnames: Sequence[str]) -> Dict[str, Dict[str, float]]:
+    """Min/max of every column holding numbers (bools, blanks and NaN ignored)."""
+    stats: Dict[str, Dict[str, float]] = {}
+    for name in fieldnames:
+        numbers = [
+            value
+            for value in (record.get(name) for record in records)
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+        ]
+        if numbers:
+            stats[name] = {"min": min(numbers), "max": max(numbers)}
+    return stats
+
+
+def write_partitioned(
+    directory: Path,
+    records: Sequence[Dict[str, object]],
+    partition_by: Sequence[str],
+    fieldnames: Optional[Sequence[str]] = None,
+    float_digits: Optional[int] = None,
+    compress: bool = False,
+    workers: int = 4,
+) -> Dict[str, object]:
+    """One CSV per distinct `partition_by` key plus a manifest; returns the manifest.
+
+    Partitions are written concurrently, the manifest is swapped in after them and files
+    from an earlier run that are no longer listed are removed last, so a reader going
+    through the manifest always finds every file it names.
+    """
+    if fieldnames is None:
+        fieldnames = list(records[0].keys()) if records else []
+    groups: Dict[Tuple[object, ...], List[Dict[str, object]]] = {}
+    for record in records:
+        groups.setdefault(tuple(record.get(name, "") for name in partition_by), []).append(record)
+
+    suffix = ".csv.gz" if compress else ".csv"
+    used: Set[str] = set()
+    jobs: List[Tuple[Tuple[object, ...], str, List[Dict[str, object]]]] = []
+    for key in sorted(groups, key=lambda key: tuple(str(value) for value in key)):
+        stem = "__".join(partition_slug(value) for value in key)
+        name, n = stem + suffix, 2
+        while name in used:
+            name, n = f"{stem}-{n}{suffix}", n + 1
+        used.add(name)
+        jobs.append((key, name, groups[key]))
+
+    directory.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(lambda job: write_records(directory / job[1], job[2], fieldnames, float_digits, compress), jobs))
+
+    partitions = []
+    for key, name, rows in jobs:
+        stats = column_stats(rows, fieldnames)
+        if float_digits is not None:
+            stats = {col: {k: round(v, float_digits) for k, v in bounds.items()} for col, bounds in stats.items()}
+        partitions.append(
+            {
+                "file": name,
+                "key": {field: value for field, value in zip(partition_by, key)},
+                "rows": len(rows),
+                "stats": stats,
+            }
+        )
+    manifest: Dict[str, object] = {
+        "version": MANIFEST_VERSION,
+        "partition_by": list(partition_by),
+        "fieldnames": list(fieldnames),
+        "total_rows": len(records),
+        "partitions": partitions,
+    }
+    with atomic_output(directory / MANIFEST_FILENAME) as tmp_path:
+        tmp_path.write_text(json.dumps(manifest, indent=2, default=str), encoding="utf-8")
+    for path in itertools.chain(directory.glob("*.csv"), directory.glob("*.csv.gz")):
+        if path.name not in used:
+            path.unlink(missing_ok=True)
+    return manifest
+
+
+def load_manifest(directory: Path) -> Dict[str, object]:
+    return json.loads((directory / MANIFEST_FILENAME).read_text(encoding="utf-8"))
+
+
+def read_partitions(directory: Path, **filters: object) -> Iterator[Dict[str, str]]:
+    """Rows from only the partitions whose key matches every filter (values compared as text).
+
+    A filter value may be a single value or a collection of accepted values.
+    """
+    accepted = {
+        field: {str(v) for v in value} if isinstance(value, (list, tuple, set, frozenset)) else {str(value)}
+        for field, value in filters.items()
+    }
+    for partition in load_manifest(directory)["partitions"]:
+        key = partition["key"]
+        if any(str(key.get(field, "")) not in values for field, values in accepted.items()):
+            continue
+        path = directory / partition["file"]
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rt", encoding="utf-8", newline="") as handle:
+            yield from csv.DictReader(handle)
+
+
+def split_member(path: Path) -> Tuple[Path, Optional[str]]:
+    archive, separator, member = str(path).partition(MEMBER_SEPARATOR)
+    return Path(archive), (member if separator else None)
+
+
+def detect_compression(path: Path) -> Optional[str]:
+    with path.open("rb") as handle:
+        head = handle.read(6)
+    for magic, kind in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def zip_csv_members(path: Path) -> List[str]:
+    with zipfile.ZipFile(path) as archive:
+        return [name for name in archive.namelist() if name.lower().endswith(".csv") and not name.endswith("/")]
+
+
+def input_exists(path: Path) -> bool:
+    archive, member = split_member(path)
+    if not archive.is_file():
+        return False
+    return member is None or member in zip_csv_members(archive)
+
+
+class ThreadedReader(io.RawIOBase):
+    """Raw stream fed by a background thread that reads (and so decompresses) `source` ahead.
+
+    The queue depth bounds memory to a few chunks; decompression of the next chunks
+    overlaps with whatever parses the current one.
+    """
+
+    def __init__(self, source: BinaryIO, closers: Sequence[Callable[[], None]] = (), depth: int = 4) -> None:
+        super().__init__()
+        self.source = source
+        self.closers = list(closers)
+        self.chunks: "queue.Queue[object]" = queue.Queue(maxsize=depth)
+        self.pending = memoryview(b"")
+        self.finished = False
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.fill, daemon=True)
+        self.thread.start()
+
+    def fill(self) -> None:
+        try:
+            while not self.stop.is_set():
+                chunk = self.source.read(READ_CHUNK)
+                self.put(chunk)
+                if not chunk:
+                    return
+        except Exception as exc:  # handed to the reading thread
+            self.put(exc)
+
+    def put(self, item: object) -> None:
+        while not self.stop.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: memoryview) -> int:
+        while not self.pending:
+            if self.finished:
+                return 0
+            item = self.chunks.get()
+            if isinstance(item, Exception):
+                raise item
+            if not item:
+                self.finished = True
+                return 0
+            self.pending = memoryview(item)
+        n = min(len(buffer), len(self.pending))
+        buffer[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self.stop.set()
+            self.thread.join()
+            self.source.close()
+            for close in self.closers:
+                close()
+        super().close()
+
+
+def open_binary_input(path: Path) -> BinaryIO:
+    """Binary handle on a plain, gzip, xz, bz2 or zip file; archives are decompressed on the fly.
+
+    A zip needs a `::member` suffix unless it holds exactly one CSV.
+    """
+    archive, member = split_member(path)
+    kind = detect_compression(archive)
+    if kind is None:
+        return archive.open("rb")
+    closers: List[Callable[[], None]] = []
+    if kind == "gzip":
+        source: BinaryIO = gzip.open(archive, "rb")
+    elif kind == "xz":
+        source = lzma.open(archive, "rb")
+    elif kind == "bz2":
+        source = bz2.open(archive, "rb")
+    else:
+        zipped = zipfile.ZipFile(archive)
+        closers.append(zipped.close)
+        if member is None:
+            members = [name for name in zipped.namelist() if name.lower().endswith(".csv")]
+            if len(members) != 1:
+                zipped.close()
+                raise ValueError(f"{archive} holds {len(members)} CSV files; name one as {archive}{MEMBER_SEPARATOR}<member>")
+            member = members[0]
+        source = zipped.open(member)
+    return io.BufferedReader(ThreadedReader(source, closers), buffer_size=1 << 16)
+
+
+def open_text_input(path: Path, encoding: str = "utf-8") -> io.TextIOWrapper:
+    return io.TextIOWrapper(open_binary_input(path), encoding=encoding, newline="")
+
+
+def scan_rows(
+    path: Path,
+    columns: Sequence[str],
+    where: Optional[Dict[str, Iterable[str]]] = None,
+) -> Iterator[Tuple[str, ...]]:
+    """Tuples of `columns` for the CSV rows whose `where` columns hold one of the accepted values.
+
+    Rows are rejected by comparing fields at fixed positions before anything is built, and
+    only the requested fields are kept. Values are compared verbatim; short rows read as ''.
+    """
+    with open_text_input(path) as handle:
+        reader = csv.reader(handle)
+        header = next(reader, [])
+        positions = {name: i for i, name in enumerate(header)}
+        missing = [name for name in (*columns, *(where or {})) if name not in positions]
+        if missing:
+            raise ValueError(f"{path} has no column(s): {', '.join(missing)}")
+        selected = [positions[name] for name in columns]
+        checks = [(positions[name], frozenset(values)) for name, values in (where or {}).items()]
+        width = max([*selected, *(i for i, _ in checks)], default=-1) + 1
+        pick = operator.itemgetter(*selected) if len(selected) > 1 else lambda row: (row[selected[0]],)
+        for row in reader:
+            if len(row) < width:
+                row = row + [""] * (width - len(row))
+            for i, accepted in checks:
+                if row[i] not in accepted:
+                    break
+            else:
+                yield pick(row)
+
+
+def scan_columns(
+    path: Path,
+    columns: Sequence[str],
+    where: Optional[Dict[str, Iterable[str]]] = None,
+) -> Dict[str, List[str]]:
+    """Column lists of the rows scan_rows would yield."""
+    rows = list(scan_rows(path, columns, where))
+    return {name: [row[i] for row in rows] for i, name in enumerate(columns)}
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha1()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# (path, mtime_ns, size) -> content hash, so one process hashes an unchanged file once.
+DIGEST_MEMO: Dict[Tuple[str, int, int], str] = {}
+
+
+def memoized_file_digest(path: Path) -> str:
+    """file_digest, skipped while the file's mtime and size are unchanged."""
+    stat = path.stat()
+    key = (str(path.resolve()), stat.st_mtime_ns, stat.st_size)
+    if key not in DIGEST_MEMO:
+        DIGEST_MEMO[key] = file_digest(path)
+    return DIGEST_MEMO[key]
+
+
+def local_modules(script: Path, module_dirs: Sequence[Path]) -> List[Path]:
+    """The script plus every repo module it imports, transitively."""
+    seen: Dict[Path, None] = {}
+    pending = [script]
+    while pending:
+        path = pending.pop()
+        if path in seen or not path.exists():
+            continue
+        seen[path] = None
+        tree = ast.parse(path.read_text(encoding="utf-8"))
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                for directory in (path.parent, *module_dirs):
+                    candidate = directory / f"{name.split('.')[0]}.py"
+                    if candidate.exists():
+                        pending.append(candidate)
+                        break
+    return sorted(seen)
+
+
+class DirectoryWatcher:
+    """Report files in a directory whose content changed since the last poll.
+
+    mtime/size are checked on every poll; a file is only hashed when they move, and
+    only reported once they are stable across two polls so a file still being written
+    is not picked up half-way. Touching a file without changing it is not a change.
+    """
+
+    def __init__(self, directory: Path, names: Optional[Iterable[str]] = None, pattern: str = "*") -> None:
+        self.directory = directory
+        self.names = set(names) if names is not None else None
+        self.pattern = pattern
+        self.pending: Dict[str, Optional[Signature]] = {}
+        self.signatures: Dict[str, Optional[Signature]] = {}
+        self.digests: Dict[str, Optional[str]] = {}
+
+    def scan(self) -> Dict[str, Signature]:
+        current: Dict[str, Signature] = {}
+        for path in self.directory.glob(self.pattern):
+            if self.names is not None and path.name not in self.names:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.is_file():
+                current[path.name] = (stat.st_mtime_ns, stat.st_size)
+        return current
+
+    def poll(self) -> Set[str]:
+        current = self.scan()
+        changed: Set[str] = set()
+        for name in set(current) | set(self.signatures):
+            signature = current.get(name)
+            if signature == self.signatures.get(name):
+                self.pending.pop(name, None)
+                continue
+            if name not in self.pending or self.pending[name] != signature:
+                # First sighting of this signature: wait one poll for the writer to finish.
+                self.pending[name] = signature
+                continue
+            del self.pending[name]
+            self.signatures[name] = signature
+            digest = file_digest(self.directory / name) if signature is not None else None
+            if digest != self.digests.get(name):
+                self.digests[name] = digest
+                changed.add(name)
+        return changed
+
+    def prime(self) -> Set[str]:
+        """Record the current state without waiting; returns every file present."""
+        current = self.scan()
+        self.pending.clear()
+        self.signatures = dict(current)
+        self.digests = {name: file_digest(self.directory / name) for name in current}
+        return set(current)
+
+
+def watch_directory(
+    directory: Path,
+    refresh: Callable[[Set[str]], None],
+    names: Optional[Iterable[str]] = None,
+    interval: float = 0.25,
+) -> None:
+    """Call `refresh(changed_names)` once for all files, then after every change until Ctrl-C.
+
+    A failing refresh is reported and retried on the next change instead of ending the loop.
+    """
+    watcher = DirectoryWatcher(directory, names)
+    changed = watcher.prime()
+    print(f"Watching {directory} (every {interval}s, Ctrl-C to stop)")
+    try:
+        while True:
+            if changed:
+                started = time.perf_counter()
+                try:
+                    refresh(changed)
+                except Exception as exc:  # keep watching; the next export may fix it
+                    print(f"[{datetime.now():%H:%M:%S}] refresh failed: {exc}")
+                else:
+                    elapsed = time.perf_counter() - started
+                    print(f"[{datetime.now():%H:%M:%S}] refreshed {', '.join(sorted(changed))} in {elapsed:.2f}s")
+            time.sleep(interval)
+            changed = watcher.poll()
+    except KeyboardInterrupt:
+        print("Stopped watching.")
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""On-disk cache for analysis results keyed by input content, the code that builds them and parameters."""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from report_io import atomic_output, local_modules, memoized_file_digest
+
+T = TypeVar("T")
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+STATS_FILENAME = "stats.json"
+
+
+class ResultCache:
+    """Pickled results in `cache_dir`, evicted least-recently-used once over `max_bytes`.
+
+    An entry's mtime is its last use; hits bump it. Hit/miss counts are kept per
+    function both for this process (`session`) and across runs (stats.json).
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.session: Dict[str, Dict[str, int]] = {}
+
+    def input_digest(self, path: Path) -> str:
+        """Content hash of an input, memoized on (path, mtime, size) for this process."""
+        if not path.exists():
+            return "missing"
+        return memoized_file_digest(path)
+
+    def code_digest(self, source: Path) -> str:
+        """Hash of `source` and every repo module it imports, so any code change misses."""
+        modules = local_modules(source.resolve(), [source.resolve().parent])
+        return hashlib.sha1("|".join(f"{path.name}:{self.input_digest(path)}" for path in modules).encode("utf-8")).hexdigest()
+
+    def key(self, name: str, source: Path, inputs: Iterable[Path], params: Optional[Dict[str, object]] = None) -> str:
+        payload = {
+            "name": name,
+            "code": self.code_digest(source),
+            "inputs": {path.name: self.input_digest(path) for path in inputs},
+            "params": params or {},
+        }
+        return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def entry_path(self, name: str, key: str) -> Path:
+        return self.cache_dir / f"{name}-{key}.pkl"
+
+    def get_or_compute(
+        self,
+        name: str,
+        source: Path,
+        inputs: Iterable[Path],
+        compute: Callable[[], T],
+        params: Optional[Dict[str, object]] = None,
+    ) -> T:
+        path = self.entry_path(name, self.key(name, source, list(inputs), params))
+        if path.exists():
+            try:
+                with path.open("rb") as handle:
+                    result = pickle.load(handle)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+                pass
+            else:
+                os.utime(path)
+                self.record(name, "hits")
+                return result
+
+        result = compute()
+        self.record(name, "misses")
+        try:
+            with atomic_output(path) as tmp_path, tmp_path.open("wb") as handle:
+                pickle.dump(result, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            self.evict()
+        except OSError:
+            pass
+        return result
+
+    def entries(self) -> List[Tuple[float, int, Path]]:
+        if not self.cache_dir.exists():
+            return []
+        entries = []
+        for path in self.cache_dir.glob("*.pkl"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self) -> int:
+        """Drop least-recently-used entries until the cache fits; returns entries removed."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self) -> int:
+        entries = self.entries()
+        for _, _, path in entries:
+            path.unlink(missing_ok=True)
+        return len(entries)
+
+    def stats_path(self) -> Path:
+        return self.cache_dir / STATS_FILENAME
+
+    def load_stats(self) -> Dict[str, Dict[str, int]]:
+        try:
+            return json.loads(self.stats_path().read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, name: str, outcome: str) -> None:
+        counts = self.session.setdefault(name, {"hits": 0, "misses": 0})
+        counts[outcome] += 1
+        stats = self.load_stats()
+        totals = stats.setdefault(name, {"hits": 0, "misses": 0})
+        totals[outcome] = totals.get(outcome, 0) + 1
+        try:
+            with atomic_output(self.stats_path()) as tmp_path:
+                tmp_path.write_text(json.dumps(stats, indent=2, sort_keys=True), encoding="utf-8")
+        except OSError:
+            pass
+
+    def summary(self) -> Dict[str, object]:
+        entries = self.entries()
+        return {
+            "cache_dir": str(self.cache_dir),
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "functions": self.load_stats(),
+        }
+
+
+def default_cache_dir() -> Path:
+    return Path(__file__).resolve().parents[2] / ".cache" / "results"
+
+
+def open_cache(cache_dir: Optional[Path], enabled: bool = True, max_bytes: int = DEFAULT_MAX_BYTES) -> Optional[ResultCache]:
+    if not enabled:
+        return None
+    return ResultCache(cache_dir or default_cache_dir(), max_bytes)
+
+
+def cached(
+    cache: Optional[ResultCache],
+    name: str,
+    source: Path,
+    inputs: Iterable[Path],
+    compute: Callable[[], T],
+    params: Optional[Dict[str, object]] = None,
+) -> T:
+    """`compute()` through `cache`, or directly when caching is disabled.
+
+    `source` is the module that defines `compute` (its `__file__`).
+    """
+    if cache is None:
+        return compute()
+    return cache.get_or_compute(name, source, inputs, compute, params)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Inspect or clear the analysis result cache.")
+    parser.add_argument("--cache-dir", type=Path, default=default_cache_dir(), help="Result cache directory.")
+    parser.add_argument("--clear", action="store_true", help="Delete every cached result.")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    cache = ResultCache(args.cache_dir)
+    if args.clear:
+        print(f"Removed {cache.clear()} cached results from {args.cache_dir}")
+        return
+    print(json.dumps(cache.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""Compare two runs of the branch menu and KPI reports: quadrant migrations, rank changes and top movers."""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import heapq
+import itertools
+import tempfile
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from external_sort import external_sort
+from report_io import open_text_input, round_or_none, scan_rows, write_record_stream, write_records
+
+MENU_FILENAME = "menu_engineering_by_branch.csv"
+KPI_FILENAME = "branch_kpis.csv"
+MENU_KEY = ("branch", "product_desc", "category", "division")
+# department is carried, not keyed: the menu aggregate keeps the last department seen for a key.
+MENU_COLUMNS = (*MENU_KEY, "branch_quadrant", "total_profit", "profit_margin_pct", "department")
+ADDED = "(new)"
+DROPPED = "(dropped)"
+# Changes smaller than this are rounding noise, not movers.
+MOVER_EPSILON = 0.005
+
+CHANGE_FIELDS = [
+    "branch",
+    "product_desc",
+    "category",
+    "division",
+    "department",
+    "quadrant_before",
+    "quadrant_after",
+    "profit_before",
+    "profit_after",
+    "profit_change",
+    "margin_pct_before",
+    "margin_pct_after",
+    "margin_change_pts",
+    "rank_before",
+    "rank_after",
+    "rank_change",
+]
+MATRIX_FIELDS = ["branch", "quadrant_before", "quadrant_after", "items", "profit_before", "profit_after"]
+MOVER_FIELDS = ["branch", "metric", "position", *CHANGE_FIELDS[1:]]
+KPI_FIELDS = ["branch", "status", "metric", "before", "after", "change", "change_pct"]
+
+# (key, quadrant, profit, margin pct, profit rank within branch, department)
+MenuRecord = Tuple[Tuple[str, ...], str, float, Optional[float], int, str]
+
+
+def to_float(value: str) -> Optional[float]:
+    try:
+        return float(value) if value != "" else None
+    except ValueError:
+        return None
+
+
+def difference(after: Optional[float], before: Optional[float]) -> Optional[float]:
+    if after is None or before is None:
+        return None
+    return after - before
+
+
+def record_key(record: Tuple[Any, ...]) -> Any:
+    return record[0]
+
+
+def iter_menu_records(path: Path) -> Iterator[MenuRecord]:
+    """Rows of a branch menu table; the rank is the row's position in its branch (files are written by profit)."""
+    ranks: Dict[str, int] = defaultdict(int)
+    for branch, product, category, division, quadrant, profit, margin, department in scan_rows(path, MENU_COLUMNS):
+        ranks[branch] += 1
+        yield ((branch, product, category, division), quadrant, to_float(profit) or 0.0, to_float(margin), ranks[branch], department)
+
+
+def merge_join(
+    left: Iterator[Any], right: Iterator[Any], key: Callable[[Any], Any]
+) -> Iterator[Tuple[Optional[Any], Optional[Any]]]:
+    """Full outer join of two iterators already sorted by `key`; unmatched sides come back as None.
+
+    Keys must be unique on each side: a repeated key would pair rows arbitrarily, so it raises ValueError.
+    """
+
+    def unique(records: Iterator[Any]) -> Iterator[Any]:
+        previous: Any = None
+        for index, record in enumerate(records):
+            current = key(record)
+            if index and current == previous:
+                raise ValueError(f"Duplicate join key {current!r}")
+            previous = current
+            yield record
+
+    left, right = unique(left), unique(right)
+    a = next(left, None)
+    b = next(right, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and key(a) < key(b)):
+            yield a, None
+            a = next(left, None)
+        elif a is None or key(b) < key(a):
+            yield None, b
+            b = next(right, None)
+        else:
+            yield a, b
+            a = next(left, None)
+            b = next(right, None)
+
+
+def sorted_join(
+    before: Iterator[Any], after: Iterator[Any], directory: Path, run_size: int
+) -> Iterator[Tuple[Optional[Any], Optional[Any]]]:
+    """Sort both runs by key with at most `run_size` records in memory each, then merge-join them."""
+    (directory / "before").mkdir()
+    (directory / "after").mkdir()
+    return merge_join(
+        external_sort(before, directory / "before", key=record_key, run_size=run_size),
+        external_sort(after, directory / "after", key=record_key, run_size=run_size),
+        record_key,
+    )
+
+
+def change_row(old: Optional[MenuRecord], new: Optional[MenuRecord]) -> Dict[str, object]:
+    key = (old or new)[0]
+    profit_before = old[2] if old else None
+    profit_after = new[2] if new else None
+    margin_before = old[3] if old else None
+    margin_after = new[3] if new else None
+    rank_before = old[4] if old else None
+    rank_after = new[4] if new else None
+    return {
+        "branch": key[0],
+        "product_desc": key[1],
+        "category": key[2],
+        "division": key[3],
+        "department": (new or old)[5],
+        "quadrant_before": old[1] if old else ADDED,
+        "quadrant_after": new[1] if new else DROPPED,
+        "profit_before": round_or_none(profit_before),
+        "profit_after": round_or_none(profit_after),
+        "profit_change": round_or_none(difference(profit_after, profit_before)),
+        "margin_pct_before": round_or_none(margin_before),
+        "margin_pct_after": round_or_none(margin_after),
+        "margin_change_pts": round_or_none(difference(margin_after, margin_before)),
+        "rank_before": rank_before,
+        "rank_after": rank_after,
+        # Positive means the item climbed.
+        "rank_change": rank_before - rank_after if old and new else None,
+    }
+
+
+class TopMovers:
+    """Largest absolute changes seen so far, keeping only `k` items in a min-heap; unchanged items never count."""
+
+    def __init__(self, k: int) -> None:
+        self.k = k
+        self.heap: List[Tuple[float, int, Dict[str, object]]] = []
+        self.counter = itertools.count()
+
+    def add(self, change: Optional[float], row: Dict[str, object]) -> None:
+        if change is None or self.k <= 0 or abs(change) < MOVER_EPSILON:
+            return
+        entry = (abs(change), next(self.counter), row)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, entry)
+        elif entry[0] > self.heap[0][0]:
+            heapq.heapreplace(self.heap, entry)
+
+    def ranked(self) -> List[Dict[str, object]]:
+        return [row for _, _, row in sorted(self.heap, key=lambda item: (-item[0], item[1]))]
+
+
+def diff_menu(
+    before_path: Path,
+    after_path: Path,
+    migrations_path: Path,
+    matrix_path: Path,
+    movers_path: Path,
+    top_k: int = 10,
+    run_size: int = 100_000,
+    spill_dir: Optional[Path] = None,
+) -> Dict[str, int]:
+    """Stream the joined runs one branch at a time; memory holds one branch's matrix and movers."""
+    counts: Counter = Counter()
+    matrix_rows: List[Dict[str, object]] = []
+    mover_rows: List[Dict[str, object]] = []
+
+    def migrations(tmp: Path) -> Iterator[Dict[str, object]]:
+        joined = sorted_join(iter_menu_records(before_path), iter_menu_records(after_path), tmp, run_size)
+        for branch, pairs in itertools.groupby(joined, key=lambda pair: (pair[0] or pair[1])[0][0]):
+            matrix: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+            profit_movers = TopMovers(top_k)
+            margin_movers = TopMovers(top_k)
+            for old, new in pairs:
+                row = change_row(old, new)
+                cell = matrix[(str(row["quadrant_before"]), str(row["quadrant_after"]))]
+                cell[0] += 1
+                cell[1] += old[2] if old else 0.0
+                cell[2] += new[2] if new else 0.0
+                counts["items"] += 1
+                if old is None:
+                    counts["added"] += 1
+                elif new is None:
+                    counts["dropped"] += 1
+                else:
+                    counts["matched"] += 1
+                    if row["rank_change"]:
+                        counts["rank_changes"] += 1
+                    profit_movers.add(difference(new[2], old[2]), row)
+                    margin_movers.add(difference(new[3], old[3]), row)
+                if row["quadrant_before"] != row["quadrant_after"]:
+                    counts["migrations"] += 1
+                    yield row
+
+            for (quadrant_before, quadrant_after), (items, profit_before, profit_after) in sorted(matrix.items()):
+                matrix_rows.append(
+                    {
+                        "branch": branch,
+                        "quadrant_before": quadrant_before,
+                        "quadrant_after": quadrant_after,
+                        "items": items,
+                        "profit_before": round_or_none(profit_before),
+                        "profit_after": round_or_none(profit_after),
+                    }
+                )
+            for metric, movers in (("profit", profit_movers), ("margin", margin_movers)):
+                for position, row in enumerate(movers.ranked(), start=1):
+                    mover_rows.append({"metric": metric, "position": position, **row})
+            counts["branches"] += 1
+
+    # Migrations are streamed; the matrix and movers hold a few rows per branch.
+    with tempfile.TemporaryDirectory(prefix="run-diff-", dir=spill_dir) as tmp:
+        write_record_stream(migrations_path, migrations(Path(tmp)), fieldnames=CHANGE_FIELDS)
+    write_records(matrix_path, matrix_rows, fieldnames=MATRIX_FIELDS)
+    write_records(movers_path, mover_rows, fieldnames=MOVER_FIELDS)
+    return dict(counts)
+
+
+def csv_header(path: Path) -> List[str]:
+    with open_text_input(path) as handle:
+        return next(csv.reader(handle), [])
+
+
+def iter_keyed_rows(path: Path, columns: Sequence[str]) -> Iterator[Tuple[Tuple[str], Tuple[str, ...]]]:
+    for row in scan_rows(path, ("branch", *columns)):
+        yield (row[0],), row[1:]
+
+
+def diff_kpis(
+    before_path: Path, after_path: Path, output_path: Path, run_size: int = 100_000, spill_dir: Optional[Path] = None
+) -> Dict[str, int]:
+    """One row per changed KPI value per branch (numbers get change and change_pct), plus added/dropped branches."""
+    before_columns = csv_header(before_path)
+    columns = [name for name in csv_header(after_path) if name in before_columns and name != "branch"]
+    counts: Counter = Counter()
+
+    def changes(tmp: Path) -> Iterator[Dict[str, object]]:
+        joined = sorted_join(iter_keyed_rows(before_path, columns), iter_keyed_rows(after_path, columns), tmp, run_size)
+        for old, new in joined:
+            branch = (old or new)[0][0]
+            if old is None or new is None:
+                status = "added" if old is None else "dropped"
+                counts[status] += 1
+                yield {"branch": branch, "status": status}
+                continue
+            for metric, before, after in zip(columns, old[1], new[1]):
+                if before == after:
+                    continue
+                before_value, after_value = to_float(before), to_float(after)
+                change = difference(after_value, before_value)
+                change_pct = None
+                if change is not None and before_value:
+                    change_pct = change / abs(before_value) * 100
+                counts["changed_values"] += 1
+                yield {
+                    "branch": branch,
+                    "status": "changed",
+                    "metric": metric,
+                    "before": before,
+                    "after": after,
+                    "change": round_or_none(change, 4),
+                    "change_pct": round_or_none(change_pct),
+                }
+
+    with tempfile.TemporaryDirectory(prefix="run-diff-", dir=spill_dir) as tmp:
+        write_record_stream(output_path, changes(Path(tmp)), fieldnames=KPI_FIELDS)
+    return dict(counts)
+
+
+def parse_args() -> argparse.Namespace:
+    repo_root = Path(__file__).resolve().parents[2]
+    reports = repo_root / "reports"
+
+    parser = argparse.ArgumentParser(description="Compare two runs of the branch menu and KPI reports.")
+    parser.add_argument("--before", type=Path, required=True, help="Directory holding the earlier run's reports.")
+    parser.add_argument("--after", type=Path, default=reports, help="Directory holding the later run's reports.")
+    parser.add_argument("--output-dir", type=Path, default=reports / "changes", help="Where the change tables go.")
+    parser.add_argument("--top", type=int, default=10, help="Profit and margin movers kept per branch.")
+    parser.add_argument("--run-size", type=int, default=100_000, help="Rows sorted in memory at a time per run.")
+    parser.add_argument("--spill-dir", type=Path, default=None, help="Directory for sort spill files (default: system temp).")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    out = args.output_dir
+    menu = diff_menu(
+        args.before / MENU_FILENAME,
+        args.after / MENU_FILENAME,
+        out / "menu_quadrant_migrations.csv",
+        out / "menu_quadrant_matrix.csv",
+        out / "menu_top_movers.csv",
+        top_k=args.top,
+        run_size=args.run_size,
+        spill_dir=args.spill_dir,
+    )
+    print(
+        f"Menu items: {menu.get('items', 0)} across {menu.get('branches', 0)} branches "
+        f"(added={menu.get('added', 0)}, dropped={menu.get('dropped', 0)}, "
+        f"quadrant migrations={menu.get('migrations', 0)}, rank changes={menu.get('rank_changes', 0)})"
+    )
+
+    if (args.before / KPI_FILENAME).exists() and (args.after / KPI_FILENAME).exists():
+        kpis = diff_kpis(args.before / KPI_FILENAME, args.after / KPI_FILENAME, out / "branch_kpi_changes.csv", args.run_size, args.spill_dir)
+        print(
+            f"Branch KPIs: {kpis.get('changed_values', 0)} changed values "
+            f"(branches added={kpis.get('added', 0)}, dropped={kpis.get('dropped', 0)})"
+        )
+    print(f"Change tables: {out}")
+
+
+if __name__ == "__main__":
+    main()
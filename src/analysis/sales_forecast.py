@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""Batch seasonal forecasts (damped multiplicative Holt-Winters) for every branch's monthly sales.
+
+Smoothing parameters are chosen per branch on a holdout: the model is initialised on the
+months before each branch's last `holdout` months and scored on its one-step-ahead errors
+over them. That holdout RMSE also sets the prediction intervals. Branches too short for a
+holdout fall back to in-sample selection, and their in-sample RMSE is widened by the median
+holdout/in-sample RMSE ratio of the other branches; `rmse_basis` says which applies.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+from pathlib import Path
+from statistics import NormalDist
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from monthly_trends import MonthlyTrends, build_monthly_trends
+from report_io import round_or_none, write_records
+
+ALPHA_GRID = (0.2, 0.4, 0.6, 0.8)
+BETA_GRID = (0.0, 0.1, 0.3)
+GAMMA_GRID = (0.0, 0.2, 0.4)
+DAMPING = 0.9
+SEASON = 12
+HOLDOUT_MONTHS = 3
+# Observations a branch needs before its holdout window to be scored on it.
+MIN_TRAINING_MONTHS = 3
+IN_SAMPLE = "in_sample_scaled"
+
+
+class BranchForecast:
+    """Fitted parameters and horizon forecasts for all branches (arrays indexed by branch).
+
+    Horizon h is the month `anchor + h` for every branch, `anchor` being the latest month
+    any branch reported; branches not forecast have NaN rows.
+    """
+
+    def __init__(
+        self,
+        trends: MonthlyTrends,
+        anchor: int,
+        params: np.ndarray,
+        rmse: np.ndarray,
+        rmse_basis: List[str],
+        forecast: np.ndarray,
+        lower: np.ndarray,
+        upper: np.ndarray,
+    ) -> None:
+        self.trends = trends
+        self.anchor = anchor
+        self.params = params
+        self.rmse = rmse
+        self.rmse_basis = rmse_basis
+        self.forecast = forecast
+        self.lower = lower
+        self.upper = upper
+
+    @property
+    def horizon(self) -> int:
+        return self.forecast.shape[1]
+
+    def to_rows(self) -> List[Dict[str, object]]:
+        rows: List[Dict[str, object]] = []
+        trends = self.trends
+        for i, key in enumerate(trends.branches):
+            latest = int(trends.latest_index[i])
+            if latest < 0 or np.isnan(self.forecast[i, 0]):
+                continue
+            alpha, beta, gamma = self.params[i]
+            for h in range(self.horizon):
+                rows.append(
+                    {
+                        "branch": trends.display_names.get(key, key),
+                        "forecast_month": trends.period_label(self.anchor + h + 1),
+                        "horizon": h + 1,
+                        "last_actual_month": trends.period_label(latest),
+                        "forecast_sales": round_or_none(float(self.forecast[i, h])),
+                        "lower_bound": round_or_none(float(self.lower[i, h])),
+                        "upper_bound": round_or_none(float(self.upper[i, h])),
+                        "alpha": float(alpha),
+                        "beta": float(beta),
+                        "gamma": float(gamma),
+                        "one_step_rmse": round_or_none(float(self.rmse[i])),
+                        "rmse_basis": self.rmse_basis[i],
+                    }
+                )
+        return rows
+
+
+def parameter_grid(
+    alphas: Sequence[float] = ALPHA_GRID,
+    betas: Sequence[float] = BETA_GRID,
+    gammas: Sequence[float] = GAMMA_GRID,
+) -> np.ndarray:
+    return np.array(list(itertools.product(alphas, betas, gammas)), dtype=float)
+
+
+def initial_state(sales: np.ndarray, first: np.ndarray) -> tuple:
+    """Level and calendar seasonals from each branch's first (up to) 12 observed months."""
+    n_branches, n_periods = sales.shape
+    offsets = first[:, None] + np.arange(SEASON)[None, :]
+    in_range = offsets < n_periods
+    window = np.where(in_range, sales[np.arange(n_branches)[:, None], np.minimum(offsets, n_periods - 1)], np.nan)
+    counts = np.sum(~np.isnan(window), axis=1)
+    level = np.where(counts > 0, np.nansum(window, axis=1) / np.maximum(counts, 1), 0.0)
+
+    seasonal = np.ones((n_branches, SEASON))
+    month_slot = offsets % SEASON
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = window / level[:, None]
+    ratios = np.where(np.isfinite(ratios), ratios, 1.0)
+    # A season is only estimable once every calendar month has been observed.
+    has_season = (counts >= SEASON)[:, None]
+    np.put_along_axis(seasonal, month_slot, np.where(has_season, ratios, 1.0), axis=1)
+    return level, seasonal
+
+
+def series_bounds(sales: np.ndarray) -> tuple:
+    """Each branch's first and last observed period (n_periods and -1 when it has none)."""
+    n_periods = sales.shape[1]
+    observed = ~np.isnan(sales)
+    has_any = observed.any(axis=1)
+    first = np.where(has_any, np.argmax(observed, axis=1), n_periods)
+    last = np.where(has_any, n_periods - 1 - np.argmax(observed[:, ::-1], axis=1), -1)
+    return first, last
+
+
+def fit_holt_winters(sales: np.ndarray, grid: np.ndarray, cutoff: Optional[np.ndarray] = None) -> tuple:
+    """Run every grid combination for every branch at once.
+
+    State arrays are shaped (combos, branches); the only Python loop is over time.
+    Without `cutoff` the state is initialised from the whole series and every one-step
+    error after the first month is scored (in-sample). With a per-branch `cutoff` period,
+    initialisation only sees earlier months and only errors from `cutoff` on are scored.
+    Returns per-combo SSE/obs counts and the final state.
+    """
+    n_branches, n_periods = sales.shape
+    observed = ~np.isnan(sales)
+    first, last = series_bounds(sales)
+    if cutoff is None:
+        cutoff = first + 1
+        init_sales = sales
+    else:
+        init_sales = np.where(np.arange(n_periods)[None, :] < cutoff[:, None], sales, np.nan)
+
+    level0, seasonal0 = initial_state(init_sales, np.minimum(first, n_periods - 1))
+    n_combos = grid.shape[0]
+    alpha = grid[:, 0][:, None]
+    beta = grid[:, 1][:, None]
+    gamma = grid[:, 2][:, None]
+
+    level = np.broadcast_to(level0, (n_combos, n_branches)).copy()
+    trend = np.zeros((n_combos, n_branches))
+    seasonal = np.broadcast_to(seasonal0, (n_combos, n_branches, SEASON)).copy()
+    sse = np.zeros((n_combos, n_branches))
+    n_obs = np.zeros(n_branches)
+
+    for t in range(n_periods):
+        slot = t % SEASON
+        active = (t >= first) & (t <= last)
+        if not active.any():
+            continue
+        y = sales[:, t]
+        has_y = active & observed[:, t]
+        s_t = seasonal[:, :, slot]
+        prediction = (level + DAMPING * trend) * s_t
+        error = np.where(has_y, np.nan_to_num(y) - prediction, 0.0)
+        # The first observation only anchors the level; it is not a forecast.
+        scored = has_y & (t > first) & (t >= cutoff)
+        sse += np.where(scored, error * error, 0.0)
+        n_obs += scored
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            deseasonalized = np.where(s_t > 0, np.nan_to_num(y) / s_t, level)
+        new_level = np.where(
+            has_y,
+            alpha * deseasonalized + (1 - alpha) * (level + DAMPING * trend),
+            level + DAMPING * trend,
+        )
+        new_trend = np.where(has_y, beta * (new_level - level) + (1 - beta) * DAMPING * trend, DAMPING * trend)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            seasonal_ratio = np.where(new_level > 0, np.nan_to_num(y) / new_level, s_t)
+        seasonal[:, :, slot] = np.where(has_y, gamma * seasonal_ratio + (1 - gamma) * s_t, s_t)
+        level = np.where(active, new_level, level)
+        trend = np.where(active, new_trend, trend)
+
+    return sse, n_obs, level, trend, seasonal, last
+
+
+def forecast_branches(
+    trends: MonthlyTrends,
+    horizon: int = 6,
+    level: float = 0.95,
+    grid: Optional[np.ndarray] = None,
+    max_stale_months: int = 0,
+    holdout: int = HOLDOUT_MONTHS,
+) -> BranchForecast:
+    """Forecast the `horizon` months after the latest month any branch reported.
+
+    Parameters and RMSE come from the one-step-ahead errors over each branch's last
+    `holdout` months (see the module docstring); the forecast itself restarts from the
+    full series with the chosen parameters.
+
+    A branch whose series ends earlier is projected across the gap (its interval widens
+    with the extra steps) when the gap is at most `max_stale_months`, else not forecast:
+    a branch that stopped reporting is usually closed.
+    """
+    sales = trends.sales
+    grid = parameter_grid() if grid is None else grid
+    n_branches = sales.shape[0]
+    sse, n_obs, final_level, final_trend, final_seasonal, last = fit_holt_winters(sales, grid)
+
+    branches = np.arange(n_branches)
+    in_sample_best = np.argmin(sse, axis=0)
+    in_sample_rmse = np.sqrt(sse[in_sample_best, branches] / np.maximum(n_obs, 1))
+    in_sample_rmse[n_obs == 0] = np.nan
+
+    cutoff = last - holdout + 1
+    holdout_sse, holdout_obs = fit_holt_winters(sales, grid, cutoff)[:2]
+    training = np.sum(~np.isnan(sales) & (np.arange(sales.shape[1])[None, :] < cutoff[:, None]), axis=1)
+    use_holdout = (holdout > 0) & (holdout_obs > 0) & (training >= MIN_TRAINING_MONTHS)
+    holdout_best = np.argmin(holdout_sse, axis=0)
+    holdout_rmse = np.sqrt(holdout_sse[holdout_best, branches] / np.maximum(holdout_obs, 1))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = holdout_rmse / in_sample_rmse
+    ratios = ratios[use_holdout & np.isfinite(ratios)]
+    widening = max(1.0, float(np.median(ratios))) if ratios.size else 1.0
+    best = np.where(use_holdout, holdout_best, in_sample_best)
+    rmse = np.where(use_holdout, holdout_rmse, in_sample_rmse * widening)
+    rmse_basis = [f"holdout_{holdout}m" if flag else IN_SAMPLE for flag in use_holdout.tolist()]
+    chosen_level = final_level[best, branches]
+    chosen_trend = final_trend[best, branches]
+    chosen_seasonal = final_seasonal[best, branches]
+
+    anchor = int(last.max())
+    lead = np.where(last >= 0, anchor - last, 0)
+    steps = lead[:, None] + np.arange(1, horizon + 1)[None, :]
+    # Sum of DAMPING ** k for k = 1..steps.
+    damped_sum = DAMPING * (1 - DAMPING ** steps) / (1 - DAMPING)
+    slots = (last[:, None] + steps) % SEASON
+    forecast = (chosen_level[:, None] + damped_sum * chosen_trend[:, None]) * np.take_along_axis(
+        chosen_seasonal, slots, axis=1
+    )
+    forecast = np.maximum(forecast, 0.0)
+    forecast[(last < 0) | (lead > max_stale_months)] = np.nan
+
+    z = NormalDist().inv_cdf(0.5 + level / 2)
+    spread = z * rmse[:, None] * np.sqrt(steps)
+    lower = np.maximum(forecast - spread, 0.0)
+    upper = forecast + spread
+    return BranchForecast(trends, anchor, grid[best], rmse, rmse_basis, forecast, lower, upper)
+
+
+def parse_args() -> argparse.Namespace:
+    repo_root = Path(__file__).resolve().parents[2]
+    default_cleaned = repo_root / "Archive" / "Stories_data" / "cleaned"
+    default_output = repo_root / "reports" / "branch_sales_forecast.csv"
+
+    parser = argparse.ArgumentParser(description="Forecast monthly sales for every branch.")
+    parser.add_argument("--cleaned-dir", type=Path, default=default_cleaned, help="Path to cleaned data directory.")
+    parser.add_argument("--output", type=Path, default=default_output, help="Output CSV path.")
+    parser.add_argument("--horizon", type=int, default=6, help="Number of months to forecast.")
+    parser.add_argument("--level", type=float, default=0.95, help="Prediction interval coverage.")
+    parser.add_argument(
+        "--max-stale-months",
+        type=int,
+        default=0,
+        help="Still forecast branches whose last month is at most this many months before the latest one.",
+    )
+    parser.add_argument(
+        "--holdout-months",
+        type=int,
+        default=HOLDOUT_MONTHS,
+        help="Trailing months each branch's parameters and interval RMSE are scored on.",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    trends = build_monthly_trends(args.cleaned_dir)
+    result = forecast_branches(
+        trends,
+        horizon=args.horizon,
+        level=args.level,
+        max_stale_months=args.max_stale_months,
+        holdout=args.holdout_months,
+    )
+    rows = result.to_rows()
+    write_records(args.output, rows)
+
+    skipped = [
+        f"{trends.display_names.get(key, key)} (last {trends.period_label(int(trends.latest_index[i]))})"
+        for i, key in enumerate(trends.branches)
+        if trends.latest_index[i] >= 0 and np.isnan(result.forecast[i, 0])
+    ]
+    print(f"Forecast table: {args.output} ({len(rows)} rows)")
+    print(
+        f"Branches forecast: {len({row['branch'] for row in rows})}, horizon: {args.horizon} months "
+        f"after {trends.period_label(result.anchor)}"
+    )
+    in_sample = sorted({str(row["branch"]) for row in rows if row["rmse_basis"] == IN_SAMPLE})
+    if in_sample:
+        print(f"Too short for a holdout (scaled in-sample RMSE): {', '.join(in_sample)}")
+    if skipped:
+        print(f"Not forecast (series ends early): {', '.join(skipped)}")
+
+
+if __name__ == "__main__":
+    main()
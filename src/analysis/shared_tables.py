@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""Columnar export of the report tables into one mmap-able file that worker processes share zero-copy."""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import csv
+import json
+import mmap
+import os
+import re
+import struct
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from report_io import atomic_output, open_text_input, watch_directory
+
+MAGIC = b"SHT1"
+FORMAT_VERSION = 1
+# magic, format version, byte length of the JSON schema, offset of the first column buffer
+HEADER = struct.Struct("<4sIQQ")
+# Column buffers start on cache-line boundaries so every view is aligned for its dtype.
+ALIGN = 64
+MISSING_CODE = -1
+
+INT_RE = re.compile(r"^-?\d+$")
+FLOAT_RE = re.compile(r"^-?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$")
+
+DEFAULT_TABLES = {
+    "menu_overall": "menu_engineering_overall.csv",
+    "menu_by_branch": "menu_engineering_by_branch.csv",
+    "menu_branch_summary": "menu_engineering_branch_summary.csv",
+    "branch_kpis": "branch_kpis.csv",
+    "branch_monthly_growth": "branch_monthly_growth.csv",
+}
+
+# (device, inode): os.replace gives a refreshed file a new inode.
+FileIdentity = Tuple[int, int]
+
+
+def aligned(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def encode_column(values: Sequence[str]) -> Tuple[np.ndarray, Optional[List[str]]]:
+    """int64 when every cell is an integer, float64 (empty = NaN) when numeric, else dictionary codes."""
+    present = [value for value in values if value != ""]
+    if present and len(present) == len(values) and all(INT_RE.match(value) for value in present):
+        try:
+            return np.array([int(value) for value in values], dtype=np.int64), None
+        except OverflowError:
+            pass
+    if present and all(FLOAT_RE.match(value) for value in present):
+        return np.array([float(value) if value != "" else np.nan for value in values], dtype=np.float64), None
+    dictionary = sorted(set(present))
+    codes = {value: i for i, value in enumerate(dictionary)}
+    return np.array([codes.get(value, MISSING_CODE) for value in values], dtype=np.int32), dictionary
+
+
+def read_csv_columns(path: Path) -> Tuple[List[str], List[List[str]]]:
+    with open_text_input(path) as handle:
+        reader = csv.reader(handle)
+        header = next(reader, [])
+        columns: List[List[str]] = [[] for _ in header]
+        for row in reader:
+            for i, column in enumerate(columns):
+                column.append(row[i] if i < len(row) else "")
+    return header, columns
+
+
+def export_tables(sources: Dict[str, Path], path: Path) -> Dict[str, int]:
+    """Write every source CSV as a table of `path`; returns row counts per table.
+
+    The file is assembled next to `path` and swapped in with os.replace, so a reader
+    either maps the previous generation or the new one, never a mix.
+    """
+    tables: Dict[str, object] = {}
+    buffers: List[np.ndarray] = []
+    offset = 0
+    counts: Dict[str, int] = {}
+    for name, source in sources.items():
+        header, columns = read_csv_columns(source)
+        schema: List[Dict[str, object]] = []
+        for column_name, values in zip(header, columns):
+            array, dictionary = encode_column(values)
+            entry: Dict[str, object] = {"name": column_name, "dtype": array.dtype.str, "offset": offset}
+            if dictionary is not None:
+                entry["dictionary"] = dictionary
+            schema.append(entry)
+            buffers.append(array)
+            offset = aligned(offset + array.nbytes)
+        rows = len(columns[0]) if columns else 0
+        tables[name] = {"rows": rows, "source": source.name, "columns": schema}
+        counts[name] = rows
+
+    encoded = json.dumps({"tables": tables}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    data_start = aligned(HEADER.size + len(encoded))
+    with atomic_output(path) as tmp_path:
+        with tmp_path.open("wb") as handle:
+            handle.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(encoded), data_start))
+            handle.write(encoded)
+            position = HEADER.size + len(encoded)
+            for array in buffers:
+                start = aligned(position)
+                handle.write(b"\0" * (start - position))
+                handle.write(array.tobytes())
+                position = start + array.nbytes
+            handle.write(b"\0" * (aligned(position) - position))
+            handle.flush()
+            os.fsync(handle.fileno())
+    return counts
+
+
+class SharedTable:
+    """Read-only column views into the mapped file; string columns are dictionary codes (-1 = empty)."""
+
+    def __init__(self, name: str, rows: int, columns: Dict[str, np.ndarray], dictionaries: Dict[str, List[str]]) -> None:
+        self.name = name
+        self.rows = rows
+        self.columns = columns
+        self.dictionaries = dictionaries
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self.columns)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def code(self, name: str, value: str) -> int:
+        """Dictionary code of `value` in a string column, or -1 when it never occurs."""
+        dictionary = self.dictionaries[name]
+        i = bisect.bisect_left(dictionary, value)
+        return i if i < len(dictionary) and dictionary[i] == value else MISSING_CODE
+
+    def equals(self, name: str, value: str) -> np.ndarray:
+        """Row mask of a string column equal to `value`, compared on codes without decoding."""
+        code = self.code(name, value)
+        if code == MISSING_CODE:
+            return np.zeros(self.rows, dtype=bool)
+        return self.columns[name] == code
+
+    def strings(self, name: str, rows: Optional[np.ndarray] = None) -> List[Optional[str]]:
+        codes = self.columns[name] if rows is None else self.columns[name][rows]
+        dictionary = self.dictionaries[name]
+        return [dictionary[code] if code != MISSING_CODE else None for code in codes.tolist()]
+
+    def records(self, rows: Optional[np.ndarray] = None) -> List[Dict[str, object]]:
+        """Decoded dict rows (all rows, or the selected indices / mask)."""
+        if rows is not None and rows.dtype == bool:
+            rows = np.nonzero(rows)[0]
+        out: Dict[str, List[object]] = {}
+        for name, values in self.columns.items():
+            if name in self.dictionaries:
+                out[name] = self.strings(name, rows)
+            else:
+                selected = values if rows is None else values[rows]
+                out[name] = [None if isinstance(v, float) and v != v else v for v in selected.tolist()]
+        count = self.rows if rows is None else len(rows)
+        return [{name: out[name][i] for name in out} for i in range(count)]
+
+
+class SharedTables:
+    """Maps an exported table file read-only; every process mapping it shares the same page-cache pages.
+
+    `refresh()` remaps when the file was atomically replaced. Views handed out before a
+    refresh keep the previous generation's mapping alive until they are dropped.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.data: Optional[mmap.mmap] = None
+        self.identity: Optional[FileIdentity] = None
+        self.tables: Dict[str, SharedTable] = {}
+        self.load()
+
+    def load(self) -> None:
+        with self.path.open("rb") as handle:
+            stat = os.fstat(handle.fileno())
+            data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, schema_length, data_start = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a shared table file")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{self.path} has format version {version}, expected {FORMAT_VERSION}")
+        schema = json.loads(bytes(data[HEADER.size:HEADER.size + schema_length]).decode("utf-8"))
+
+        tables: Dict[str, SharedTable] = {}
+        for name, table in schema["tables"].items():
+            rows = int(table["rows"])
+            columns: Dict[str, np.ndarray] = {}
+            dictionaries: Dict[str, List[str]] = {}
+            for column in table["columns"]:
+                columns[column["name"]] = np.frombuffer(
+                    data, dtype=np.dtype(column["dtype"]), count=rows, offset=data_start + int(column["offset"])
+                )
+                if "dictionary" in column:
+                    dictionaries[column["name"]] = column["dictionary"]
+            tables[name] = SharedTable(name, rows, columns, dictionaries)
+
+        # The old mapping is not closed here: live views still point into it.
+        self.data = data
+        self.identity = (stat.st_dev, stat.st_ino)
+        self.tables = tables
+
+    def changed(self) -> bool:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return False
+        return (stat.st_dev, stat.st_ino) != self.identity
+
+    def refresh(self) -> bool:
+        """Remap if a new generation was swapped in; returns whether it did."""
+        if not self.changed():
+            return False
+        self.load()
+        return True
+
+    def table(self, name: str) -> SharedTable:
+        try:
+            return self.tables[name]
+        except KeyError:
+            raise KeyError(f"No table {name!r} in {self.path}; have {', '.join(sorted(self.tables))}") from None
+
+    def close(self) -> None:
+        self.tables = {}
+        if self.data is not None:
+            try:
+                self.data.close()
+            except BufferError:
+                # Callers still hold column views; the mapping goes away with them.
+                pass
+            self.data = None
+
+    def __enter__(self) -> "SharedTables":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def parse_args() -> argparse.Namespace:
+    repo_root = Path(__file__).resolve().parents[2]
+    parser = argparse.ArgumentParser(description="Export the report tables into one shared, memory-mappable file.")
+    parser.add_argument("--reports-dir", type=Path, default=repo_root / "reports", help="Directory of report CSVs.")
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=repo_root / ".cache" / "analysis_tables.bin",
+        help="Table file (put it under /dev/shm to keep it in RAM without a disk copy).",
+    )
+    parser.add_argument("--show", action="store_true", help="Print the schema of an existing file instead of exporting.")
+    parser.add_argument("--watch", action="store_true", help="Re-export whenever a source report changes.")
+    return parser.parse_args()
+
+
+def show(path: Path) -> None:
+    with SharedTables(path) as shared:
+        print(f"{path} ({path.stat().st_size} bytes)")
+        for name, table in shared.tables.items():
+            kinds = ", ".join(
+                f"{column}:{'str' if column in table.dictionaries else values.dtype.name}"
+                for column, values in table.columns.items()
+            )
+            print(f"  - {name}: {table.rows} rows [{kinds}]")
+
+
+def main() -> None:
+    args = parse_args()
+    if args.show:
+        show(args.output)
+        return
+
+    sources = {name: args.reports_dir / filename for name, filename in DEFAULT_TABLES.items()}
+    missing = [str(path) for path in sources.values() if not path.exists()]
+    if missing:
+        raise SystemExit(f"Missing report tables: {', '.join(missing)}")
+
+    def refresh(_: Set[str]) -> None:
+        counts = export_tables(sources, args.output)
+        print(f"Shared tables: {args.output} ({args.output.stat().st_size} bytes)")
+        for name, rows in counts.items():
+            print(f"  - {name}: {rows} rows")
+
+    if args.watch:
+        watch_directory(args.reports_dir, refresh, names=DEFAULT_TABLES.values())
+    else:
+        refresh(set())
+
+
+if __name__ == "__main__":
+    main()